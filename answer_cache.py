@@ -0,0 +1,510 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# Semantic answer cache.
+# Users ask the same policy questions in slightly different words ("How is QMB eligibility
+# determined?" vs "how is eligibility of QMB determined"). Each final answer is stored next to
+# the embedding of its question, and a later question whose embedding is within the cosine
+# threshold is answered from the cache instead of another gpt-4 call.
+# Entries are tagged with the version of the `medicaid_app` collection they were answered
+# from, so re-ingesting the collection invalidates them.
+# ada-002 puts most questions about this manual close together, so "QMB" and "SLMB" versions of
+# one question can clear even a high threshold. A hit is only served when both questions name the
+# same document codes and program acronyms (key_terms).
+
+# Program acronyms matched whatever their case; other acronyms count when written in capitals
+PROGRAM_ACRONYMS = {"QMB", "SLMB", "QI", "QI-1", "QDWI", "SSI", "MSP", "LTC", "TANF", "SNAP", "CHIP", "LACHIP",
+                    "MPP", "PACE", "ADHC", "HCBS", "ABD", "MAGI", "SSA", "SSDI", "LIS"}
+_ACRONYM_PATTERN = re.compile(r"\b[A-Za-z]{2,6}(?:-\d)?\b")
+# The system prompt's wording for a question the context doesn't answer. Such replies aren't cached:
+# a rephrasing, or the same question after re-ingesting, may well retrieve context that does answer it
+NO_ANSWER_PHRASE = "cannot answer based on the provided information"
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    embedding: np.ndarray
+    answer: str
+    source_urls: List[str]
+    collection_version: str = ""
+    created_at: float = field(default_factory=time.time)
+    last_hit_at: float = field(default_factory=time.time)
+    entry_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+
+def key_terms(question: str) -> frozenset:
+    """The document codes and program acronyms a question names, e.g. {"I-1630", "QMB"}."""
+    from search_filters import detect_document_codes
+
+    acronyms = {m.group(0).upper() for m in _ACRONYM_PATTERN.finditer(question)
+                if m.group(0).isupper() or m.group(0).upper() in PROGRAM_ACRONYMS}
+    return frozenset(detect_document_codes(question)) | frozenset(acronyms)
+
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class InMemoryCacheBackend:
+    """
+    Keeps entries in a dict and their normalized embeddings in the first rows of one matrix,
+    which doubles in capacity as it fills so an insert doesn't copy every row.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._ids: List[str] = []
+        self._rows = {}
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def _rebuild_matrix(self):
+        ids = list(self._entries)
+        self._ids, self._rows, self._matrix = [], {}, None
+        if ids:
+            # After a switch to another embedding only entries of the newest size can be searched;
+            # the others go once the collection version change catches up with them
+            newest = max(self._entries.values(), key=lambda e: e.created_at)
+            for entry_id in ids:
+                if len(self._entries[entry_id].embedding) == len(newest.embedding):
+                    self._append_row(entry_id)
+
+    def _append_row(self, entry_id: str) -> None:
+        embedding = self._entries[entry_id].embedding
+        if self._matrix is None:
+            self._matrix = np.empty((16, len(embedding)), dtype=np.float32)
+        elif len(self._ids) == len(self._matrix):
+            grown = np.empty((2 * len(self._matrix), self._matrix.shape[1]), dtype=np.float32)
+            grown[:len(self._ids)] = self._matrix
+            self._matrix = grown
+        self._rows[entry_id] = len(self._ids)
+        self._matrix[len(self._ids)] = embedding
+        self._ids.append(entry_id)
+
+    def _remove_row(self, entry_id: str) -> None:
+        row = self._rows.pop(entry_id, None)
+        if row is None:
+            return
+        # The last row moves into the gap
+        last_id = self._ids.pop()
+        if last_id != entry_id:
+            self._matrix[row] = self._matrix[len(self._ids)]
+            self._ids[row] = last_id
+            self._rows[last_id] = row
+
+    def best_match(self, embedding: np.ndarray) -> Optional[Tuple[CacheEntry, float]]:
+        with self._lock:
+            # Entries embedded with another model (until the version change clears them) can't match
+            if not self._ids or self._matrix.shape[1] != len(embedding):
+                return None
+            scores = self._matrix[:len(self._ids)] @ embedding
+            best = int(np.argmax(scores))
+            return self._entries[self._ids[best]], float(scores[best])
+
+    def put(self, entry: CacheEntry) -> None:
+        with self._lock:
+            self._remove_row(entry.entry_id)
+            self._entries[entry.entry_id] = entry
+            if self._matrix is not None and self._matrix.shape[1] != len(entry.embedding):
+                # The first entry under another embedding: from now on only those are searched
+                self._rebuild_matrix()
+            else:
+                self._append_row(entry.entry_id)
+
+    def touch(self, entry_id: str, timestamp: float) -> None:
+        with self._lock:
+            if entry_id in self._entries:
+                self._entries[entry_id].last_hit_at = timestamp
+
+    def delete(self, entry_ids: List[str]) -> None:
+        with self._lock:
+            for entry_id in entry_ids:
+                self._entries.pop(entry_id, None)
+                self._remove_row(entry_id)
+
+    def list_entries(self) -> List[CacheEntry]:
+        with self._lock:
+            return list(self._entries.values())
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteCacheBackend(InMemoryCacheBackend):
+    """Persists entries to a SQLite file; lookups run against an in-memory copy of the embeddings."""
+
+    def __init__(self, db_path: str):
+        super().__init__()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                entry_id TEXT PRIMARY KEY,
+                question TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                source_urls TEXT NOT NULL,
+                collection_version TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_hit_at REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        for row in self._conn.execute("SELECT * FROM answer_cache"):
+            entry = CacheEntry(
+                entry_id=row[0], question=row[1],
+                embedding=np.frombuffer(row[2], dtype=np.float32),
+                answer=row[3], source_urls=json.loads(row[4]),
+                collection_version=row[5], created_at=row[6], last_hit_at=row[7],
+            )
+            self._entries[entry.entry_id] = entry
+        self._rebuild_matrix()
+
+    def put(self, entry: CacheEntry) -> None:
+        super().put(entry)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answer_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (entry.entry_id, entry.question, entry.embedding.astype(np.float32).tobytes(),
+                 entry.answer, json.dumps(entry.source_urls), entry.collection_version,
+                 entry.created_at, entry.last_hit_at),
+            )
+            self._conn.commit()
+
+    def touch(self, entry_id: str, timestamp: float) -> None:
+        super().touch(entry_id, timestamp)
+        with self._lock:
+            self._conn.execute("UPDATE answer_cache SET last_hit_at = ? WHERE entry_id = ?", (timestamp, entry_id))
+            self._conn.commit()
+
+    def delete(self, entry_ids: List[str]) -> None:
+        super().delete(entry_ids)
+        with self._lock:
+            self._conn.executemany("DELETE FROM answer_cache WHERE entry_id = ?", [(i,) for i in entry_ids])
+            self._conn.commit()
+
+
+class QdrantCacheBackend:
+    """Stores entries as points in a Qdrant collection, e.g. a local `QdrantClient(path=...)`."""
+
+    def __init__(self, qdrant_client, collection_name: str = "answer_cache"):
+        self.client = qdrant_client
+        self.collection_name = collection_name
+        self._collection_ready = self.client.collection_exists(collection_name)
+        self._dim = self.client.get_collection(collection_name).config.params.vectors.size \
+            if self._collection_ready else None
+
+    def _ensure_collection(self, dim: int) -> None:
+        from qdrant_client.models import Distance, VectorParams
+
+        if self._collection_ready and self._dim != dim:
+            # Answers cached under another embedding can never match again
+            self.client.delete_collection(self.collection_name)
+            self._collection_ready = False
+        if not self._collection_ready:
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+            )
+            self._collection_ready = True
+            self._dim = dim
+
+    @staticmethod
+    def _to_entry(point) -> CacheEntry:
+        payload = point.payload
+        return CacheEntry(
+            entry_id=str(point.id), question=payload["question"],
+            embedding=None,
+            answer=payload["answer"], source_urls=payload["source_urls"],
+            collection_version=payload["collection_version"],
+            created_at=payload["created_at"], last_hit_at=payload["last_hit_at"],
+        )
+
+    def best_match(self, embedding: np.ndarray) -> Optional[Tuple[CacheEntry, float]]:
+        if not self._collection_ready or self._dim != len(embedding):
+            return None
+        results = self.client.query_points(
+            collection_name=self.collection_name,
+            query=embedding.tolist(),
+            limit=1,
+            with_payload=True,
+        ).points
+        if not results:
+            return None
+        return self._to_entry(results[0]), float(results[0].score)
+
+    def put(self, entry: CacheEntry) -> None:
+        from qdrant_client.models import PointStruct
+
+        self._ensure_collection(len(entry.embedding))
+        self.client.upsert(
+            collection_name=self.collection_name,
+            points=[PointStruct(
+                id=str(uuid.UUID(entry.entry_id)),
+                vector=entry.embedding.tolist(),
+                payload={
+                    "question": entry.question, "answer": entry.answer,
+                    "source_urls": entry.source_urls, "collection_version": entry.collection_version,
+                    "created_at": entry.created_at, "last_hit_at": entry.last_hit_at,
+                },
+            )],
+        )
+
+    def touch(self, entry_id: str, timestamp: float) -> None:
+        self.client.set_payload(
+            collection_name=self.collection_name,
+            payload={"last_hit_at": timestamp},
+            points=[entry_id],
+        )
+
+    def delete(self, entry_ids: List[str]) -> None:
+        from qdrant_client.models import PointIdsList
+
+        if entry_ids and self._collection_ready:
+            self.client.delete(collection_name=self.collection_name, points_selector=PointIdsList(points=entry_ids))
+
+    def list_entries(self) -> List[CacheEntry]:
+        if not self._collection_ready:
+            return []
+        entries, offset = [], None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name, limit=256, offset=offset, with_payload=True,
+            )
+            entries.extend(self._to_entry(p) for p in points)
+            if offset is None:
+                return entries
+
+    def count(self) -> int:
+        if not self._collection_ready:
+            return 0
+        return self.client.count(collection_name=self.collection_name, exact=True).count
+
+
+class SemanticAnswerCache:
+    """
+    Serves a cached final answer when a new question's embedding is within `threshold`
+    cosine similarity of a previously answered one that names the same key terms.
+    """
+
+    def __init__(self, backend=None, threshold: float = 0.97, max_entries: int = 1000,
+                 ttl_seconds: Optional[float] = 7 * 24 * 3600,
+                 version_provider: Optional[Callable[[], str]] = None, version_refresh_seconds: float = 60.0):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1].")
+        self.backend = backend if backend is not None else InMemoryCacheBackend()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.version_provider = version_provider
+        self.version_refresh_seconds = version_refresh_seconds
+        self.collection_version = ""
+        self._version_checked_at = 0.0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Kept up to date by store() and the deletes made here, so neither needs to list the backend
+        self.entries = self.backend.count()
+
+    def _refresh_version(self) -> None:
+        """Re-reads the collection version at most every `version_refresh_seconds`."""
+        if self.version_provider is None:
+            return
+        now = time.time()
+        if now - self._version_checked_at < self.version_refresh_seconds:
+            return
+        self._version_checked_at = now
+        try:
+            version = self.version_provider()
+        except Exception as e:
+            print(f"Could not read collection version for the answer cache: {e}")
+            return
+        self.set_collection_version(version)
+
+    def set_collection_version(self, version: str) -> None:
+        """Drops every entry answered from a different collection version."""
+        if version == self.collection_version:
+            return
+        self.collection_version = version
+        stale = [e.entry_id for e in self.backend.list_entries() if e.collection_version != version]
+        if stale:
+            print(f"Answer cache: collection version changed to '{version}', invalidating {len(stale)} entries.")
+            self._delete(stale)
+
+    def _delete(self, entry_ids: List[str]) -> None:
+        self.backend.delete(entry_ids)
+        with self._lock:
+            self.entries = max(self.entries - len(entry_ids), 0)
+
+    def _is_expired(self, entry: CacheEntry, now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry.created_at > self.ttl_seconds
+
+    def lookup(self, embedding, question: Optional[str] = None) -> Optional[CacheEntry]:
+        """
+        Returns the closest cached entry if it clears the threshold, else None. With `question`,
+        an entry whose question names other document codes or program acronyms is not served.
+        """
+        self._refresh_version()
+        now = time.time()
+        embedding = _normalize(embedding)
+        match = self.backend.best_match(embedding)
+        # A stale best match is dropped and the next closest entry considered in its place
+        while match is not None and (self._is_expired(match[0], now)
+                                     or match[0].collection_version != self.collection_version):
+            self._delete([match[0].entry_id])
+            match = self.backend.best_match(embedding)
+        entry = None
+        if match is not None:
+            candidate, score = match
+            if score >= self.threshold and (question is None or key_terms(question) == key_terms(candidate.question)):
+                entry = candidate
+                self.backend.touch(entry.entry_id, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def store(self, question: str, embedding, answer: str, source_urls: List[str]) -> None:
+        """
+        Caches a final answer; past max_entries, evicts expired / least recently used entries.
+        Replies saying the context didn't answer the question are not cached.
+        """
+        if NO_ANSWER_PHRASE in answer.lower():
+            return
+        self.backend.put(CacheEntry(
+            question=question,
+            embedding=_normalize(embedding),
+            answer=answer,
+            source_urls=list(source_urls),
+            collection_version=self.collection_version,
+        ))
+        with self._lock:
+            self.entries += 1
+            over_capacity = self.entries > self.max_entries
+        if over_capacity:
+            self._evict()
+
+    def _evict(self) -> None:
+        now = time.time()
+        entries = self.backend.list_entries()
+        doomed = [e.entry_id for e in entries if self._is_expired(e, now)]
+        live = [e for e in entries if not self._is_expired(e, now)]
+        if len(live) > self.max_entries:
+            live.sort(key=lambda e: e.last_hit_at)
+            doomed.extend(e.entry_id for e in live[:len(live) - self.max_entries])
+        if doomed:
+            self.backend.delete(doomed)
+        with self._lock:
+            # Re-synced with the backend while it has just been listed anyway
+            self.entries = len(entries) - len(doomed)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": self.entries,
+        }
+
+
+def compute_collection_version(qdrant_client, collection_name: str) -> str:
+    """
+    Identifies the current contents of a collection by its point count and a digest of its point ids.
+    Ingest derives point ids from chunk content, so an incremental update that replaces chunks
+    changes the version even when the point count stays the same. A rebuild with another embedding
+    keeps the ids, so the recorded embedding is part of the version too.
+    This scrolls every point id; ingest runs it once and records the result (record_collection_version).
+    """
+    from embedding_providers import recorded_embedding
+
+    info = qdrant_client.get_collection(collection_name)
+    point_ids, offset = [], None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name, limit=10000, offset=offset, with_payload=False, with_vectors=False,
+        )
+        point_ids.extend(str(point.id) for point in points)
+        if offset is None:
+            break
+    digest = hashlib.sha1("\n".join(sorted(point_ids)).encode("utf-8")).hexdigest()[:12]
+    embedding = recorded_embedding(qdrant_client, collection_name)
+    # Collections built before embeddings were recorded keep their old version string
+    suffix = f":{embedding.cache_key}" if embedding else ""
+    return f"{collection_name}:{info.points_count}:{digest}{suffix}"
+
+
+def record_collection_version(qdrant_client, collection_name: str) -> str:
+    """Computes the version of `collection_name` (a real collection, not an alias) and records it; returns it."""
+    from embedding_providers import record_collection_metadata
+
+    version = compute_collection_version(qdrant_client, collection_name)
+    record_collection_metadata(qdrant_client, collection_name, version=version, versioned_at=time.time())
+    return version
+
+
+def get_collection_version(qdrant_client, collection_name: str) -> str:
+    """
+    The version ingest recorded for a collection or the collection an alias points at: two small
+    reads, cheap enough for the request path. Collections ingested before versions were recorded
+    get one from the alias target and point count instead, until the next ingest records one.
+    """
+    from collection_aliases import live_collection
+    from embedding_providers import collection_metadata
+
+    version = collection_metadata(qdrant_client, collection_name).get("version")
+    if version:
+        return version
+    target = live_collection(qdrant_client, collection_name) or collection_name
+    return f"{target}:{qdrant_client.get_collection(target).points_count}"
+
+
+def build_backend(kind: str = "memory", path: str = None, qdrant_client=None):
+    """Builds a cache backend by name: 'memory', 'sqlite' (file at `path`) or 'qdrant' (local dir at `path`)."""
+    if kind == "memory":
+        return InMemoryCacheBackend()
+    if kind == "sqlite":
+        return SQLiteCacheBackend(path or "answer_cache.sqlite3")
+    if kind == "qdrant":
+        if qdrant_client is None:
+            from qdrant_client import QdrantClient
+            qdrant_client = QdrantClient(path=path or "./answer_cache_qdrant")
+        return QdrantCacheBackend(qdrant_client)
+    raise ValueError(f"Unknown answer cache backend: '{kind}'. Use 'memory', 'sqlite' or 'qdrant'.")
+
+
+# Defaults for the shared cache used by the query handlers, overridable from the environment
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "memory")
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.97"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+
+def get_shared_cache(qdrant_client, collection_name: str) -> SemanticAnswerCache:
+    """Returns the process-wide answer cache for a collection, versioned by that collection's contents."""
+    import resource_registry
+
+    key = ("answer_cache", collection_name, id(qdrant_client))
+    return resource_registry.get_or_create(key, lambda: SemanticAnswerCache(
+        backend=build_backend(ANSWER_CACHE_BACKEND, ANSWER_CACHE_PATH),
+        threshold=ANSWER_CACHE_THRESHOLD,
+        max_entries=ANSWER_CACHE_MAX_ENTRIES,
+        ttl_seconds=ANSWER_CACHE_TTL_SECONDS,
+        version_provider=lambda: get_collection_version(qdrant_client, collection_name),
+    ))
@@ -6,9 +6,19 @@ import rag_handler_langchain
 QDRANT_URL = st.secrets["QDRANT_URL"]
 QDRANT_API_KEY = st.secrets["QDRANT_API_KEY"]
 OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
+# Optional: talk to Qdrant over gRPC instead of REST
+QDRANT_PREFER_GRPC = bool(st.secrets.get("QDRANT_PREFER_GRPC", False))
+
+# Build the Qdrant / OpenAI clients once per process. st.cache_resource shares them
+# across all Streamlit sessions instead of reconnecting on every question.
+@st.cache_resource
+def warm_up_clients(qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc):
+    rag_handler_langchain.warm_up(qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc=prefer_grpc)
+    return True
 
 # --- Streamlit UI ---
 st.set_page_config(page_title="Medicaid Policy Q&A", layout="wide")
+warm_up_clients(QDRANT_URL, QDRANT_API_KEY, OPENAI_API_KEY, QDRANT_PREFER_GRPC)
 st.title("Louisiana Medicaid Policy Q&A App")
 
 st.markdown("""
@@ -28,16 +38,21 @@ with st.form(key="question_form"):
 # The logic is now executed only when the form's submit button is clicked
 if submit_button:
     if question:
-        with st.spinner("Searching documents and generating answer..."):
-            # Pass the secrets to the handler function
-            answer = rag_handler_langchain.get_final_answer(
-                question,
-                QDRANT_URL,
-                QDRANT_API_KEY,
-                OPENAI_API_KEY
-            )
         st.success("Answer:")
-        st.markdown(answer) # Use markdown to render formatted text
+        timings = {}
+        # Render the answer incrementally as tokens arrive instead of waiting for the full completion
+        st.write_stream(rag_handler_langchain.stream_final_answer(
+            question,
+            QDRANT_URL,
+            QDRANT_API_KEY,
+            OPENAI_API_KEY,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            timings=timings
+        ))
+        st.caption(
+            f"First token after {timings.get('time_to_first_token', 0.0):.2f}s, "
+            f"full answer after {timings.get('total_time', 0.0):.2f}s"
+        )
     else:
         st.warning("Please enter a question.")
         
@@ -47,4 +62,17 @@ st.markdown("""
 *   How is eligibility of QMB determined?
 *   Tell me about continued medicaid
 *   How to establish non-financial eligibility for QI program?
-""")
\ No newline at end of file
+""")
+
+# Answer cache hit rate for this server process
+cache_stats = rag_handler_langchain.get_answer_cache(QDRANT_URL, QDRANT_API_KEY, prefer_grpc=QDRANT_PREFER_GRPC).stats()
+st.sidebar.caption(
+    f"Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+    f"({cache_stats['hit_rate']:.0%} hit rate, {cache_stats['entries']} cached answers)"
+)
+# Off-topic questions answered with suggested documents instead of a gpt-4 call
+gate_stats = rag_handler_langchain.get_relevance_gate().stats()
+st.sidebar.caption(
+    f"Relevance gate: {gate_stats['llm_calls_avoided']} of {gate_stats['checked']} LLM calls avoided "
+    f"({gate_stats['avoided_rate']:.0%})"
+)
\ No newline at end of file
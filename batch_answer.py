@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Dict, List
+
+from qdrant_client.models import QueryRequest
+
+# Process-wide registry of long-lived Qdrant / OpenAI clients
+import resource_registry
+# Semantic cache of final answers for near-duplicate questions
+import answer_cache
+# Exact-match cache of question embeddings
+import embedding_cache
+# Prompt, context and answer formatting shared with the single-question handlers
+import rag_handler
+# Search params matching how the collection was built (quantization, HNSW ef)
+import collection_profiles
+# Filters on structured chunk metadata, e.g. the documents a question names
+import search_filters
+# The embedding (model and dimensions) each collection was built with
+import embedding_providers
+# Over-fetch, rerank locally and send fewer, more distinct chunks
+import reranking
+# Skips the LLM for questions nothing in the collection is relevant to
+import relevance_gate
+from rag_async import generate_rag_answer_async, _run_stage
+
+# Batch question answering.
+# Running hundreds of questions through get_final_answer one at a time costs one embeddings
+# call, one search and one completion per question, strictly in sequence. Here each batch of
+# questions is embedded in a single embeddings request and searched with a single Qdrant
+# batch query, and the completions run concurrently up to `max_concurrency` at a time.
+# Retrieval runs ahead in its own task: the next batch is embedded and searched while the
+# current one is generating.
+#
+# CLI usage (input lines look like {"id": "q1", "question": "..."}; "id" is optional):
+#   python batch_answer.py questions.jsonl answers.jsonl --resume
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_CONCURRENCY = 8
+# Retrieved batches waiting for generation; bounds how far retrieval runs ahead
+RETRIEVAL_PREFETCH_BATCHES = 1
+
+
+async def _embed_batch(questions: List[str], openai_client, provider=None) -> List[List[float]]:
+    """
+    Embeds all questions with one call to `provider` (EMBEDDING if not given), skipping those
+    already in the query embedding cache. The cache is SQLite, so it is used off the event loop.
+    """
+    provider = provider or embedding_providers.get_embedding()
+    cache = embedding_cache.get_shared_cache()
+    vectors = await asyncio.to_thread(lambda: [cache.get(q, provider.cache_key) for q in questions])
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        embedded = await provider.aembed([questions[i] for i in missing], openai_client)
+        for i, vector in zip(missing, embedded):
+            vectors[i] = vector
+
+        def store():
+            for i in missing:
+                cache.put(questions[i], provider.cache_key, vectors[i])
+
+        await asyncio.to_thread(store)
+    return vectors
+
+
+async def _search_batch(vectors: List[List[float]], qdrant_client, limit: int = reranking.RERANK_MAX_K,
+                        search_params=None, questions: List[str] = None):
+    """
+    Runs every search of the batch in one Qdrant request, each restricted to the documents its
+    question names; questions whose filter matched nothing are searched again unfiltered, together.
+    """
+    filters = [search_filters.filter_for_question(q) for q in questions] if questions else [None] * len(vectors)
+
+    async def search(indexes, filtered):
+        responses = await qdrant_client.query_batch_points(
+            collection_name=rag_handler.COLLECTION_NAME,
+            requests=[QueryRequest(query=vectors[i], filter=filters[i].to_qdrant() if filtered and filters[i] else None,
+                                   limit=limit, params=search_params, with_payload=True) for i in indexes],
+        )
+        return [r.points for r in responses]
+
+    results = await search(range(len(vectors)), True)
+    retry = [i for i, points in enumerate(results) if not points and filters[i] is not None]
+    if retry:
+        for i, points in zip(retry, await search(retry, False)):
+            results[i] = points
+    return results
+
+
+async def answer_many_async(questions: List[Dict], qdrant_url: str, qdrant_api_key: str, openai_api_key: str,
+                            prefer_grpc: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+                            max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                            use_answer_cache: bool = False, timeouts: Dict[str, float] = None) -> AsyncIterator[Dict]:
+    """
+    Answers `questions` (dicts with "id" and "question") and yields one result dict per question
+    as soon as its answer is ready, so results arrive out of input order.
+    The answer cache is off by default so QA runs always see fresh answers.
+    Each completion runs under rag_async's 'generate' stage timeout (`timeouts` overrides it);
+    a question that runs over gets an error row.
+    """
+    timeouts = timeouts or {}
+    openai_client = resource_registry.get_async_openai_client(openai_api_key)
+    qdrant_client = resource_registry.get_async_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+    sync_qdrant_client = resource_registry.get_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+    search_params = await asyncio.to_thread(collection_profiles.get_search_params, sync_qdrant_client,
+                                            rag_handler.COLLECTION_NAME)
+    provider = await asyncio.to_thread(embedding_providers.get_query_embedding, sync_qdrant_client,
+                                       rag_handler.COLLECTION_NAME)
+    reranker = reranking.get_reranker()
+    gate = relevance_gate.get_shared_gate()
+    cache = None
+    if use_answer_cache:
+        cache = answer_cache.get_shared_cache(sync_qdrant_client, rag_handler.COLLECTION_NAME)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def answer_one(item: Dict, query_vector: List[float], search_results) -> Dict:
+        question = item["question"]
+        start = time.perf_counter()
+        result = {"id": item["id"], "question": question, "answer": None, "sources": [], "error": None,
+                  "early_exit": False}
+        try:
+            cached = await asyncio.to_thread(cache.lookup, query_vector, question) if cache is not None else None
+            if cached is not None:
+                result["answer"], result["sources"] = cached.answer, cached.source_urls
+            elif not search_results:
+                result["answer"] = "Could not find any relevant documents in the database to answer the question."
+            elif not gate.should_answer(relevance_gate.relevance(search_results), provider.cache_key):
+                # The canned response carries its own suggested documents
+                result["answer"] = relevance_gate.early_exit_answer(rag_handler.suggested_urls(search_results))
+                result["early_exit"] = True
+            else:
+                if reranker is not None:
+                    search_results = await asyncio.to_thread(reranking.rerank_points, question, search_results,
+                                                             reranker)
+                context_str, unique_urls = rag_handler.build_context(search_results)
+                async with semaphore:
+                    answer = await _run_stage("generate",
+                                              generate_rag_answer_async(question, context_str, openai_client),
+                                              timeouts)
+                result["answer"], result["sources"] = answer, unique_urls
+                if cache is not None:
+                    await asyncio.to_thread(cache.store, question, query_vector, answer, unique_urls)
+        except Exception as e:
+            result["error"] = str(e)
+        result["elapsed_seconds"] = round(time.perf_counter() - start, 3)
+        return result
+
+    async def retrieve(batch: List[Dict]):
+        batch_questions = [item["question"] for item in batch]
+        vectors = await _embed_batch(batch_questions, openai_client, provider)
+        search_results = await _search_batch(vectors, qdrant_client, limit=reranking.fetch_limit(reranker),
+                                             search_params=search_params, questions=batch_questions)
+        return vectors, search_results
+
+    # Bounded, so retrieval stays at most RETRIEVAL_PREFETCH_BATCHES ahead of generation
+    retrieved = asyncio.Queue(maxsize=RETRIEVAL_PREFETCH_BATCHES)
+
+    async def produce():
+        for batch_start in range(0, len(questions), batch_size):
+            batch = questions[batch_start:batch_start + batch_size]
+            try:
+                await retrieved.put((batch, await retrieve(batch), None))
+            except Exception as e:
+                await retrieved.put((batch, None, e))
+        await retrieved.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    tasks = []
+    try:
+        while True:
+            entry = await retrieved.get()
+            if entry is None:
+                break
+            batch, retrieval, error = entry
+            if error is not None:
+                # The whole batch failed before generation; report every question in it
+                for item in batch:
+                    yield {"id": item["id"], "question": item["question"], "answer": None, "sources": [],
+                           "error": f"Batch retrieval failed: {error}", "early_exit": False, "elapsed_seconds": 0.0}
+                continue
+
+            vectors, search_results = retrieval
+            tasks = [asyncio.ensure_future(answer_one(item, vector, results))
+                     for item, vector, results in zip(batch, vectors, search_results)]
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+    finally:
+        # The caller may stop iterating early
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
+
+
+def answer_many(questions: List[str], qdrant_url: str, qdrant_api_key: str, openai_api_key: str,
+                **kwargs) -> List[str]:
+    """Answers a list of questions and returns the formatted answers in input order."""
+    items = [{"id": i, "question": q} for i, q in enumerate(questions)]
+
+    async def collect():
+        return [r async for r in answer_many_async(items, qdrant_url, qdrant_api_key, openai_api_key, **kwargs)]
+
+    answers = [None] * len(questions)
+    for result in asyncio.run(collect()):
+        if result["error"]:
+            answers[result["id"]] = f"An error occurred while processing your request: {result['error']}"
+        elif result["sources"]:
+            answers[result["id"]] = rag_handler.format_answer(result["answer"], result["sources"])
+        else:
+            answers[result["id"]] = result["answer"]
+    return answers
+
+
+def _read_questions(path: str) -> List[Dict]:
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            questions.append({"id": record.get("id", line_number), "question": record["question"]})
+    return questions
+
+
+def _keep_completed(path: str) -> set:
+    """
+    Rewrites an existing output file down to the rows answered without error, one per id, and
+    returns their ids. Rows of failed questions are dropped, since those questions run again
+    and append a row of their own.
+    """
+    if not os.path.exists(path):
+        return set()
+    kept: Dict = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if not record.get("error"):
+                kept.setdefault(record["id"], line if line.endswith("\n") else line + "\n")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(kept.values())
+    os.replace(tmp_path, path)
+    return set(kept)
+
+
+async def _run_cli(args) -> None:
+    questions = _read_questions(args.input)
+    if args.resume:
+        done = _keep_completed(args.output)
+        questions = [q for q in questions if q["id"] not in done]
+        print(f"Resuming: {len(done)} questions already answered, {len(questions)} remaining.")
+    else:
+        open(args.output, "w").close()
+
+    start = time.perf_counter()
+    answered = errors = early_exits = 0
+    with open(args.output, "a", encoding="utf-8") as out:
+        async for result in answer_many_async(
+            questions, args.qdrant_url, args.qdrant_api_key, args.openai_api_key,
+            prefer_grpc=args.prefer_grpc, batch_size=args.batch_size,
+            max_concurrency=args.max_concurrency, use_answer_cache=args.use_answer_cache,
+        ):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            answered += 1
+            errors += bool(result["error"])
+            early_exits += result["early_exit"]
+            if answered % 25 == 0:
+                rate = answered / (time.perf_counter() - start) * 60
+                print(f"{answered}/{len(questions)} answered ({rate:.1f} questions/minute)")
+
+    elapsed = time.perf_counter() - start
+    rate = answered / elapsed * 60 if elapsed else 0.0
+    print(f"Finished {answered} questions ({errors} errors, {early_exits} LLM calls avoided by the relevance gate) "
+          f"in {elapsed:.1f}s: {rate:.1f} questions/minute.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions and write answers as JSONL.")
+    parser.add_argument("input", help="JSONL file with one {\"id\": ..., \"question\": ...} per line")
+    parser.add_argument("output", help="JSONL file the answers are appended to")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip questions already answered in the output file and replace the rows of failed ones")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--use-answer-cache", action="store_true")
+    parser.add_argument("--prefer-grpc", action="store_true")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL"))
+    parser.add_argument("--qdrant-api-key", default=os.getenv("QDRANT_API_KEY"))
+    parser.add_argument("--openai-api-key", default=os.getenv("OPENAI_API_KEY"))
+    args = parser.parse_args()
+
+    if not all([args.qdrant_url, args.openai_api_key]):
+        print("ERROR: Set QDRANT_URL, QDRANT_API_KEY and OPENAI_API_KEY (or pass them as options).")
+        return
+    asyncio.run(_run_cli(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Concurrency benchmark: N questions answered by the synchronous handler one after another
+versus all in flight at once through rag_async.get_final_answer_async on one event loop.
+
+Runs against the local OpenAI / Qdrant stubs with `--latency-ms` per request and
+`--generation-ms` extra for each completion.
+
+    python -m benchmarks.bench_async_concurrency --questions 50 --latency-ms 50 --generation-ms 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from benchmarks.stub_servers import start_openai_stub, start_qdrant_stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--generation-ms", type=float, default=500.0)
+    args = parser.parse_args()
+
+    openai_server, openai_url = start_openai_stub(latency=args.latency_ms / 1000,
+                                                  generation_delay=args.generation_ms / 1000)
+    qdrant_server, qdrant_url = start_qdrant_stub(latency=args.latency_ms / 1000)
+    os.environ["OPENAI_BASE_URL"] = openai_url
+
+    import rag_async
+    import rag_handler
+
+    # Distinct questions so neither the embedding cache nor the answer cache short-circuits anything
+    questions = [f"How is eligibility of QMB determined for household {i}?" for i in range(args.questions)]
+    results = {}
+
+    start = time.perf_counter()
+    for question in questions[: max(1, args.questions // 5)]:
+        rag_handler.get_final_answer(question + " (sync)", qdrant_url, None, "sk-stub", use_answer_cache=False)
+    sync_elapsed = time.perf_counter() - start
+    sync_count = max(1, args.questions // 5)
+    results["sync_sequential"] = {
+        "questions": sync_count,
+        "wall_seconds": round(sync_elapsed, 3),
+        "questions_per_second": round(sync_count / sync_elapsed, 2),
+    }
+
+    async def run_all():
+        return await asyncio.gather(*[
+            rag_async.get_final_answer_async(q, qdrant_url, None, "sk-stub", use_answer_cache=False)
+            for q in questions
+        ])
+
+    start = time.perf_counter()
+    answers = asyncio.run(run_all())
+    async_elapsed = time.perf_counter() - start
+    failures = [a for a in answers if a.startswith(("An error occurred", "The request timed out"))]
+    results["async_concurrent"] = {
+        "questions": args.questions,
+        "wall_seconds": round(async_elapsed, 3),
+        "questions_per_second": round(args.questions / async_elapsed, 2),
+        "failures": len(failures),
+    }
+
+    print(json.dumps({"latency_ms": args.latency_ms, "generation_ms": args.generation_ms, "results": results},
+                     indent=2))
+    openai_server.shutdown()
+    qdrant_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Steps 2-5 of PDFChunkerForQdrant (section split, consolidation, Document creation) on synthetic
+converted manuals of several thousand pages: the span-based chunker against the string-based one
+it replaced, which built every chunk with += and "".join over per-page dicts.
+
+Both must produce identical Documents. Times are the best of --repeats runs; peak_alloc_mb is the
+peak extra memory tracemalloc saw while chunking (steps 2-4, before any Document exists).
+
+    python -m benchmarks.bench_chunker --pages 1000 4000 8000 --max-chars 5000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import time
+import tracemalloc
+from typing import Dict, List
+
+from langchain_core.documents import Document
+
+from benchmarks.pdf_corpus import make_markdown_pages
+from pdf_chunker import PDFChunkerForQdrant
+
+
+class StringChunker(PDFChunkerForQdrant):
+    """Steps 2-5 as they were before chunks became spans, kept here as the baseline."""
+
+    def _create_initial_chunks(self, pages: List[Document]) -> List[Dict]:
+        file_name = pages[0].metadata['file_name']
+        prefix = os.path.splitext(file_name)[0][:2]
+        header_pattern = re.compile(rf"^\s*(\*\*{re.escape(prefix)}[^\*]+\*\*)\s*$", re.MULTILINE)
+
+        sections = []
+        current_section_pages = []
+
+        for page in pages:
+            page_num = page.metadata.get('page', 0)
+            content = page.page_content
+            headers_on_page = list(header_pattern.finditer(content))
+
+            if not headers_on_page:
+                current_section_pages.append({'num': page_num, 'content': content})
+            else:
+                last_pos = 0
+                for match in headers_on_page:
+                    pre_header_content = content[last_pos:match.start()]
+                    if pre_header_content.strip():
+                        current_section_pages.append({'num': page_num, 'content': pre_header_content})
+
+                    if current_section_pages:
+                        sections.append(current_section_pages)
+
+                    current_section_pages = [{'num': page_num, 'content': match.group(0)}]
+                    last_pos = match.end()
+
+                remaining_content = content[last_pos:]
+                if remaining_content.strip():
+                    current_section_pages.append({'num': page_num, 'content': remaining_content})
+
+        if current_section_pages:
+            sections.append(current_section_pages)
+
+        initial_chunks = []
+        for section_pages in sections:
+            section_content = "".join([p['content'] for p in section_pages])
+
+            if len(section_content) <= self.max_char_limit:
+                page_nums = [p['num'] for p in section_pages]
+                initial_chunks.append({'content': section_content, 'pages': page_nums})
+            else:
+                current_chunk_content = ""
+                current_chunk_pages = []
+
+                for page_data in section_pages:
+                    page_len = len(page_data['content'])
+                    if current_chunk_content and len(current_chunk_content) + page_len > self.max_char_limit:
+                        initial_chunks.append({'content': current_chunk_content, 'pages': current_chunk_pages})
+                        current_chunk_content = page_data['content']
+                        current_chunk_pages = [page_data['num']]
+                    else:
+                        current_chunk_content += page_data['content']
+                        current_chunk_pages.append(page_data['num'])
+
+                if current_chunk_content:
+                    initial_chunks.append({'content': current_chunk_content, 'pages': current_chunk_pages})
+
+        return initial_chunks
+
+    def _consolidate_chunks(self, chunks_data: List[Dict]) -> List[Dict]:
+        if not chunks_data:
+            return []
+
+        consolidated = []
+        current_chunk = chunks_data[0].copy()
+        separator = "\n\n---\n\n"
+
+        for next_chunk in chunks_data[1:]:
+            if len(current_chunk['content']) + len(separator) + len(next_chunk['content']) <= self.max_char_limit:
+                current_chunk['content'] += separator + next_chunk['content']
+                current_chunk['pages'].extend(next_chunk['pages'])
+            else:
+                consolidated.append(current_chunk)
+                current_chunk = next_chunk.copy()
+
+        consolidated.append(current_chunk)
+        return consolidated
+
+    def _create_langchain_documents(self, consolidated_data: List[Dict], file_name: str,
+                                    document_date=None) -> List[Document]:
+        final_documents = []
+        for chunk_data in consolidated_data:
+            formatted_pages = self._format_page_numbers(chunk_data['pages'])
+            full_content = f"File: {file_name}\nPages: {formatted_pages}\n\n{chunk_data['content']}"
+            final_documents.append(Document(page_content=full_content, metadata={
+                'file_name': file_name,
+                'prompt_text': self._to_prompt_text(full_content),
+            }))
+        return final_documents
+
+
+def _time_stages(chunker: PDFChunkerForQdrant, pages: List[Document], repeats: int) -> Dict:
+    best = {"chunk_s": float("inf"), "documents_s": float("inf")}
+    for _ in range(repeats):
+        start = time.perf_counter()
+        chunks = chunker._consolidate_chunks(chunker._create_initial_chunks(pages))
+        chunked = time.perf_counter()
+        # Headers and page lists only; prompt_text's HTML parse is the same for both and would swamp the rest
+        texts = [f"Pages: {chunker._format_page_numbers(c.pages() if hasattr(c, 'pages') else c['pages'])}\n\n"
+                 f"{c.text() if hasattr(c, 'text') else c['content']}" for c in chunks]
+        done = time.perf_counter()
+        best["chunk_s"] = min(best["chunk_s"], chunked - start)
+        best["documents_s"] = min(best["documents_s"], done - chunked)
+    tracemalloc.start()
+    chunker._consolidate_chunks(chunker._create_initial_chunks(pages))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"chunk_s": round(best["chunk_s"], 4), "documents_s": round(best["documents_s"], 4),
+            "total_s": round(best["chunk_s"] + best["documents_s"], 4),
+            "peak_alloc_mb": round(peak / 2 ** 20, 2), "chunks": len(texts)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1000, 4000, 8000])
+    parser.add_argument("--max-chars", type=int, default=5000)
+    parser.add_argument("--sections-per-page", type=float, default=0.5)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    span_chunker = PDFChunkerForQdrant(args.max_chars)
+    string_chunker = StringChunker(args.max_chars)
+    runs = []
+    for page_count in args.pages:
+        pages = make_markdown_pages(1630, page_count, sections_per_page=args.sections_per_page)
+        # Full steps 2-5 (with prompt_text) once, to check the output is unchanged; the baseline predates
+        # the structured metadata fields, so only the text and file fields are compared
+        with contextlib.redirect_stdout(io.StringIO()):
+            identical = [(d.page_content, d.metadata['file_name'], d.metadata['prompt_text'])
+                         for d in span_chunker._chunk_pages("I-1630.pdf", pages)] == \
+                [(d.page_content, d.metadata['file_name'], d.metadata['prompt_text'])
+                 for d in string_chunker._chunk_pages("I-1630.pdf", pages)]
+        string_run = _time_stages(string_chunker, pages, args.repeats)
+        span_run = _time_stages(span_chunker, pages, args.repeats)
+        runs.append({
+            "pages": page_count,
+            "mb_of_text": round(sum(len(p.page_content) for p in pages) / 2 ** 20, 1),
+            "string_chunker": string_run,
+            "span_chunker": span_run,
+            "speedup": round(string_run["total_s"] / span_run["total_s"], 2),
+            "identical_output": identical,
+        })
+
+    print(json.dumps({"max_char_limit": args.max_chars, "runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
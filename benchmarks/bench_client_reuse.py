@@ -0,0 +1,78 @@
+"""
+Per-question latency with fresh clients per question (the old behaviour) versus
+the shared clients handed out by resource_registry.
+
+Runs against the local OpenAI / Qdrant stubs, which charge `--connect-delay-ms`
+for every new connection to stand in for a TLS handshake with a cloud endpoint.
+
+    python -m benchmarks.bench_client_reuse --questions 20 --connect-delay-ms 80
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from benchmarks.stub_servers import start_openai_stub, start_qdrant_stub
+
+
+def _run(handler, questions, qdrant_url, fresh_clients: bool):
+    import resource_registry
+
+    latencies = []
+    for question in questions:
+        if fresh_clients:
+            resource_registry.clear()
+        start = time.perf_counter()
+        answer = handler.get_final_answer(question, qdrant_url, None, "sk-stub", use_answer_cache=False)
+        latencies.append(time.perf_counter() - start)
+        if answer.startswith("An error occurred"):
+            raise RuntimeError(answer)
+    resource_registry.clear()
+    return latencies
+
+
+def _summary(latencies):
+    ordered = sorted(latencies)
+    return {
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--connect-delay-ms", type=float, default=80.0)
+    parser.add_argument("--handler", choices=["langchain", "openai"], default="langchain")
+    args = parser.parse_args()
+
+    delay = args.connect_delay_ms / 1000
+    openai_server, openai_url = start_openai_stub(connect_delay=delay)
+    qdrant_server, qdrant_url = start_qdrant_stub(connect_delay=delay)
+    # Both the openai client and langchain-openai pick this up when no base_url is passed
+    os.environ["OPENAI_BASE_URL"] = openai_url
+
+    if args.handler == "langchain":
+        import rag_handler_langchain as handler
+    else:
+        import rag_handler as handler
+
+    questions = [f"How is eligibility of QMB determined? ({i})" for i in range(args.questions)]
+    results = {}
+    for label, fresh in (("fresh_clients_per_question", True), ("shared_clients", False)):
+        openai_server.stats["connections"] = qdrant_server.stats["connections"] = 0
+        latencies = _run(handler, questions, qdrant_url, fresh_clients=fresh)
+        results[label] = _summary(latencies)
+        results[label]["connections_opened"] = openai_server.stats["connections"] + qdrant_server.stats["connections"]
+
+    print(json.dumps({"handler": args.handler, "questions": args.questions,
+                      "connect_delay_ms": args.connect_delay_ms, "results": results}, indent=2))
+
+    openai_server.shutdown()
+    qdrant_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Collection profiles (collection_profiles.PROFILES): recall@k against exact search, search latency
+and memory for each one, on synthetic embedding-like vectors (unit length, clustered around a
+shared direction the way OpenAI embeddings are, so cosine scores bunch up above ~0.7).
+
+  quantized   the profile's quantization replayed in numpy, the way Qdrant searches it: score
+              every point on the int8 / 1-bit vectors, keep k * oversampling candidates, rescore
+              those on the float32 originals. Shows what quantization alone costs in recall.
+  qdrant      each profile's collection created in Qdrant and searched with the profile's search
+              params, against exact=True on the same collection; p50/p99 are per-query latencies.
+              Local mode (the default) searches exactly and ignores quantization and HNSW, so for
+              those numbers point --url at a Qdrant server.
+  memory_mb   what the profile keeps in RAM and on disk: vectors (float32, int8 or 1 bit per
+              dimension), originals when on_disk_vectors moves them to disk, and the HNSW links
+              (about 2 * m ids of 4 bytes per point on the bottom layer).
+
+    python -m benchmarks.bench_collection_profiles --points 20000 --dim 1536 --queries 200 --k 10
+    python -m benchmarks.bench_collection_profiles --url http://localhost:6333
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Dict, Optional
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct, SearchParams
+
+from collection_aliases import wait_until_ready
+from collection_profiles import PROFILES, CollectionProfile
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def make_vectors(points: int, queries: int, dim: int, clusters: int = 64, seed: int = 0):
+    """
+    (corpus, queries), unit length float32. Every vector is mostly one shared direction plus its
+    cluster's and its own, so unrelated pairs still score ~0.7 like ada-002 embeddings do; each
+    query is a corpus vector nudged to ~0.92 cosine, like a rephrased passage.
+    """
+    rng = np.random.default_rng(seed)
+    shared = _unit(rng.normal(size=dim))
+    centers = _unit(rng.normal(size=(clusters, dim)))
+    corpus = _unit(np.sqrt(0.7) * shared + np.sqrt(0.15) * centers[rng.integers(clusters, size=points)]
+                   + np.sqrt(0.15) * _unit(rng.normal(size=(points, dim))))
+    picked = corpus[rng.integers(points, size=queries)]
+    query_vectors = _unit(np.sqrt(0.85) * picked + np.sqrt(0.15) * _unit(rng.normal(size=(queries, dim))))
+    return corpus.astype(np.float32), query_vectors.astype(np.float32)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+    return np.take_along_axis(top, order, axis=1)
+
+
+def _recall(found: np.ndarray, truth: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def quantized_search(profile: CollectionProfile, corpus: np.ndarray, queries: np.ndarray, k: int,
+                     rescore: Optional[bool] = None) -> np.ndarray:
+    """Top-k ids the profile's quantization returns, with or without rescoring on the originals."""
+    rescore = profile.rescore if rescore is None else rescore
+    if profile.quantization == "scalar":
+        # int8 over the 0.99 quantile range, as ScalarQuantizationConfig(quantile=0.99) does
+        low, high = np.quantile(corpus, [0.005, 0.995])
+        scale = (high - low) / 255
+        codes = np.clip(np.round((corpus - low) / scale), 0, 255).astype(np.uint8)
+        approximate = (codes.astype(np.float32) * scale + low) @ queries.T
+    elif profile.quantization == "binary":
+        # One bit per dimension; scoring the +-1 vectors ranks like the Hamming distance Qdrant uses
+        approximate = np.where(corpus > 0, 1.0, -1.0).astype(np.float32) @ np.where(queries > 0, 1.0, -1.0).T
+    else:
+        return _top_k(queries @ corpus.T, k)
+    approximate = approximate.T
+    if not rescore:
+        return _top_k(approximate, k)
+    candidates = _top_k(approximate, int(k * profile.oversampling))
+    exact = np.einsum("qd,qcd->qc", queries, corpus[candidates])
+    return np.take_along_axis(candidates, _top_k(exact, k), axis=1)
+
+
+def memory_mb(profile: CollectionProfile, points: int, dim: int) -> Dict:
+    float_bytes = points * dim * 4
+    quantized_bytes = {"scalar": points * dim, "binary": points * dim // 8}.get(profile.quantization, 0)
+    graph_bytes = points * 2 * (profile.hnsw_m or 16) * 4
+    ram = graph_bytes + quantized_bytes + (0 if profile.on_disk_vectors else float_bytes)
+    disk = float_bytes if profile.on_disk_vectors else 0
+    return {"ram_mb": round(ram / 2 ** 20, 1), "disk_mb": round(disk / 2 ** 20, 1)}
+
+
+def bench_qdrant(client: QdrantClient, profile: CollectionProfile, corpus: np.ndarray, queries: np.ndarray,
+                 k: int) -> Dict:
+    name = f"bench_profile_{profile.name}"
+    if client.collection_exists(name):
+        client.delete_collection(name)
+    profile.create_collection(client, name, corpus.shape[1])
+    start = time.perf_counter()
+    for i in range(0, len(corpus), 256):
+        client.upsert(name, points=[PointStruct(id=j, vector=corpus[j].tolist())
+                                    for j in range(i, min(i + 256, len(corpus)))])
+    ready = wait_until_ready(client, name, timeout=900, poll_interval=1.0)
+    load_seconds = time.perf_counter() - start
+
+    search_params = profile.search_params()
+    for vector in queries[:10]:
+        client.search(name, query_vector=vector.tolist(), limit=k, search_params=search_params)
+    latencies, found, truth = [], [], []
+    for vector in queries:
+        begin = time.perf_counter()
+        hits = client.search(name, query_vector=vector.tolist(), limit=k, search_params=search_params)
+        latencies.append(time.perf_counter() - begin)
+        found.append([hit.id for hit in hits])
+        truth.append([hit.id for hit in client.search(name, query_vector=vector.tolist(), limit=k,
+                                                      search_params=SearchParams(exact=True))])
+    client.delete_collection(name)
+    ordered = sorted(latencies)
+    return {
+        f"recall@{k}": round(_recall(found, truth), 4),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+        "load_s": round(load_seconds, 1),
+        "indexed": ready,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--profiles", nargs="*", default=list(PROFILES), choices=list(PROFILES))
+    parser.add_argument("--url", help="Qdrant server URL (default: local mode, in memory)")
+    parser.add_argument("--api-key")
+    parser.add_argument("--skip-qdrant", action="store_true", help="only the numpy quantization replay")
+    args = parser.parse_args()
+
+    corpus, queries = make_vectors(args.points, args.queries, args.dim)
+    truth = _top_k(queries @ corpus.T, args.k)
+    client = None
+    if not args.skip_qdrant:
+        client = QdrantClient(url=args.url, api_key=args.api_key) if args.url else QdrantClient(location=":memory:")
+
+    results: Dict[str, Dict] = {}
+    for name in args.profiles:
+        profile = PROFILES[name]
+        entry = {"settings": {key: value for key, value in vars(profile).items() if key != "name"},
+                 "memory_mb": memory_mb(profile, args.points, args.dim)}
+        if profile.quantization:
+            entry["quantized"] = {
+                f"recall@{args.k}_no_rescore": round(_recall(quantized_search(profile, corpus, queries, args.k,
+                                                                              rescore=False), truth), 4),
+                f"recall@{args.k}_rescored": round(_recall(quantized_search(profile, corpus, queries, args.k,
+                                                                           rescore=True), truth), 4),
+            }
+        if client is not None:
+            entry["qdrant"] = bench_qdrant(client, profile, corpus, queries, args.k)
+        results[name] = entry
+
+    print(json.dumps({
+        "points": args.points, "dim": args.dim, "queries": args.queries, "k": args.k,
+        "qdrant": "skipped" if client is None else (args.url or "local mode (exact search; HNSW and quantization "
+                                                                 "are not applied)"),
+        "profiles": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
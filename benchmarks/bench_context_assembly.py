@@ -0,0 +1,61 @@
+"""
+Query-side context assembly: BeautifulSoup over every retrieved chunk (chunks ingested
+before prompt_text existed) versus concatenating the prompt_text precomputed at ingest.
+
+    python -m benchmarks.bench_context_assembly --k 3 --chunk-chars 5000 --repeats 2000
+"""
+import argparse
+import json
+import random
+import timeit
+
+from langchain_core.documents import Document
+
+import context_packer
+import rag_handler_langchain
+from pdf_chunker import PDFChunkerForQdrant
+
+
+def _synthetic_chunk(chars: int, seed: int) -> str:
+    rng = random.Random(seed)
+    words = ["eligibility", "QMB", "income", "resources", "**I-1630**", "applicant", "Medicare", "|", "<br>",
+             "household", "countable", "&", "percent", "poverty", "level", "\n\n", "- item", "SLMB"]
+    parts, size = [], 0
+    while size < chars:
+        word = rng.choice(words)
+        parts.append(word)
+        size += len(word) + 1
+    return f"File: I-1630.pdf\nPages: {seed}\n\n" + " ".join(parts)[:chars]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--chunk-chars", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=2000)
+    args = parser.parse_args()
+
+    contents = [_synthetic_chunk(args.chunk_chars, i) for i in range(args.k)]
+    legacy_docs = [Document(page_content=c, metadata={"file_name": "I-1630.pdf"}) for c in contents]
+    ingested_docs = [Document(page_content=c, metadata={"file_name": "I-1630.pdf",
+                                                        "prompt_text": PDFChunkerForQdrant._to_prompt_text(c)})
+                     for c in contents]
+
+    # Measure parsing alone; context packing costs the same on both paths
+    context_packer.CONTEXT_PACKING = False
+    # Both paths must hand the LLM exactly the same context
+    assert rag_handler_langchain.build_context(legacy_docs) == rag_handler_langchain.build_context(ingested_docs)
+
+    before = timeit.timeit(lambda: rag_handler_langchain.build_context(legacy_docs), number=args.repeats)
+    after = timeit.timeit(lambda: rag_handler_langchain.build_context(ingested_docs), number=args.repeats)
+    print(json.dumps({
+        "k": args.k,
+        "chunk_chars": args.chunk_chars,
+        "beautifulsoup_per_query_us": round(before / args.repeats * 1e6, 2),
+        "precomputed_per_query_us": round(after / args.repeats * 1e6, 2),
+        "speedup": round(before / after, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Prompt tokens sent to the LLM with plain concatenation of the retrieved chunks versus the
+token-budgeted, deduplicated context from context_packer.
+
+By default the chunks come from a synthetic manual whose sections repeat boilerplate and
+overlap the way consolidated PDFChunkerForQdrant chunks do. With --live, the sample
+questions are run through rag_handler_langchain.retrieve_documents against the real
+collection (QDRANT_URL / QDRANT_API_KEY / OPENAI_API_KEY from the environment).
+
+    python -m benchmarks.bench_context_packing --budget 4000
+"""
+import argparse
+import json
+import os
+import random
+
+import context_packer
+
+SAMPLE_QUESTIONS = [
+    "How is eligibility of QMB determined?",
+    "Tell me about continued medicaid",
+    "How to establish non-financial eligibility for QI program?",
+    "How are applications for medical assistance processed?",
+    "What income limits apply to SLMB?",
+]
+
+BOILERPLATE = [
+    "Louisiana Medicaid Eligibility Manual. Revised 01/2024. This section supersedes all prior versions.",
+    "| Program | Income Limit | Resource Limit |\n|---|---|---|\n| QMB | 100% FPL | $9,430 |",
+]
+
+
+def _synthetic_chunks(question_index: int, rng: random.Random):
+    """Three ranked chunks from one section: shared boilerplate plus overlapping paragraphs."""
+    section = [f"Paragraph {question_index}-{i}: " + " ".join(rng.choice(
+        ["eligibility", "income", "resources", "applicant", "Medicare", "household", "countable",
+         "verification", "agency", "determination"]) for _ in range(60)) for i in range(12)]
+    chunks = []
+    for rank in range(3):
+        start = rank * 3
+        body = BOILERPLATE + section[start:start + 6]
+        text = f"File: I-16{30 + question_index}.pdf\nPages: {start + 1}-{start + 4}\n\n" + "\n\n---\n\n".join(body)
+        chunks.append({"text": text, "file_name": f"I-16{30 + question_index}.pdf", "score": 1.0 - rank * 0.1})
+    return chunks
+
+
+def _live_chunks(question: str):
+    import rag_handler_langchain
+
+    url, api_key, openai_key = os.getenv("QDRANT_URL"), os.getenv("QDRANT_API_KEY"), os.getenv("OPENAI_API_KEY")
+    vector_store = rag_handler_langchain.get_vector_store(url, api_key, openai_key)
+    docs = rag_handler_langchain.retrieve_documents(question, vector_store.embeddings.embed_query(question),
+                                                    url, api_key, openai_key)
+    return [{"text": d.metadata.get("prompt_text", d.page_content), "file_name": d.metadata.get("file_name", "N/A")}
+            for d in docs]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget", type=int, default=context_packer.CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    rows = []
+    for i, question in enumerate(SAMPLE_QUESTIONS):
+        chunks = _live_chunks(question) if args.live else _synthetic_chunks(i, rng)
+        plain = "".join(f"Source (File: {c['file_name']}):\n{c['text']}\n---\n" for c in chunks)
+        packed, _, stats = context_packer.pack_context(chunks, token_budget=args.budget)
+        rows.append({
+            "question": question,
+            "plain_tokens": context_packer.count_tokens(plain),
+            "packed_tokens": stats["context_tokens"],
+            "duplicates_dropped": stats["duplicates_dropped"],
+            "over_budget_dropped": stats["over_budget_dropped"],
+        })
+
+    plain_total = sum(r["plain_tokens"] for r in rows)
+    packed_total = sum(r["packed_tokens"] for r in rows)
+    print(json.dumps({
+        "source": "live" if args.live else "synthetic",
+        "budget": args.budget,
+        "tokenizer": "tiktoken" if context_packer._get_encoding() is not None else "chars/4 estimate",
+        "questions": rows,
+        "plain_tokens_total": plain_total,
+        "packed_tokens_total": packed_total,
+        "savings_pct": round(100 * (1 - packed_total / plain_total), 1) if plain_total else 0.0,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
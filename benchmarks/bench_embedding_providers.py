@@ -0,0 +1,171 @@
+"""
+Embedding choices (embedding_providers.py): index size, search latency and recall per vector size
+and per provider.
+
+  dimensions  synthetic embedding-like vectors (benchmarks.bench_collection_profiles.make_vectors)
+              with a Matryoshka-style spectrum, most of the signal in the leading dimensions the
+              way text-embedding-3 models are trained, cut to each of --dims and renormalized, as the
+              API's `dimensions` parameter does. recall@k is against exact search on the full
+              vectors; latency is Qdrant search (local mode, or --url) on a collection of that size.
+  providers   the --providers presets embedding chunks of the synthetic manual, and a 12-word
+              passage from each sampled chunk as its question: embedding throughput, index size,
+              hit@k (the question finds its chunk) and top-k overlap with the first provider
+              listed, e.g. 3-small-512 against 3-small. OpenAI presets need OPENAI_API_KEY (or
+              OPENAI_BASE_URL pointing at benchmarks.stub_servers); `minilm` needs sentence-transformers.
+  index_mb    float32 vectors plus HNSW links, as bench_collection_profiles.memory_mb counts them
+
+    python -m benchmarks.bench_embedding_providers --points 20000 --dims 1536 512 256
+    python -m benchmarks.bench_embedding_providers --providers 3-small 3-small-512 3-small-256 hashing
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+
+from benchmarks.bench_collection_profiles import _recall, _top_k, make_vectors, memory_mb
+from benchmarks.pdf_corpus import make_markdown_pages
+from collection_aliases import wait_until_ready
+from collection_profiles import get_profile
+from embedding_providers import EMBEDDINGS, get_embedding
+from embedding_stage import EmbeddingStage
+from pdf_chunker import PDFChunkerForQdrant
+
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def _latencies(latencies: List[float]) -> Dict:
+    ordered = sorted(latencies)
+    return {"p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+            "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3)}
+
+
+def make_matryoshka_vectors(points: int, queries: int, dim: int, decay: float = 0.5, seed: int = 0):
+    """make_vectors() with dimension i scaled by (i + 1) ** -decay, so truncating drops the weakest part."""
+    corpus, query_vectors = make_vectors(points, queries, dim, seed=seed)
+    weights = (np.arange(dim) + 1.0) ** -decay
+    return _unit(corpus * weights).astype(np.float32), _unit(query_vectors * weights).astype(np.float32)
+
+
+def bench_dimensions(client: QdrantClient, corpus: np.ndarray, queries: np.ndarray, dims: List[int], k: int) -> Dict:
+    truth = _top_k(queries @ corpus.T, k)
+    results = {}
+    for dim in dims:
+        cut_corpus, cut_queries = _unit(corpus[:, :dim]), _unit(queries[:, :dim])
+        name = f"bench_embedding_{dim}"
+        if client.collection_exists(name):
+            client.delete_collection(name)
+        get_profile("default").create_collection(client, name, dim)
+        for i in range(0, len(cut_corpus), 256):
+            client.upsert(name, points=[PointStruct(id=j, vector=cut_corpus[j].tolist())
+                                        for j in range(i, min(i + 256, len(cut_corpus)))])
+        wait_until_ready(client, name, timeout=900, poll_interval=1.0)
+        for vector in cut_queries[:10]:
+            client.search(name, query_vector=vector.tolist(), limit=k)
+        latencies, found = [], []
+        for vector in cut_queries:
+            start = time.perf_counter()
+            hits = client.search(name, query_vector=vector.tolist(), limit=k)
+            latencies.append(time.perf_counter() - start)
+            found.append([hit.id for hit in hits])
+        client.delete_collection(name)
+        results[str(dim)] = {
+            f"recall@{k}_vs_full": round(_recall(found, truth), 4),
+            f"recall@{k}_vs_full_exact": round(_recall(_top_k(cut_queries @ cut_corpus.T, k), truth), 4),
+            "index_mb": memory_mb(get_profile("default"), len(corpus), dim)["ram_mb"],
+            "qdrant": _latencies(latencies),
+        }
+    return results
+
+
+def make_passages(files: int, pages: int, queries: int, seed: int = 0):
+    """(chunk texts, question passages, index of each question's chunk) from the synthetic manual."""
+    chunker = PDFChunkerForQdrant(max_char_limit=5000)
+    texts = []
+    for i in range(files):
+        # The chunker reports its steps on stdout, which carries the JSON report
+        with contextlib.redirect_stdout(io.StringIO()):
+            documents = chunker._chunk_pages(f"I-{1000 + 10 * i}.pdf", make_markdown_pages(1000 + 10 * i, pages, seed))
+        texts.extend(doc.page_content for doc in documents)
+    rng = random.Random(seed)
+    sources = [rng.randrange(len(texts)) for _ in range(queries)]
+    passages = []
+    for source in sources:
+        words = texts[source].split()
+        start = rng.randrange(max(1, len(words) - 12))
+        passages.append(" ".join(words[start:start + 12]))
+    return texts, passages, sources
+
+
+def bench_providers(names: List[str], texts: List[str], passages: List[str], sources: List[int], k: int) -> Dict:
+    results, baseline = {}, None
+    for name in names:
+        provider = get_embedding(name)
+        client = None
+        if provider.kind == "openai":
+            if not (os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_BASE_URL")):
+                results[name] = {"skipped": "OPENAI_API_KEY is not set"}
+                continue
+            from openai import OpenAI
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", "sk-bench"))
+        try:
+            start = time.perf_counter()
+            vectors = np.asarray(EmbeddingStage(client, provider).embed(texts), dtype=np.float32)
+            embed_seconds = time.perf_counter() - start
+            query_vectors = np.asarray(provider.embed(passages, client), dtype=np.float32)
+        except ImportError as e:
+            results[name] = {"skipped": str(e)}
+            continue
+        found = _top_k(_unit(query_vectors) @ _unit(vectors).T, min(k, len(texts)))
+        entry = {
+            "model": provider.cache_key,
+            "dimensions": provider.dimensions,
+            "chunks_per_s": round(len(texts) / embed_seconds, 1),
+            "index_mb": memory_mb(get_profile("default"), len(texts), provider.dimensions)["ram_mb"],
+            f"hit@{k}": round(float(np.mean([s in row for s, row in zip(sources, found)])), 4),
+        }
+        if baseline is None:
+            baseline = name, found
+        else:
+            entry[f"overlap@{k}_with_{baseline[0]}"] = round(_recall(found, baseline[1]), 4)
+        results[name] = entry
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", type=int, nargs="*", default=[1536, 1024, 512, 256])
+    parser.add_argument("--providers", nargs="*", default=["hashing"], choices=list(EMBEDDINGS))
+    parser.add_argument("--files", type=int, default=4, help="synthetic manual chapters for the providers part")
+    parser.add_argument("--pages", type=int, default=40, help="pages per chapter")
+    parser.add_argument("--url", help="Qdrant server URL (default: local mode, in memory)")
+    parser.add_argument("--api-key")
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.url, api_key=args.api_key) if args.url else QdrantClient(location=":memory:")
+    corpus, queries = make_matryoshka_vectors(args.points, args.queries, max(args.dims))
+    texts, passages, sources = make_passages(args.files, args.pages, args.queries)
+
+    print(json.dumps({
+        "points": args.points, "queries": args.queries, "k": args.k,
+        "qdrant": args.url or "local mode (exact search)",
+        "dimensions": bench_dimensions(client, corpus, queries, sorted(args.dims, reverse=True), args.k),
+        "chunks": len(texts),
+        "providers": bench_providers(args.providers, texts, passages, sources, args.k),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
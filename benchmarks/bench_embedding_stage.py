@@ -0,0 +1,95 @@
+"""
+Ingest-time embedding against a local fake embeddings server that adds latency and answers a
+share of requests with 429 + Retry-After: LangChain's OpenAIEmbeddings as Qdrant.from_documents
+used it, versus embedding_stage.EmbeddingStage cold and then warm (every chunk cached).
+
+    python -m benchmarks.bench_embedding_stage --chunks 2000 --latency 0.2 --rate-limit-rate 0.1
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from langchain_openai import OpenAIEmbeddings
+from openai import OpenAI
+
+from benchmarks.pdf_corpus import WORDS
+from benchmarks.stub_servers import start_openai_stub
+from embedding_stage import ChunkEmbeddingCache, EmbeddingStage, RateLimiter
+
+MODEL = "text-embedding-ada-002"
+
+
+def _chunks(count: int, words: int):
+    rng = random.Random(0)
+    return [f"File: I-{1000 + i // 20}.pdf\nPages: {i % 20 + 1}\n\n" + " ".join(rng.choice(WORDS) for _ in range(words))
+            for i in range(count)]
+
+
+def _run(server, embed, texts):
+    before = dict(server.stats)
+    start = time.perf_counter()
+    vectors = embed(texts)
+    elapsed = time.perf_counter() - start
+    assert len(vectors) == len(texts)
+    return {
+        "seconds": round(elapsed, 2),
+        "http_requests": server.stats["requests"] - before["requests"],
+        "rate_limited": server.stats["rate_limited"] - before["rate_limited"],
+        "texts_embedded_by_server": server.stats["embedded_inputs"] - before["embedded_inputs"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--words", type=int, default=300, help="words per chunk")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per embeddings request")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.1, help="share of requests answered 429")
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-tokens", type=int, default=20000)
+    # The stub has no quota of its own; these only shape the client-side limiter
+    parser.add_argument("--rpm", type=int, default=10000)
+    parser.add_argument("--tpm", type=int, default=10000000)
+    args = parser.parse_args()
+
+    server, base_url = start_openai_stub(latency=args.latency, rate_limit_rate=args.rate_limit_rate,
+                                         retry_after=args.retry_after)
+    texts = _chunks(args.chunks, args.words)
+
+    # What Qdrant.from_documents did: its 64-text batches, each embedded serially with default retries
+    baseline = OpenAIEmbeddings(model=MODEL, api_key="sk-bench", base_url=base_url, check_embedding_ctx_length=False)
+    langchain_run = _run(server, lambda t: [v for i in range(0, len(t), 64)
+                                            for v in baseline.embed_documents(t[i:i + 64])], texts)
+
+    cache_path = os.path.join(tempfile.mkdtemp(prefix="chunk_embedding_cache_"), "cache.sqlite3")
+    client = OpenAI(api_key="sk-bench", base_url=base_url)
+
+    def stage_run():
+        stage = EmbeddingStage(client, MODEL, cache=ChunkEmbeddingCache(cache_path),
+                               limiter=RateLimiter(args.rpm, args.tpm), concurrency=args.concurrency,
+                               batch_tokens=args.batch_tokens)
+        result = _run(server, stage.embed, texts)
+        result["stage_stats"] = stage.stats
+        return result
+
+    cold = stage_run()
+    warm = stage_run()
+    server.shutdown()
+
+    print(json.dumps({
+        "chunks": args.chunks,
+        "latency_s": args.latency,
+        "rate_limit_rate": args.rate_limit_rate,
+        "langchain_from_documents": langchain_run,
+        "embedding_stage_cold": cold,
+        "embedding_stage_warm": warm,
+        "cold_speedup": round(langchain_run["seconds"] / cold["seconds"], 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
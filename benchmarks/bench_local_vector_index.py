@@ -0,0 +1,90 @@
+"""
+Top-k latency of the in-process LocalVectorIndex versus Qdrant running locally.
+
+Qdrant is either the embedded local mode (default) or a server given with --qdrant-url
+(e.g. a `docker run -p 6333:6333 qdrant/qdrant` on the same machine). Both hold the same
+random unit vectors; the benchmark also reports how often their top-k sets agree.
+
+    python -m benchmarks.bench_local_vector_index --points 3000 --queries 200 --dtype float16
+"""
+import argparse
+import json
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from local_vector_index import LocalVectorIndex, write_snapshot
+
+
+def _percentiles(latencies):
+    ordered = sorted(latencies)
+    return {
+        "p50_ms": round(statistics.median(ordered) * 1000, 3),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, default=3000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    parser.add_argument("--qdrant-url", default=None, help="Qdrant server URL; embedded local mode if omitted")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.points, args.dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    payloads = [{"page_content": f"chunk {i}", "metadata": {"file_name": f"I-{i}.pdf"}} for i in range(args.points)]
+    queries = rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+
+    index_dir = tempfile.mkdtemp(prefix="local_vector_index_")
+    write_snapshot(index_dir, list(range(args.points)), vectors, payloads, dtype=args.dtype)
+    index = LocalVectorIndex(index_dir)
+
+    client = QdrantClient(url=args.qdrant_url) if args.qdrant_url else QdrantClient(location=":memory:")
+    collection = "bench_local_vector_index"
+    client.recreate_collection(collection, vectors_config=VectorParams(size=args.dim, distance=Distance.COSINE))
+    for start in range(0, args.points, 256):
+        client.upsert(collection, points=[
+            PointStruct(id=i, vector=vectors[i].tolist(), payload=payloads[i])
+            for i in range(start, min(start + 256, args.points))
+        ])
+
+    local_latencies, qdrant_latencies, agreement = [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        local_hits = index.search(query, args.k)
+        [index.record(row) for row, _ in local_hits]
+        local_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        qdrant_hits = client.query_points(collection, query=query.tolist(), limit=args.k, with_payload=True).points
+        qdrant_latencies.append(time.perf_counter() - start)
+
+        agreement.append(len({row for row, _ in local_hits} & {p.id for p in qdrant_hits}) / args.k)
+
+    print(json.dumps({
+        "points": args.points,
+        "dim": args.dim,
+        "k": args.k,
+        "dtype": args.dtype,
+        "qdrant": args.qdrant_url or "local mode (:memory:)",
+        "local_vector_index": _percentiles(local_latencies),
+        "qdrant_search": _percentiles(qdrant_latencies),
+        "top_k_agreement": round(statistics.mean(agreement), 4),
+    }, indent=2))
+
+    client.delete_collection(collection)
+    shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Wall-clock of PDFChunkerForQdrant.process_pdfs on a local synthetic corpus: the serial loop
+versus the parallel mode at increasing numbers of conversion processes.
+
+The PDFs are served by a local HTTP server with per-request latency (standing in for the LDH
+site), so downloads go through the same HTTP path as a real ingest. Every run must
+produce exactly the serial run's documents, in the same order.
+
+    python -m benchmarks.bench_parallel_ingest --files 16 --pages 8 --workers 1 2 4 8
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+from benchmarks.pdf_corpus import make_pdf
+from benchmarks.stub_servers import start_file_server
+from pdf_chunker import PDFChunkerForQdrant
+
+
+def _run(urls, **chunker_kwargs):
+    chunker = PDFChunkerForQdrant(max_char_limit=5000, **chunker_kwargs)
+    start = time.perf_counter()
+    # The chunker narrates every step; keep the benchmark output to the JSON summary
+    with contextlib.redirect_stdout(io.StringIO()):
+        documents = chunker.process_pdfs(urls)
+    elapsed = time.perf_counter() - start
+    return elapsed, [(d.page_content, d.metadata) for d in documents]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=16)
+    parser.add_argument("--pages", type=int, default=8, help="pages per PDF")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per download")
+    parser.add_argument("--download-workers", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=None,
+                        help="conversion process counts to try (default: 1, 2, 4, ... up to the core count)")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    worker_counts = args.workers or sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+
+    files = {f"/assets/I-{1000 + 10 * i}.pdf": make_pdf(1000 + 10 * i, args.pages) for i in range(args.files)}
+    server, base_url = start_file_server(files, latency=args.latency)
+    urls = [base_url + path for path in files]
+
+    serial_time, expected = _run(urls, parallel=False)
+    runs = []
+    for workers in worker_counts:
+        elapsed, documents = _run(urls, parallel=True, download_workers=args.download_workers,
+                                  convert_workers=workers)
+        runs.append({
+            "convert_workers": workers,
+            "seconds": round(elapsed, 2),
+            "speedup": round(serial_time / elapsed, 2),
+            "identical_output": documents == expected,
+        })
+    server.shutdown()
+
+    print(json.dumps({
+        "files": args.files,
+        "pages_per_file": args.pages,
+        "download_latency_s": args.latency,
+        "cpu_count": cores,
+        "documents": len(expected),
+        "serial_seconds": round(serial_time, 2),
+        "parallel": runs,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+PDF discovery over a local mirror of the LDH policy site: pdf_discovery.PdfCrawler reading one
+page at a time versus its concurrent breadth-first crawl, against a file server with per-request
+latency.
+
+The mirror's index page links to chapter pages, and each chapter lists its section PDFs the
+ways real pages do: relative and absolute links, fragments, upper-case schemes,
+spaces in paths, links repeated across chapters, off-site PDFs and mailto: / javascript: links.
+Both runs must find exactly the expected PDF URLs, in the same order, without downloading any PDF.
+
+    python -m benchmarks.bench_pdf_discovery --chapters 20 --pdfs-per-chapter 15 --latency 0.05
+"""
+import argparse
+import json
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.stub_servers import start_file_server
+from pdf_discovery import PdfCrawler
+
+ASSETS = "/assets/medicaid/MedicaidEligibilityPolicy"
+
+
+def build_mirror(chapters: int, pdfs_per_chapter: int, port: int) -> Tuple[Dict[str, bytes], List[str]]:
+    """({URL path: HTML}, expected PDF paths in discovery order) for a site served on 127.0.0.1:`port`."""
+    files, expected = {}, []
+    index_links = []
+    for c in range(chapters):
+        chapter_path = f"/page/chapter-{c}"
+        # The same chapter linked relatively, absolutely and with a fragment
+        index_links += [f'<a href="chapter-{c}">Chapter {c}</a>',
+                        f'<a href="http://127.0.0.1:{port}{chapter_path}#top">Chapter {c} (top)</a>']
+        links = []
+        for s in range(pdfs_per_chapter):
+            code = 100 * (c + 1) + s
+            name = f"I-{code}.pdf" if s % 7 else f"I-{code} Appendix.pdf"
+            expected.append(f"{ASSETS}/{name}".replace(" ", "%20"))
+            if s % 3 == 0:
+                href = f"../assets/medicaid/MedicaidEligibilityPolicy/{name}#page=2"
+            elif s % 3 == 1:
+                href = f"HTTP://127.0.0.1:{port}{ASSETS}/{name}"
+            else:
+                href = f"  {ASSETS}/{name}  "
+            links.append(f'<li><a href="{href}">Section I-{code}</a></li>')
+        if c:
+            # Sections cross-referenced from the next chapter are found once, where first seen
+            links.append(f'<li><a href="{ASSETS}/I-{100 * c + 1}.pdf">See also</a></li>')
+        links += [f'<li><a href="http://localhost:{port}/assets/other-site.pdf">Off-site</a></li>',
+                  '<li><a href="mailto:policy@example.com">Email</a></li>',
+                  '<li><a href="javascript:void(0)">Print</a></li>',
+                  '<li><a href="/page/1681">Back to index</a></li>']
+        files[chapter_path] = f"<html><body><ul>{''.join(links)}</ul></body></html>".encode("utf-8")
+    files["/page/1681"] = f"<html><body><ul>{''.join(index_links)}</ul></body></html>".encode("utf-8")
+    return files, expected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--pdfs-per-chapter", type=int, default=15)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per request")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    files: Dict[str, bytes] = {}
+    server, base_url = start_file_server(files, latency=args.latency)
+    mirror, expected_paths = build_mirror(args.chapters, args.pdfs_per_chapter, server.server_address[1])
+    files.update(mirror)
+    expected = [base_url + path for path in expected_paths]
+
+    results = {}
+    for label, workers in (("one_page_at_a_time", 1), ("concurrent", args.workers)):
+        before = server.stats["requests"]
+        crawler = PdfCrawler([base_url + "/page/1681"], max_depth=1, workers=workers)
+        start = time.perf_counter()
+        found = crawler.crawl()
+        elapsed = time.perf_counter() - start
+        assert found == expected, f"{label}: found {len(found)} PDFs, expected {len(expected)}"
+        results[label] = {"seconds": round(elapsed, 2), "http_requests": server.stats["requests"] - before,
+                          **crawler.stats}
+    server.shutdown()
+
+    print(json.dumps({
+        "pages": len(files),
+        "expected_pdfs": len(expected),
+        "latency_s": args.latency,
+        **results,
+        "speedup": round(results["one_page_at_a_time"]["seconds"] / results["concurrent"]["seconds"], 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+PDF fetch + conversion against a local file server that charges a per-connection handshake
+delay: the old path (a fresh requests.get per URL, the bytes written to a temp file and read back
+by PyMuPDF4LLMLoader) versus download_pdf over the shared keep-alive session with the PDF opened
+from memory. A second pass re-fetches the corpus with the stored ETags / Last-Modified, the way
+an incremental ingest does, and reports how many bytes the 304s saved.
+
+    python -m benchmarks.bench_pdf_download --files 30 --pages 10 --connect-delay 0.05
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import requests
+from langchain_pymupdf4llm import PyMuPDF4LLMLoader
+
+from benchmarks.pdf_corpus import make_pdf
+from benchmarks.stub_servers import start_file_server
+from ingest_manifest import fetch_if_changed
+from pdf_chunker import PDFChunkerForQdrant, download_pdf
+
+
+def _old_fetch_and_convert(url: str, temp_dir: str):
+    # What _load_and_convert_pdf did before the shared session and in-memory mode
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    path = os.path.join(temp_dir, f"{os.path.basename(url)[:-4]}_{os.urandom(4).hex()}.pdf")
+    with open(path, "wb") as f:
+        f.write(response.content)
+    return PyMuPDF4LLMLoader(path).load()
+
+
+def _measure(server, run) -> dict:
+    before = dict(server.stats)
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        result = run()
+    return {
+        "seconds": round(time.perf_counter() - start, 2),
+        "http_requests": server.stats["requests"] - before["requests"],
+        "connections_opened": server.stats["connections"] - before["connections"],
+        "bytes_sent": server.stats["bytes_sent"] - before["bytes_sent"],
+    }, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=30)
+    parser.add_argument("--pages", type=int, default=10, help="pages per PDF")
+    parser.add_argument("--connect-delay", type=float, default=0.05, help="seconds per new connection")
+    parser.add_argument("--latency", type=float, default=0.01, help="seconds per request")
+    args = parser.parse_args()
+
+    files = {f"/assets/I-{1000 + i}.pdf": make_pdf(1000 + i, args.pages, seed=i) for i in range(args.files)}
+    server, base_url = start_file_server(files, connect_delay=args.connect_delay, latency=args.latency)
+    urls = [base_url + path for path in files]
+
+    temp_dir = tempfile.mkdtemp(prefix="pdf_download_bench_")
+    old_stats, old_pages = _measure(server, lambda: [_old_fetch_and_convert(url, temp_dir) for url in urls])
+    old_stats["temp_files_written"] = len(os.listdir(temp_dir))
+
+    chunker = PDFChunkerForQdrant(max_char_limit=5000, in_memory=True)
+    new_stats, new_pages = _measure(server, lambda: [chunker._load_and_convert_pdf(url)[1] for url in urls])
+    new_stats["temp_files_written"] = 0 if chunker._download_dir is None else len(os.listdir(chunker._download_dir))
+    assert [[p.page_content for p in pages] for pages in old_pages] == \
+           [[p.page_content for p in pages] for pages in new_pages], "in-memory conversion differs"
+
+    # Download alone, so the connection reuse isn't hidden behind conversion time
+    old_download, _ = _measure(server, lambda: [requests.get(url, timeout=30).content for url in urls])
+    new_download, _ = _measure(server, lambda: [download_pdf(url)[1] for url in urls])
+
+    first = [fetch_if_changed(url, None) for url in urls]
+    entries = [{"etag": r.etag, "last_modified": r.last_modified, "sha256": r.sha256} for r in first]
+    refresh, results = _measure(server, lambda: [fetch_if_changed(url, entry) for url, entry in zip(urls, entries)])
+    refresh["unchanged"] = sum(1 for r in results if not r.changed and not r.error)
+    server.shutdown()
+
+    print(json.dumps({
+        "files": args.files,
+        "pages_per_file": args.pages,
+        "corpus_mb": round(sum(len(body) for body in files.values()) / 2 ** 20, 1),
+        "fetch_and_convert": {"per_request_temp_file": old_stats, "pooled_in_memory": new_stats},
+        "download_only": {"per_request": old_download, "pooled_session": new_download},
+        "conditional_refresh": refresh,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Relevance-threshold early exit (relevance_gate.py): how many LLM calls a calibrated threshold
+avoids and how many answerable questions it wrongly refuses.
+
+Answerable questions come from the labeled synthetic manual of benchmarks.bench_reranking;
+unanswerable ones are off-topic questions, some borrowing a word of the manual's vocabulary.
+Relevance is the best cosine similarity over the chunks' --embedding vectors, as the handlers'
+first-stage search reports it. The threshold is calibrated on half the questions with
+relevance_gate.calibrate and evaluated on the other half.
+
+  false_refusals       answerable questions refused (held out)
+  unanswerable_caught  off-topic questions answered with suggested documents instead (held out)
+  llm_seconds_saved    llm_calls_avoided * --llm-seconds, per 100 questions
+  gate_us              cost of one RelevanceGate.should_answer check
+
+    python -m benchmarks.bench_relevance_gate --max-false-refusals 0.02 0.05
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import relevance_gate
+from benchmarks.bench_reranking import _embed, make_labeled_corpus
+from benchmarks.pdf_corpus import WORDS
+from embedding_providers import EMBEDDINGS, get_embedding
+
+OFF_TOPIC_SUBJECTS = ["sourdough bread", "a flat bicycle tire", "the offside rule", "jazz chords", "tomato plants",
+                      "a cheap flight to Denver", "python decorators", "the french revolution", "a resume",
+                      "lunar eclipses", "a leaky faucet", "chess openings"]
+OFF_TOPIC_TEMPLATES = [
+    "How do I fix {subject}?",
+    "What is the history of {subject}?",
+    "Can you recommend something about {subject}?",
+    "Explain {subject} and the {word} involved",
+]
+
+
+def make_off_topic_questions(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [rng.choice(OFF_TOPIC_TEMPLATES).format(subject=rng.choice(OFF_TOPIC_SUBJECTS), word=rng.choice(WORDS))
+            for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=10, help="answerable questions per topic")
+    parser.add_argument("--off-topic", type=int, default=100)
+    parser.add_argument("--noise", type=int, default=300, help="filler-only chunks")
+    parser.add_argument("--max-false-refusals", type=float, nargs="*", default=[0.0, 0.02, 0.05])
+    parser.add_argument("--llm-seconds", type=float, default=4.0, help="time of one gpt-4 answer")
+    parser.add_argument("--embedding", default="hashing", choices=list(EMBEDDINGS))
+    args = parser.parse_args()
+
+    documents, questions, _ = make_labeled_corpus(3, 4, args.noise, args.questions)
+    off_topic = make_off_topic_questions(args.off_topic)
+    provider = get_embedding(args.embedding)
+    chunk_vectors = _embed(provider, [d.page_content for d in documents])
+    scores = (_embed(provider, questions + off_topic) @ chunk_vectors.T).max(axis=1).tolist()
+    answerable = [True] * len(questions) + [False] * len(off_topic)
+
+    # Interleaved split: every other question calibrates, the rest is held out
+    order = list(range(len(scores)))
+    random.Random(0).shuffle(order)
+    fit, held_out = order[::2], order[1::2]
+
+    results = {}
+    for max_false_refusals in args.max_false_refusals:
+        calibration = relevance_gate.calibrate([scores[i] for i in fit], [answerable[i] for i in fit],
+                                               max_false_refusals, curve_points=0)
+        threshold = calibration["threshold"]
+        # Held-out outcome at the calibrated threshold
+        positives = [scores[i] for i in held_out if answerable[i]]
+        negatives = [scores[i] for i in held_out if not answerable[i]]
+        avoided = sum(scores[i] < threshold for i in held_out) / len(held_out)
+        results[str(max_false_refusals)] = {
+            "threshold": round(threshold, 4),
+            "fit_false_refusals": calibration["false_refusals"],
+            "fit_unanswerable_caught": calibration["unanswerable_caught"],
+            "false_refusals": round(sum(s < threshold for s in positives) / len(positives), 4),
+            "unanswerable_caught": round(sum(s < threshold for s in negatives) / len(negatives), 4),
+            "llm_calls_avoided": round(avoided, 4),
+            "llm_seconds_saved": round(avoided * 100 * args.llm_seconds, 1),
+        }
+
+    with tempfile.TemporaryDirectory() as tmp:
+        gate = relevance_gate.RelevanceGate(thresholds_path=f"{tmp}/thresholds.json")
+        relevance_gate.save_threshold(provider.cache_key, {"threshold": 0.5}, gate.thresholds_path)
+        start = time.perf_counter()
+        for score in scores:
+            gate.should_answer(score, provider.cache_key)
+        gate_us = (time.perf_counter() - start) / len(scores) * 1e6
+
+    print(json.dumps({
+        "chunks": len(documents), "answerable": len(questions), "off_topic": len(off_topic),
+        "embedding": provider.cache_key,
+        "relevance": {
+            "answerable_p10_p50": [round(float(np.percentile(scores[:len(questions)], p)), 4) for p in (10, 50)],
+            "off_topic_p50_p90": [round(float(np.percentile(scores[len(questions):], p)), 4) for p in (50, 90)],
+        },
+        "by_max_false_refusals": results,
+        "gate_us": round(gate_us, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
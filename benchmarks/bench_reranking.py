@@ -0,0 +1,185 @@
+"""
+Two-stage retrieval (reranking.py): precision of the chunks sent to the LLM, prompt tokens and
+rerank latency, single-stage top-k against over-fetch + rerank + adaptive k + MMR.
+
+The corpus is a labeled synthetic manual: TOPICS sections, each in 1 to --sections documents
+and split into 1 to --slices chunks (so some topics have a single relevant chunk), written in the
+manual's filler vocabulary with --topic-rate of the topic's own terms mixed in, plus --noise
+chunks of filler that mention other topics' terms in passing. Each question paraphrases one
+topic with a few of its terms and is relevant to every chunk of that topic. The first stage is exact search over
+--embedding vectors (hashing by default, so it runs offline).
+
+  precision   relevant chunks among those sent
+  hit_rate    questions with at least one relevant chunk sent
+  sections    distinct sections among the chunks sent
+  tokens      prompt context tokens after context_packer
+  rerank      per-question reranking time (features, adaptive k and MMR), p50/p99
+
+    python -m benchmarks.bench_reranking --fetch-k 20 50
+    python -m benchmarks.bench_reranking --rerankers lexical cross-encoder --embedding 3-small-512
+"""
+import argparse
+import json
+import os
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+
+import context_packer
+import reranking
+from benchmarks.pdf_corpus import WORDS
+from embedding_providers import EMBEDDINGS, get_embedding
+
+TOPICS = [
+    ("Qualified Medicare Beneficiary", ["qmb", "part-a", "premium", "buy-in", "entitlement", "coinsurance"]),
+    ("Continued Medicaid", ["continued", "closure", "ex-parte", "redetermination", "transition", "extension"]),
+    ("Qualifying Individual", ["qi-1", "allotment", "first-come", "part-b", "reimbursement", "slot"]),
+    ("Application Processing", ["application", "timeliness", "interview", "pending", "signature", "45-day"]),
+    ("Countable Income", ["wages", "unearned", "disregard", "self-employment", "deduction", "gross"]),
+    ("Resource Assessment", ["spousal", "snapshot", "homestead", "burial", "vehicle", "exclusion"]),
+    ("Transfer of Assets", ["look-back", "penalty", "transfer", "annuity", "trust", "hardship"]),
+    ("Long-Term Care", ["nursing", "facility", "patient", "liability", "waiver", "level-of-care"]),
+    ("Citizenship Verification", ["citizenship", "identity", "passport", "alien", "qualified", "birth"]),
+    ("Retroactive Coverage", ["retroactive", "three-month", "unpaid", "bills", "prior", "coverage"]),
+]
+
+QUESTION_TEMPLATES = [
+    "How does {a} affect {b}?",
+    "What are the rules for {a} and {b} under {title}?",
+    "Explain {a} in {title}",
+    "When is {a} required for {b}?",
+    "Tell me about {a}, {b} and {c}",
+]
+
+
+def make_labeled_corpus(sections: int, slices: int, noise: int, questions_per_topic: int,
+                        topic_rate: float = 0.08, seed: int = 0):
+    """(documents, questions, relevant chunk indices per question) for the synthetic manual."""
+    rng = random.Random(seed)
+    documents, topic_of = [], []
+    for topic, (title, terms) in enumerate(TOPICS):
+        for s in range(rng.randint(1, sections)):
+            code = f"I-{1000 + 10 * (topic * sections + s)}"
+            header = f"{code}.1 {title}"
+            for part in range(rng.randint(1, slices)):
+                other = rng.choice([t for t in TOPICS if t[0] != title])[1]
+                words = [rng.choice(terms) if rng.random() < topic_rate else
+                         rng.choice(other) if rng.random() < topic_rate / 2 else rng.choice(WORDS)
+                         for _ in range(180)]
+                body = "\n\n".join(" ".join(words[i:i + 60]) for i in range(0, len(words), 60))
+                text = f"File: {code}.pdf\nPages: {part + 1}\n\n{header}\n{body}"
+                documents.append(Document(page_content=text, metadata={
+                    "file_name": f"{code}.pdf", "document_code": code, "chapter": "I", "prompt_text": text,
+                    "sections": [f"{code}.1"], "section_headers": [header], "pages": [part + 1],
+                }))
+                topic_of.append(topic)
+    for i in range(noise):
+        code = f"I-{9000 + i}"
+        other = rng.choice(TOPICS)[1]
+        text = f"File: {code}.pdf\nPages: 1\n\n" + " ".join(
+            rng.choice(other) if rng.random() < topic_rate / 2 else rng.choice(WORDS) for _ in range(180))
+        documents.append(Document(page_content=text, metadata={
+            "file_name": f"{code}.pdf", "document_code": code, "chapter": "I", "prompt_text": text,
+            "sections": [], "section_headers": [], "pages": [1],
+        }))
+        topic_of.append(None)
+
+    questions, relevant = [], []
+    for topic, (title, terms) in enumerate(TOPICS):
+        for _ in range(questions_per_topic):
+            a, b, c = rng.sample(terms, 3)
+            template = rng.choice(QUESTION_TEMPLATES)
+            questions.append(template.format(a=a, b=b, c=c, title=title.lower()))
+            relevant.append({i for i, t in enumerate(topic_of) if t == topic})
+    return documents, questions, relevant
+
+
+def _embed(provider, texts: List[str]) -> np.ndarray:
+    client = None
+    if provider.kind == "openai":
+        from openai import OpenAI
+        client = OpenAI(api_key=os.getenv("OPENAI_API_KEY", "sk-bench"))
+    vectors = []
+    for i in range(0, len(texts), 256):
+        vectors.extend(provider.embed(texts[i:i + 256], client))
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def _summary(selections: List[List[int]], relevant: List[set], documents: List[Document],
+             latencies: List[float] = None) -> Dict:
+    sent = sum(len(s) for s in selections)
+    tokens = []
+    for selection in selections:
+        chunks = [{"text": documents[i].metadata["prompt_text"], "file_name": documents[i].metadata["file_name"]}
+                  for i in selection]
+        tokens.append(context_packer.pack_context(chunks)[2]["context_tokens"])
+    result = {
+        "precision": round(sum(len(set(s) & r) for s, r in zip(selections, relevant)) / max(sent, 1), 4),
+        "hit_rate": round(float(np.mean([bool(set(s) & r) for s, r in zip(selections, relevant)])), 4),
+        "chunks_sent": round(sent / len(selections), 2),
+        "sections": round(float(np.mean([len({documents[i].metadata["file_name"] for i in s})
+                                         for s in selections])), 2),
+        "tokens": round(float(np.mean(tokens)), 1),
+    }
+    if latencies:
+        ordered = sorted(latencies)
+        result["rerank_p50_ms"] = round(ordered[len(ordered) // 2] * 1000, 3)
+        result["rerank_p99_ms"] = round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sections", type=int, default=3, help="documents per topic")
+    parser.add_argument("--slices", type=int, default=4, help="chunks per section")
+    parser.add_argument("--noise", type=int, default=300, help="filler-only chunks")
+    parser.add_argument("--topic-rate", type=float, default=0.08, help="share of a chunk's words from its topic")
+    parser.add_argument("--questions", type=int, default=10, help="questions per topic")
+    parser.add_argument("--k", type=int, default=reranking.RERANK_MAX_K, help="single-stage k and reranked max k")
+    parser.add_argument("--fetch-k", type=int, nargs="*", default=[20, 50])
+    parser.add_argument("--rerankers", nargs="*", default=["lexical"], choices=list(reranking.RERANKERS))
+    parser.add_argument("--embedding", default="hashing", choices=list(EMBEDDINGS))
+    args = parser.parse_args()
+
+    documents, questions, relevant = make_labeled_corpus(args.sections, args.slices, args.noise, args.questions,
+                                                           args.topic_rate)
+    provider = get_embedding(args.embedding)
+    scores = _embed(provider, questions) @ _embed(provider, [d.page_content for d in documents]).T
+    order = np.argsort(-scores, axis=1)
+    row_of = {id(doc): i for i, doc in enumerate(documents)}
+
+    results = {"single_stage": _summary([list(row[:args.k]) for row in order], relevant, documents)}
+    for name in args.rerankers:
+        for fetch_k in args.fetch_k:
+            # Full pipeline, then with the adaptive k and the MMR step each switched off
+            variants = {"": {}, " fixed k": {"min_gap": float("inf")}, " no mmr": {"mmr_lambda": 1.0}}
+            for label, options in variants.items():
+                selections, latencies = [], []
+                try:
+                    for q, question in enumerate(questions):
+                        scored = [(documents[i], float(scores[q, i])) for i in order[q, :fetch_k]]
+                        start = time.perf_counter()
+                        selected = reranking.rerank_documents(question, scored, reranking.RERANKERS[name],
+                                                              max_k=args.k, **options)
+                        latencies.append(time.perf_counter() - start)
+                        selections.append([row_of[id(doc)] for doc in selected])
+                except ImportError as e:
+                    results[name] = {"skipped": str(e)}
+                    break
+                results[f"{name} fetch_k={fetch_k}{label}"] = _summary(selections, relevant, documents, latencies)
+            else:
+                continue
+            break
+
+    print(json.dumps({
+        "chunks": len(documents), "questions": len(questions), "embedding": provider.cache_key,
+        "results": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Perceived latency of the blocking get_final_answer versus stream_final_answer.
+
+For the blocking call the user sees nothing until the whole completion is back, so
+time to first output equals total time. The stub LLM spreads `--generation-ms` over
+the answer's tokens to mimic gpt-4 generation speed.
+
+    python -m benchmarks.bench_streaming --questions 10 --generation-ms 3000
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from benchmarks.stub_servers import start_openai_stub, start_qdrant_stub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--generation-ms", type=float, default=3000.0)
+    args = parser.parse_args()
+
+    answer = " ".join(["QMB eligibility is determined by comparing countable income to the poverty level."] * 5)
+    openai_server, openai_url = start_openai_stub(generation_delay=args.generation_ms / 1000, answer=answer)
+    qdrant_server, qdrant_url = start_qdrant_stub()
+    os.environ["OPENAI_BASE_URL"] = openai_url
+
+    import rag_handler_langchain
+
+    # Build the shared clients up front so both modes are measured warm
+    rag_handler_langchain.warm_up(qdrant_url, None, "sk-stub")
+    questions = [f"How is eligibility of QMB determined? ({i})" for i in range(args.questions)]
+
+    blocking = []
+    for question in questions:
+        start = time.perf_counter()
+        rag_handler_langchain.get_final_answer(question, qdrant_url, None, "sk-stub", use_answer_cache=False)
+        blocking.append(time.perf_counter() - start)
+
+    first_token, streamed_total = [], []
+    for question in questions:
+        timings = {}
+        for _ in rag_handler_langchain.stream_final_answer(question, qdrant_url, None, "sk-stub",
+                                                           use_answer_cache=False, timings=timings):
+            pass
+        first_token.append(timings["time_to_first_token"])
+        streamed_total.append(timings["total_time"])
+
+    ms = lambda values: round(statistics.median(values) * 1000, 2)
+    print(json.dumps({
+        "questions": args.questions,
+        "generation_ms": args.generation_ms,
+        "blocking": {"time_to_first_output_p50_ms": ms(blocking), "total_p50_ms": ms(blocking)},
+        "streaming": {"time_to_first_output_p50_ms": ms(first_token), "total_p50_ms": ms(streamed_total)},
+    }, indent=2))
+
+    openai_server.shutdown()
+    qdrant_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Peak RSS and wall-clock of a full ingest: the batch flow (every Document, then every vector,
+held in memory before the first upsert) versus the streaming IngestPipeline.
+
+A synthetic corpus is written to disk and served by a local file server; embeddings come from
+the OpenAI stub and points go to the Qdrant stub, which only counts them, so the measured
+memory is the ingest's own. Each mode runs in a fresh interpreter so peak RSS isn't shared.
+
+    python -m benchmarks.bench_streaming_ingest --files 40 --pages 20
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Mapping
+
+from benchmarks.pdf_corpus import write_corpus
+from benchmarks.stub_servers import start_file_server, start_openai_stub, start_qdrant_stub
+
+COLLECTION = "bench_streaming_ingest"
+
+
+class _DiskFiles(Mapping):
+    """{URL path: bytes} view of a directory that reads each file only when it is requested."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.names = sorted(os.listdir(directory))
+
+    def __getitem__(self, path):
+        name = path.rsplit("/", 1)[-1]
+        if name not in self.names:
+            raise KeyError(path)
+        with open(os.path.join(self.directory, name), "rb") as f:
+            return f.read()
+
+    def __iter__(self):
+        return iter(f"/assets/{name}" for name in self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+def _peak_rss_mb(who) -> float:
+    # ru_maxrss is in kilobytes on Linux (bytes on macOS)
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss * scale / 2 ** 20, 1)
+
+
+def _run_mode(mode: str, corpus_dir: str, latency: float) -> dict:
+    from openai import OpenAI
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+
+    from embedding_stage import EmbeddingStage
+    from ingest_manifest import IngestManifest, assign_point_ids
+    from ingest_pipeline import IngestPipeline
+    from pdf_chunker import PDFChunkerForQdrant
+
+    files = _DiskFiles(corpus_dir)
+    _, files_url = start_file_server(files)
+    _, openai_url = start_openai_stub(latency=latency)
+    qdrant_server, qdrant_url = start_qdrant_stub(points=[], store_upserts=False)
+    urls = [files_url + path for path in files]
+
+    chunker = PDFChunkerForQdrant(max_char_limit=5000, parallel=True)
+    stage = EmbeddingStage(OpenAI(api_key="sk-bench", base_url=openai_url), "text-embedding-ada-002")
+    client = QdrantClient(url=qdrant_url)
+    start = time.perf_counter()
+    if mode == "batch":
+        # The flow before the pipeline: convert everything, embed everything, then upload
+        documents = chunker.process_pdfs(urls)
+        vectors = stage.embed([doc.page_content for doc in documents])
+        client.create_collection(COLLECTION, vectors_config=VectorParams(size=len(vectors[0]), distance=Distance.COSINE))
+        ids = [pid for pid, _ in assign_point_ids(documents)]
+        for i in range(0, len(documents), 64):
+            client.upsert(COLLECTION, points=[
+                PointStruct(id=pid, vector=vector, payload={"page_content": doc.page_content, "metadata": doc.metadata})
+                for pid, vector, doc in zip(ids[i:i + 64], vectors[i:i + 64], documents[i:i + 64])
+            ])
+        chunks = len(documents)
+    else:
+        manifest = IngestManifest(os.path.join(tempfile.mkdtemp(), "manifest.json"), COLLECTION)
+        stats = IngestPipeline(chunker, stage, client, COLLECTION, manifest, recreate=True).run(urls)
+        chunks = stats["upserted"]
+    elapsed = time.perf_counter() - start
+    return {
+        "seconds": round(elapsed, 2),
+        "chunks": chunks,
+        "points_received_by_qdrant": qdrant_server.config.get("upserted", 0),
+        "peak_rss_mb": _peak_rss_mb(resource.RUSAGE_SELF),
+        "peak_rss_conversion_worker_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=20, help="pages per PDF")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds per embeddings request")
+    parser.add_argument("--mode", choices=["batch", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--corpus-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        # Child run: the chunker's progress output goes to stderr, the result to stdout
+        real_stdout, sys.stdout = sys.stdout, sys.stderr
+        result = _run_mode(args.mode, args.corpus_dir, args.latency)
+        real_stdout.write(json.dumps(result) + "\n")
+        return
+
+    corpus_dir = tempfile.mkdtemp(prefix="pdf_corpus_")
+    write_corpus(corpus_dir, args.files, args.pages)
+    corpus_mb = sum(os.path.getsize(os.path.join(corpus_dir, name)) for name in os.listdir(corpus_dir)) / 2 ** 20
+
+    results = {}
+    for mode in ("batch", "streaming"):
+        completed = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_streaming_ingest", "--mode", mode, "--corpus-dir", corpus_dir,
+             "--latency", str(args.latency)],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+        )
+        results[mode] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    print(json.dumps({
+        "files": args.files,
+        "pages_per_file": args.pages,
+        "corpus_mb": round(corpus_mb, 1),
+        **results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Benchmark suite: one run times every stage from PDF to answer and writes the numbers as JSON,
+so two runs (say, before and after a change) can be compared with --compare.
+
+  corpus      synthetic LDH-style manual (benchmarks.pdf_corpus.make_manual): bold "I-xxxx" section
+              headers, ruled tables, short sections and sections running over several pages
+  conversion  PDF -> markdown pages (PyMuPDF4LLM, in memory)
+  chunking    _create_initial_chunks, _consolidate_chunks and _create_langchain_documents, on the
+              converted corpus and on --synthetic-pages of generated markdown
+  answer      get_final_answer end to end for rag_handler and rag_handler_langchain (dense and
+              hybrid), against the local OpenAI stub and a local-mode (in-process) Qdrant
+              collection loaded with the corpus; rag_handler is also timed step by step
+
+Every *_s / *_ms value is a duration (lower is better).
+
+    python -m benchmarks.bench_suite --files 6 --pages 6 --questions 20 --output bench.json
+    python -m benchmarks.bench_suite --output after.json --compare bench.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+from benchmarks.pdf_corpus import TITLES, make_manual, make_markdown_pages
+from benchmarks.stub_servers import start_openai_stub
+
+QDRANT_URL = ":memory:"
+API_KEY = "sk-bench"
+
+
+def _quiet(function: Callable, *args, **kwargs):
+    # The chunker and handlers narrate every step; keep the output to the JSON summary
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+
+def _best_of(repeats: int, function: Callable):
+    """(best wall-clock seconds, last result) over `repeats` calls."""
+    best, result = float("inf"), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _latency_summary(latencies: List[float]) -> Dict:
+    ordered = sorted(latencies)
+    return {
+        "mean_ms": round(statistics.mean(ordered) * 1000, 2),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 2),
+    }
+
+
+def bench_conversion(corpus: Dict[str, bytes]) -> Dict:
+    from pdf_chunker import PDFChunkerForQdrant
+
+    chunker = PDFChunkerForQdrant(max_char_limit=5000)
+    pages, seconds = {}, 0.0
+    for file_name, content in corpus.items():
+        start = time.perf_counter()
+        pages[file_name] = _quiet(chunker._convert_pdf, content, file_name)
+        seconds += time.perf_counter() - start
+    page_count = sum(len(p) for p in pages.values())
+    return {"pages": page_count, "seconds_s": round(seconds, 3),
+            "per_page_ms": round(seconds / max(page_count, 1) * 1000, 2)}, pages
+
+
+def bench_chunking(pages_by_file: Dict[str, list], repeats: int) -> Dict:
+    from pdf_chunker import PDFChunkerForQdrant
+
+    chunker = PDFChunkerForQdrant(max_char_limit=5000)
+    totals = {"initial_chunks_s": 0.0, "consolidate_s": 0.0, "documents_s": 0.0}
+    counts = {"pages": 0, "initial_chunks": 0, "chunks": 0}
+    documents = []
+    for file_name, pages in pages_by_file.items():
+        seconds, initial = _best_of(repeats, lambda: chunker._create_initial_chunks(pages))
+        totals["initial_chunks_s"] += seconds
+        seconds, consolidated = _best_of(repeats, lambda: chunker._consolidate_chunks(initial))
+        totals["consolidate_s"] += seconds
+        seconds, file_documents = _best_of(repeats,
+                                           lambda: chunker._create_langchain_documents(consolidated, file_name))
+        totals["documents_s"] += seconds
+        counts["pages"] += len(pages)
+        counts["initial_chunks"] += len(initial)
+        counts["chunks"] += len(file_documents)
+        documents.extend(file_documents)
+    return {**counts, **{name: round(value, 6) for name, value in totals.items()}}, documents
+
+
+def _load_collection(documents: list, openai_url: str) -> None:
+    """Embeds the chunks through the stub and loads them into the shared local-mode collection."""
+    from openai import OpenAI
+    from qdrant_client.models import Distance, PointStruct, VectorParams
+
+    import resource_registry
+    from embedding_stage import EmbeddingStage, RateLimiter
+    from ingest_manifest import assign_point_ids
+
+    stage = EmbeddingStage(OpenAI(api_key=API_KEY, base_url=openai_url), "text-embedding-ada-002",
+                           limiter=RateLimiter(100000, 10 ** 9))
+    vectors = stage.embed([doc.page_content for doc in documents])
+    client = resource_registry.get_qdrant_client(QDRANT_URL, None)
+    client.create_collection("medicaid_app", vectors_config=VectorParams(size=len(vectors[0]),
+                                                                        distance=Distance.COSINE))
+    client.upsert("medicaid_app", points=[
+        PointStruct(id=pid, vector=vector, payload={"page_content": doc.page_content, "metadata": doc.metadata})
+        for (pid, _), vector, doc in zip(assign_point_ids(documents), vectors, documents)
+    ])
+
+
+def _questions(count: int) -> List[str]:
+    return [f"What does the manual say about {TITLES[i % len(TITLES)]} for household {i}?" for i in range(count)]
+
+
+def _run_handler(get_final_answer: Callable, questions: List[str]) -> Dict:
+    # The first question builds the handler's shared clients and retriever; keep that out of the numbers
+    _quiet(get_final_answer, "warm-up question", QDRANT_URL, None, API_KEY, use_answer_cache=False)
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        answer = _quiet(get_final_answer, question, QDRANT_URL, None, API_KEY, use_answer_cache=False)
+        latencies.append(time.perf_counter() - start)
+        if answer.startswith("An error occurred"):
+            raise RuntimeError(answer)
+    return _latency_summary(latencies)
+
+
+def bench_answers(documents: list, questions: List[str], openai_url: str) -> Dict:
+    import rag_handler
+    import rag_handler_langchain
+
+    _quiet(_load_collection, documents, openai_url)
+    results = {"chunks_indexed": len(documents), "questions": len(questions)}
+
+    # rag_handler step by step, then end to end
+    client = rag_handler.resource_registry.get_openai_client(API_KEY)
+    qdrant = rag_handler.resource_registry.get_qdrant_client(QDRANT_URL, None)
+    steps = {"embed_ms": [], "search_ms": [], "context_ms": [], "llm_ms": []}
+    for question in questions:
+        marks = [time.perf_counter()]
+        vector = rag_handler.embed_query(question + " (steps)", client)
+        marks.append(time.perf_counter())
+        hits = rag_handler.perform_qdrant_search(question, qdrant, client, query_vector=vector)
+        marks.append(time.perf_counter())
+        context_str, _ = rag_handler.build_context(hits)
+        marks.append(time.perf_counter())
+        client.chat.completions.create(model=rag_handler.CHAT_MODEL, temperature=0.0,
+                                       messages=rag_handler.build_messages(question, context_str))
+        marks.append(time.perf_counter())
+        for name, begin, end in zip(steps, marks, marks[1:]):
+            steps[name].append(end - begin)
+    results["rag_handler_steps"] = {name: round(statistics.mean(values) * 1000, 3) for name, values in steps.items()}
+    results["rag_handler"] = _run_handler(rag_handler.get_final_answer, questions)
+
+    for mode in ("dense", "hybrid"):
+        rag_handler_langchain.RETRIEVAL_MODE = mode
+        # Distinct questions per run, so none is answered from the query embedding cache
+        results[f"rag_handler_langchain_{mode}"] = _run_handler(rag_handler_langchain.get_final_answer,
+                                                                [f"{q} ({mode})" for q in questions])
+    return results
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def _durations(node, prefix: str = "") -> Dict[str, float]:
+    """Flattens every *_s / *_ms leaf of a result tree to {"section.name": value}."""
+    found = {}
+    if isinstance(node, dict):
+        for key, value in node.items():
+            found.update(_durations(value, f"{prefix}{key}."))
+    elif isinstance(node, (int, float)) and prefix.rstrip(".").endswith(("_s", "_ms")):
+        found[prefix.rstrip(".")] = node
+    return found
+
+
+def compare(baseline: Dict, current: Dict) -> Dict:
+    """current / baseline for every duration both runs measured (below 1 means faster now)."""
+    before, after = _durations(baseline.get("results", {})), _durations(current["results"])
+    return {name: {"baseline": before[name], "current": after[name],
+                   "ratio": round(after[name] / before[name], 3) if before[name] else None}
+            for name in after if name in before}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=6)
+    parser.add_argument("--pages", type=int, default=6, help="pages per PDF")
+    parser.add_argument("--synthetic-pages", type=int, default=2000,
+                        help="pages of generated markdown for the chunking stages alone")
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per stub OpenAI request")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--skip", nargs="*", default=[], choices=["conversion", "chunking", "answer"])
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--compare", help="a previous report to compare against")
+    args = parser.parse_args()
+
+    # Caches and indexes the handlers write go to a scratch folder, never over the real ones
+    scratch = tempfile.mkdtemp(prefix="bench_suite_")
+    os.environ["QUERY_EMBEDDING_CACHE_PATH"] = os.path.join(scratch, "query_embedding_cache.sqlite3")
+    os.environ["BM25_INDEX_PATH"] = os.path.join(scratch, "bm25_index.json")
+    openai_server, openai_url = start_openai_stub(latency=args.latency)
+    # Both the openai client and langchain-openai pick this up when no base_url is passed
+    os.environ["OPENAI_BASE_URL"] = openai_url
+
+    start = time.perf_counter()
+    corpus = make_manual(args.files, args.pages)
+    results = {"corpus": {"files": len(corpus), "pages_per_file": args.pages,
+                          "mb": round(sum(len(c) for c in corpus.values()) / 2 ** 20, 2)}}
+
+    # Conversion feeds every later stage, so it always runs; --skip conversion only drops it from the report
+    conversion, pages_by_file = bench_conversion(corpus)
+    if "conversion" not in args.skip:
+        results["conversion"] = conversion
+    # Likewise chunking, which produces the documents the answer stage searches
+    chunking, documents = bench_chunking(pages_by_file, args.repeats if "chunking" not in args.skip else 1)
+    if "chunking" not in args.skip:
+        results["chunking_corpus"] = chunking
+        synthetic = {"I-1630.pdf": make_markdown_pages(1630, args.synthetic_pages)}
+        results["chunking_synthetic"], _ = bench_chunking(synthetic, args.repeats)
+    if "answer" not in args.skip:
+        results["answer"] = bench_answers(documents, _questions(args.questions), openai_url)
+    openai_server.shutdown()
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": vars(args),
+            "wall_clock_s": round(time.perf_counter() - start, 2),
+        },
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(json.load(f), report)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
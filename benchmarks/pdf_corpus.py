@@ -0,0 +1,128 @@
+"""
+Synthetic PDFs shaped like the LDH eligibility manual: one file per chapter, bold
+"I-xxxx Title" section headers that PDFChunkerForQdrant splits on, and pages of body text.
+make_markdown_pages skips the PDF and yields converted pages directly, for benchmarking the
+chunking steps on inputs far larger than is practical to convert.
+"""
+import os
+import random
+from typing import Dict, List
+
+import pymupdf
+from langchain_core.documents import Document
+
+WORDS = ["eligibility", "income", "resources", "applicant", "Medicare", "household", "countable",
+         "verification", "agency", "determination", "QMB", "SLMB", "poverty", "level", "premium",
+         "enrollee", "disability", "renewal", "notice", "budget"]
+TITLES = ["Qualified Medicare Beneficiary", "Specified Low-Income Medicare Beneficiary", "Qualifying Individual",
+          "Application Processing", "Continued Medicaid", "Countable Income", "Resource Assessment"]
+
+_LINE_HEIGHT = 14
+_LINES_PER_PAGE = 48
+_TABLE_ROW_HEIGHT = 18
+
+
+def _draw_table(page, y: float, rng: random.Random) -> float:
+    """Draws a ruled income-limit table (which PyMuPDF4LLM turns into a markdown table) at y; returns its height."""
+    rows = [("Household size", "Monthly limit")] + [(str(n), f"${rng.randint(1000, 5000):,}")
+                                                     for n in range(1, rng.randint(3, 7))]
+    columns = [72, 232, 392]
+    for r, row in enumerate(rows):
+        for c, cell in enumerate(row):
+            rect = pymupdf.Rect(columns[c], y + r * _TABLE_ROW_HEIGHT, columns[c + 1], y + (r + 1) * _TABLE_ROW_HEIGHT)
+            page.draw_rect(rect, color=(0, 0, 0), width=0.7)
+            page.insert_text((rect.x0 + 4, rect.y1 - 5), cell, fontname="hebo" if r == 0 else "helv", fontsize=9)
+    return len(rows) * _TABLE_ROW_HEIGHT + 8
+
+
+def make_pdf(code: int, pages: int, seed: int = 0, sections_per_page: float = 0.5, table_rate: float = 0.0) -> bytes:
+    """
+    Bytes of one manual chapter "I-<code>.pdf" with `pages` pages. Low sections_per_page gives
+    sections running over many pages; table_rate is the average number of tables per page.
+    """
+    rng = random.Random(seed * 100003 + code)
+    doc = pymupdf.open()
+    section = 0
+    for page_index in range(pages):
+        page = doc.new_page()
+        y = 72
+        skip = 0
+        for line in range(_LINES_PER_PAGE):
+            if skip:
+                # Lines taken up by a table
+                skip -= 1
+                continue
+            # Every chapter opens with a header; later ones average sections_per_page per page
+            if (page_index == 0 and line == 0) or rng.random() < sections_per_page / _LINES_PER_PAGE:
+                section += 1
+                page.insert_text((72, y), f"I-{code}.{section} {rng.choice(TITLES)}", fontname="hebo", fontsize=12)
+                y += _LINE_HEIGHT + 6
+            elif table_rate and line < _LINES_PER_PAGE - 12 and rng.random() < table_rate / _LINES_PER_PAGE:
+                height = _draw_table(page, y, rng)
+                y += height
+                skip = int(height // _LINE_HEIGHT)
+            else:
+                page.insert_text((72, y), " ".join(rng.choice(WORDS) for _ in range(11)), fontname="helv",
+                                 fontsize=10)
+                y += _LINE_HEIGHT
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+# (sections_per_page, table_rate) per chapter in a mixed corpus: short sections with tables,
+# sections running over several pages, and the default shape
+MANUAL_PROFILES = [(2.0, 0.5), (0.15, 0.2), (0.5, 0.0)]
+
+
+def make_manual(files: int, pages_per_file: int, seed: int = 0) -> Dict[str, bytes]:
+    """{file name: PDF bytes} for a corpus cycling through MANUAL_PROFILES."""
+    corpus = {}
+    for i in range(files):
+        code = 1000 + 10 * i
+        sections_per_page, table_rate = MANUAL_PROFILES[i % len(MANUAL_PROFILES)]
+        corpus[f"I-{code}.pdf"] = make_pdf(code, pages_per_file, seed, sections_per_page=sections_per_page,
+                                           table_rate=table_rate)
+    return corpus
+
+
+def write_corpus(out_dir: str, files: int, pages_per_file: int, seed: int = 0, **pdf_options) -> List[str]:
+    """Writes `files` chapters into out_dir; returns their paths in manual order."""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(files):
+        code = 1000 + 10 * i
+        path = os.path.join(out_dir, f"I-{code}.pdf")
+        with open(path, "wb") as f:
+            f.write(make_pdf(code, pages_per_file, seed, **pdf_options))
+        paths.append(path)
+    return paths
+
+
+def make_markdown_pages(code: int, pages: int, seed: int = 0, sections_per_page: float = 0.5) -> List[Document]:
+    """
+    Pages of "I-<code>.pdf" as PyMuPDF4LLM converts them (page metadata, file_name added), with
+    `**I-<code>.<n> Title**` header lines, body paragraphs, an occasional table, blank pages, and
+    sections ranging from a few lines to many pages.
+    """
+    rng = random.Random(seed * 100003 + code)
+    file_name = f"I-{code}.pdf"
+    documents, section = [], 0
+    for page_index in range(pages):
+        if page_index and rng.random() < 0.01:
+            documents.append(Document(page_content="", metadata={"page": page_index, "file_name": file_name}))
+            continue
+        blocks = []
+        for line in range(_LINES_PER_PAGE // 4):
+            if (page_index == 0 and line == 0) or rng.random() < 4 * sections_per_page / _LINES_PER_PAGE:
+                section += 1
+                blocks.append(f"**I-{code}.{section} {rng.choice(TITLES)}**\n")
+            elif rng.random() < 0.03:
+                rows = ["|Household size|Monthly limit|", "|---|---|"] + [
+                    f"|{n}|${rng.randint(1000, 5000):,}|" for n in range(1, rng.randint(3, 9))]
+                blocks.append("\n".join(rows) + "\n")
+            else:
+                blocks.append(" ".join(rng.choice(WORDS) for _ in range(4 * 11)) + "\n")
+        documents.append(Document(page_content="\n".join(blocks) + "\n", metadata={"page": page_index,
+                                                                                  "file_name": file_name}))
+    return documents
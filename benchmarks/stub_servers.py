@@ -0,0 +1,406 @@
+"""
+Local stand-ins for the OpenAI and Qdrant HTTP APIs (and a static file server for the
+PDF source site), used by the benchmarks.
+
+The stubs speak just enough of each wire protocol for the official clients
+(openai, qdrant-client, langchain-openai) to work unchanged when pointed at them,
+and can inject latency so client-side changes show up in the numbers.
+"""
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import socket
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+EMBEDDING_DIM = 1536
+
+
+def hash_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Deterministic bag-of-words embedding: similar texts get similar vectors."""
+    vector = [0.0] * dim
+    for token in re.findall(r"\w+", text.lower()):
+        digest = hashlib.md5(token.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "little") % dim
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+SAMPLE_CHUNKS = [
+    ("I-1630.pdf", "**I-1630 Qualified Medicare Beneficiary (QMB)** Eligibility for QMB is determined by "
+                   "comparing countable income to 100 percent of the federal poverty level."),
+    ("I-1640.pdf", "**I-1640 Specified Low-Income Medicare Beneficiary (SLMB)** SLMB covers Medicare Part B "
+                   "premiums for individuals with income between 100 and 120 percent of poverty."),
+    ("I-1650.pdf", "**I-1650 Qualifying Individual (QI-1)** Non-financial eligibility for the QI program "
+                   "requires entitlement to Medicare Part A."),
+    ("I-300.pdf", "**I-300 Application Processing** Applications for medical assistance are processed "
+                  "within 45 days of the date of application."),
+    ("I-1900.pdf", "**I-1900 Continued Medicaid** Continued Medicaid is provided when a recipient loses "
+                   "eligibility due to increased earnings."),
+]
+
+
+class _StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, handler_cls, config: Dict):
+        super().__init__(address, handler_cls)
+        self.config = config
+        self.stats = {"connections": 0, "requests": 0, "rate_limited": 0, "embedded_inputs": 0, "bytes_sent": 0}
+        self.stats_lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response (timeouts, cancellation) are expected here
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # Headers and body go out as separate writes; without this, Nagle + delayed ACK add ~40 ms
+        # to every response on a reused connection, which real servers don't
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.stats_lock:
+            self.server.stats["connections"] += 1
+        # Stand-in for the TCP + TLS handshake a real cloud endpoint costs per new connection
+        time.sleep(self.server.config.get("connect_delay", 0.0))
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def _send_json(self, payload: Dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _begin_request(self):
+        with self.server.stats_lock:
+            self.server.stats["requests"] += 1
+        time.sleep(self.server.config.get("latency", 0.0))
+
+
+class StubOpenAIHandler(_StubHandler):
+    """Serves /v1/embeddings, /v1/chat/completions (plain and streamed) and /v1/models."""
+
+    def do_GET(self):
+        self._begin_request()
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json({"object": "list", "data": [{"id": "gpt-4", "object": "model", "created": 0, "owned_by": "stub"}]})
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_POST(self):
+        self._begin_request()
+        request = self._read_json()
+        if self.path.endswith("/embeddings"):
+            self._handle_embeddings(request)
+        elif self.path.endswith("/chat/completions"):
+            self._handle_chat(request)
+        else:
+            self._send_json({"error": {"message": "not found"}}, status=404)
+
+    def _handle_embeddings(self, request: Dict):
+        # Injected throttling: a share of requests is refused the way the real API does past its limits
+        with self.server.stats_lock:
+            rng = self.server.config.setdefault("_rng", random.Random(0))
+            throttled = rng.random() < self.server.config.get("rate_limit_rate", 0.0)
+            if throttled:
+                self.server.stats["rate_limited"] += 1
+        if throttled:
+            body = json.dumps({"error": {"message": "Rate limit reached", "type": "requests",
+                                         "code": "rate_limit_exceeded"}}).encode("utf-8")
+            self.send_response(429)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Retry-After", str(self.server.config.get("retry_after", 0.2)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        with self.server.stats_lock:
+            self.server.stats["embedded_inputs"] += len(inputs)
+        dim = request.get("dimensions") or self.server.config.get("embedding_dim", EMBEDDING_DIM)
+        data = []
+        for i, text in enumerate(inputs):
+            if not isinstance(text, str):
+                # Token-id input (langchain pre-tokenizes); embed the ids as words
+                text = " ".join(str(t) for t in text)
+            vector = hash_embedding(text, dim)
+            if request.get("encoding_format") == "base64":
+                embedding = base64.b64encode(struct.pack(f"<{dim}f", *vector)).decode("ascii")
+            else:
+                embedding = vector
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        self._send_json({
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    def _handle_chat(self, request: Dict):
+        answer = self.server.config.get("answer", "Eligibility is determined from the provided policy context.")
+        model = request.get("model", "gpt-4")
+        if not request.get("stream"):
+            time.sleep(self.server.config.get("generation_delay", 0.0))
+            self._send_json({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": answer}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+            return
+
+        # Server-sent events, one chunk per word, spread over generation_delay
+        words = answer.split(" ")
+        per_token_delay = self.server.config.get("generation_delay", 0.0) / max(len(words), 1)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for i, word in enumerate(words):
+            time.sleep(per_token_delay)
+            delta = {"content": word if i == 0 else " " + word}
+            if i == 0:
+                delta["role"] = "assistant"
+            chunk = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        final = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                 "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        self.wfile.flush()
+        self.close_connection = True
+
+
+class StubQdrantHandler(_StubHandler):
+    """
+    Serves the Qdrant REST search endpoints over an in-memory list of points, plus collection
+    create/delete, payload index creation and point upsert/delete for ingest. With store_upserts=False upserted points
+    are only counted, so the stub's own memory doesn't grow with the corpus.
+    """
+
+    def do_GET(self):
+        self._begin_request()
+        path = self.path.split("?")[0]
+        if self.path in ("/", ""):
+            self._send_json({"title": "qdrant - vector search engine", "version": "1.12.0"})
+        elif path == "/aliases":
+            self._send_json({"result": {"aliases": []}, "status": "ok", "time": 0.0})
+        elif path.endswith("/exists"):
+            exists = self.server.config.get("collection_exists", True)
+            self._send_json({"result": {"exists": exists}, "status": "ok", "time": 0.0})
+        elif re.fullmatch(r"/collections/[^/]+/?", self.path.split("?")[0]):
+            self._send_json({"result": self._collection_info(), "status": "ok", "time": 0.0})
+        else:
+            self._send_json({"status": {"error": "not found"}}, status=404)
+
+    def _ok(self, result=True):
+        self._send_json({"result": result, "status": "ok", "time": 0.0})
+
+    def do_PUT(self):
+        self._begin_request()
+        request = self._read_json()
+        path = self.path.split("?")[0]
+        config = self.server.config
+        if path.endswith("/index"):
+            # Payload index create: searches here scan every point anyway
+            self._ok({"operation_id": 0, "status": "completed"})
+        elif path.endswith("/points"):
+            # Payload-only points (collection metadata records) have nothing to search
+            upserted = [point for point in request.get("points", []) if point.get("vector")]
+            with self.server.stats_lock:
+                config["upserted"] = config.get("upserted", 0) + len(upserted)
+                if config.get("store_upserts", True):
+                    ids = {point["id"] for point in upserted}
+                    config["points"] = [p for p in config["points"] if p[0] not in ids] + [
+                        (point["id"], point["vector"], point.get("payload") or {}) for point in upserted]
+            self._ok({"operation_id": 0, "status": "completed"})
+        elif request.get("vectors") == {}:
+            # Payload-only collection, e.g. collection metadata: nothing to serve
+            self._ok()
+        else:
+            # Collection create (or update): start empty
+            with self.server.stats_lock:
+                config["collection_exists"] = True
+                config["points"] = []
+            self._ok()
+
+    def do_DELETE(self):
+        self._begin_request()
+        self._read_json()
+        with self.server.stats_lock:
+            self.server.config["collection_exists"] = False
+            self.server.config["points"] = []
+        self._ok()
+
+    def _delete_points(self, request: Dict) -> Dict:
+        ids = set(request.get("points", []))
+        with self.server.stats_lock:
+            self.server.config["points"] = [p for p in self.server.config["points"] if p[0] not in ids]
+        return {"operation_id": 0, "status": "completed"}
+
+    def _collection_info(self) -> Dict:
+        points = self.server.config["points"]
+        dim = len(points[0][1]) if points else EMBEDDING_DIM
+        return {
+            "status": "green",
+            "optimizer_status": "ok",
+            "points_count": len(points),
+            "indexed_vectors_count": len(points),
+            "segments_count": 1,
+            "config": {
+                "params": {"vectors": {"size": dim, "distance": "Cosine"}, "shard_number": 1,
+                           "replication_factor": 1, "write_consistency_factor": 1, "on_disk_payload": True},
+                "hnsw_config": {"m": 16, "ef_construct": 100, "full_scan_threshold": 10000,
+                                "max_indexing_threads": 0, "on_disk": False},
+                "optimizer_config": {"deleted_threshold": 0.2, "vacuum_min_vector_number": 1000,
+                                     "default_segment_number": 0, "indexing_threshold": 20000,
+                                     "flush_interval_sec": 5},
+                "wal_config": {"wal_capacity_mb": 32, "wal_segments_ahead": 0},
+            },
+            "payload_schema": {},
+        }
+
+    def do_POST(self):
+        self._begin_request()
+        request = self._read_json()
+        path = self.path.split("?")[0]
+        if path.endswith("/points/search"):
+            result = self._search(request.get("vector"), request.get("limit", 10))
+        elif path.endswith("/points/query"):
+            result = {"points": self._search(request.get("query"), request.get("limit", 10))}
+        elif path.endswith("/points/search/batch"):
+            result = [self._search(s.get("vector"), s.get("limit", 10)) for s in request.get("searches", [])]
+        elif path.endswith("/points/query/batch"):
+            result = [{"points": self._search(s.get("query"), s.get("limit", 10))} for s in request.get("searches", [])]
+        elif path.endswith("/points/delete"):
+            result = self._delete_points(request)
+        elif path.endswith("/points"):
+            # Retrieve by id: the stub only looks points up through search and scroll
+            result = []
+        elif path.endswith("/points/scroll"):
+            points = [{"id": point_id, "payload": payload} for point_id, _, payload in self.server.config["points"]]
+            result = {"points": points, "next_page_offset": None}
+        else:
+            self._send_json({"status": {"error": "not found"}}, status=404)
+            return
+        self._send_json({"result": result, "status": "ok", "time": 0.0})
+
+    def _search(self, vector, limit: int) -> List[Dict]:
+        if isinstance(vector, dict):
+            # Query API form {"nearest": [...]} or named vector form {"name": ..., "vector": [...]}
+            vector = vector.get("nearest", vector.get("vector"))
+        scored = []
+        for point_id, point_vector, payload in self.server.config["points"]:
+            score = sum(a * b for a, b in zip(vector, point_vector))
+            scored.append((score, point_id, payload))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [{"id": point_id, "version": 0, "score": score, "payload": payload}
+                for score, point_id, payload in scored[:limit]]
+
+
+class StubFileHandler(_StubHandler):
+    """
+    Serves a fixed {path: bytes} mapping, e.g. a local mirror of the LDH PDF directory, with an ETag
+    and Last-Modified on every file, answering matching conditional GETs with 304. Bodies are
+    written in blocks and counted in stats["bytes_sent"].
+    """
+
+    LAST_MODIFIED = "Mon, 06 Jan 2025 00:00:00 GMT"
+
+    CONTENT_TYPES = {".pdf": "application/pdf", ".html": "text/html; charset=utf-8"}
+
+    def do_GET(self):
+        self._begin_request()
+        path = self.path.split("?")[0]
+        body = self.server.config["files"].get(path)
+        if body is None:
+            self._send_json({"error": "not found"}, status=404)
+            return
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        last_modified = self.server.config.get("last_modified", self.LAST_MODIFIED)
+        # If-None-Match takes precedence over If-Modified-Since, as in RFC 9110
+        if_none_match = self.headers.get("If-None-Match")
+        if (if_none_match == etag if if_none_match is not None
+                else self.headers.get("If-Modified-Since") == last_modified):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        extension = os.path.splitext(path)[1]
+        # Extension-less paths are site pages, like /page/1681 on the LDH site
+        self.send_header("Content-Type", self.CONTENT_TYPES.get(extension or ".html", "application/octet-stream"))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for i in range(0, len(body), 1 << 16):
+            self.wfile.write(body[i:i + (1 << 16)])
+        with self.server.stats_lock:
+            self.server.stats["bytes_sent"] += len(body)
+
+
+def make_points(chunks: List[Tuple[str, str]] = None, dim: int = EMBEDDING_DIM) -> List[Tuple]:
+    """Builds stub Qdrant points in the LangChain payload layout from (file_name, text) pairs."""
+    points = []
+    for i, (file_name, text) in enumerate(chunks or SAMPLE_CHUNKS):
+        page_content = f"File: {file_name}\nPages: 1\n\n{text}"
+        payload = {"page_content": page_content, "metadata": {"file_name": file_name}}
+        points.append((i, hash_embedding(page_content, dim), payload))
+    return points
+
+
+def start_server(handler_cls, **config) -> Tuple[_StubServer, str]:
+    """Starts a stub server on a free localhost port in a daemon thread; returns (server, base_url)."""
+    server = _StubServer(("127.0.0.1", 0), handler_cls, config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_openai_stub(**config) -> Tuple[_StubServer, str]:
+    """Starts the OpenAI stub; the returned base_url already includes /v1."""
+    server, url = start_server(StubOpenAIHandler, **config)
+    return server, url + "/v1"
+
+
+def start_file_server(files: Dict[str, bytes], **config) -> Tuple[_StubServer, str]:
+    """Starts a static file server for `files`, keyed by URL path (e.g. "/assets/I-1630.pdf")."""
+    return start_server(StubFileHandler, files=files, **config)
+
+
+def start_qdrant_stub(points: List[Tuple] = None, **config) -> Tuple[_StubServer, str]:
+    """Starts the Qdrant stub serving `points` (defaults to SAMPLE_CHUNKS)."""
+    return start_server(StubQdrantHandler, points=points if points is not None else make_points(), **config)
@@ -0,0 +1,156 @@
+import os
+import re
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from qdrant_client.models import (CollectionStatus, CreateAlias, CreateAliasOperation, DeleteAlias,
+                                  DeleteAliasOperation, SearchParams)
+
+# Versioned collections behind an alias.
+# A full rebuild used to drop and recreate `medicaid_app` in place, so the app answered from an
+# empty or half-loaded collection for as long as ingest ran. Now `medicaid_app` is a Qdrant alias:
+# a rebuild loads a new `medicaid_app_v<UTC timestamp>` collection next to the live one, waits for
+# Qdrant to finish indexing it, warms it up, checks it (size against the live version, HNSW recall
+# against exact search on vectors sampled from it), and only then repoints the alias in one atomic
+# request. The query handlers search the alias and never see the switch. Old versions past
+# COLLECTION_KEEP_VERSIONS (the live one included) are deleted afterwards; the ones kept are there
+# to switch back to.
+
+# Versions to keep, the live one included; 2 leaves the previous version around for a rollback
+COLLECTION_KEEP_VERSIONS = int(os.getenv("COLLECTION_KEEP_VERSIONS", "2"))
+# Smoke check: sampled points, neighbours compared per search, and the thresholds a new version must meet
+SMOKE_CHECK_SAMPLES = int(os.getenv("SMOKE_CHECK_SAMPLES", "20"))
+SMOKE_CHECK_K = 5
+SMOKE_CHECK_MIN_RECALL = float(os.getenv("SMOKE_CHECK_MIN_RECALL", "0.9"))
+# A new version with fewer points than this fraction of the live one is treated as a broken ingest
+SMOKE_CHECK_MIN_SIZE_RATIO = float(os.getenv("SMOKE_CHECK_MIN_SIZE_RATIO", "0.5"))
+
+
+def version_name(alias: str, now: Optional[float] = None) -> str:
+    """Name for a new version of `alias`, e.g. medicaid_app_v20250106093000 (sorts by creation time)."""
+    return f"{alias}_v{time.strftime('%Y%m%d%H%M%S', time.gmtime(now))}"
+
+
+def list_versions(qdrant_client, alias: str) -> List[str]:
+    """Every version collection of `alias`, oldest first."""
+    pattern = re.compile(rf"^{re.escape(alias)}_v\d+$")
+    return sorted(c.name for c in qdrant_client.get_collections().collections if pattern.match(c.name))
+
+
+def resolve_alias(qdrant_client, alias: str) -> Optional[str]:
+    """The collection `alias` points at, or None if there is no such alias."""
+    for description in qdrant_client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def live_collection(qdrant_client, alias: str) -> Optional[str]:
+    """
+    The collection searches of `alias` currently hit: the alias target, or a plain collection of
+    that name (the layout before aliases), or None if there is neither.
+    """
+    target = resolve_alias(qdrant_client, alias)
+    if target is not None:
+        return target
+    return alias if qdrant_client.collection_exists(alias) else None
+
+
+def wait_until_ready(qdrant_client, collection_name: str, timeout: float = 600, poll_interval: float = 2.0) -> bool:
+    """Waits for Qdrant to finish optimizing (indexing) a collection; False if it still hadn't after `timeout`."""
+    deadline = time.monotonic() + timeout
+    while True:
+        if qdrant_client.get_collection(collection_name).status == CollectionStatus.GREEN:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll_interval)
+
+
+def _sample_vectors(qdrant_client, collection_name: str, samples: int) -> List:
+    # Point ids are uuid5 of the content, so the first ids in order are a spread over every file
+    points, _ = qdrant_client.scroll(collection_name=collection_name, limit=samples, with_payload=False,
+                                     with_vectors=True)
+    return points
+
+
+def warm_up(qdrant_client, collection_name: str, samples: int = SMOKE_CHECK_SAMPLES, rounds: int = 2) -> None:
+    """Runs searches with vectors from the collection, so its index and storage are loaded before it serves users."""
+    for point in _sample_vectors(qdrant_client, collection_name, samples) * rounds:
+        qdrant_client.search(collection_name=collection_name, query_vector=point.vector, limit=SMOKE_CHECK_K)
+
+
+def smoke_check(qdrant_client, collection_name: str, live_collection_name: Optional[str] = None,
+                samples: int = SMOKE_CHECK_SAMPLES, k: int = SMOKE_CHECK_K, min_recall: float = SMOKE_CHECK_MIN_RECALL,
+                min_size_ratio: float = SMOKE_CHECK_MIN_SIZE_RATIO) -> Dict:
+    """
+    Checks a new version before it goes live: it has points, not far fewer than the live version,
+    and HNSW search on sampled vectors agrees with exact search (recall@k) and finds each sampled
+    point itself. Returns the measurements with "ok" and, if not ok, the "reason".
+    """
+    points_count = qdrant_client.get_collection(collection_name).points_count or 0
+    report = {"collection": collection_name, "points": points_count, "ok": False}
+    if live_collection_name and live_collection_name != collection_name:
+        report["live_points"] = qdrant_client.get_collection(live_collection_name).points_count or 0
+    if not points_count:
+        report["reason"] = "the collection is empty"
+        return report
+    if points_count < report.get("live_points", 0) * min_size_ratio:
+        report["reason"] = f"{points_count} points against {report['live_points']} in the live collection"
+        return report
+
+    recalls, self_hits, latencies = [], 0, []
+    sampled = _sample_vectors(qdrant_client, collection_name, samples)
+    for point in sampled:
+        start = time.perf_counter()
+        approximate = qdrant_client.search(collection_name=collection_name, query_vector=point.vector, limit=k)
+        latencies.append(time.perf_counter() - start)
+        exact = qdrant_client.search(collection_name=collection_name, query_vector=point.vector, limit=k,
+                                     search_params=SearchParams(exact=True))
+        approximate_ids, exact_ids = {hit.id for hit in approximate}, {hit.id for hit in exact}
+        recalls.append(len(approximate_ids & exact_ids) / max(len(exact_ids), 1))
+        self_hits += point.id in approximate_ids
+    report.update(recall_at_k=round(statistics.mean(recalls), 3), self_hit_rate=round(self_hits / len(sampled), 3),
+                  search_ms=round(statistics.mean(latencies) * 1000, 2), k=k, samples=len(sampled))
+    if report["recall_at_k"] < min_recall:
+        report["reason"] = f"recall@{k} {report['recall_at_k']} is below {min_recall}"
+    elif report["self_hit_rate"] < min_recall:
+        report["reason"] = f"only {report['self_hit_rate']:.0%} of sampled points find themselves"
+    else:
+        report["ok"] = True
+    return report
+
+
+def swap_alias(qdrant_client, alias: str, collection_name: str) -> Optional[str]:
+    """
+    Points `alias` at `collection_name` in one atomic request and returns the collection it pointed at before.
+    A plain collection named like the alias (the layout before aliases) is deleted first, which is
+    the only moment searches can fail; that happens once, on the first swap.
+    """
+    previous = resolve_alias(qdrant_client, alias)
+    operations = []
+    if previous is not None:
+        operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    elif qdrant_client.collection_exists(alias):
+        print(f"Replacing collection '{alias}' with an alias of the same name...")
+        qdrant_client.delete_collection(alias)
+        previous = alias
+    operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection_name, alias_name=alias)))
+    qdrant_client.update_collection_aliases(change_aliases_operations=operations)
+    return previous
+
+
+def garbage_collect(qdrant_client, alias: str, keep: int = COLLECTION_KEEP_VERSIONS) -> List[str]:
+    """Deletes all but the newest `keep` versions of `alias`, never the live one; returns the names deleted."""
+    live = resolve_alias(qdrant_client, alias)
+    if live is None:
+        return []
+    versions = list_versions(qdrant_client, alias)
+    # Versions newer than the live one are leftovers of rebuilds that never went live
+    older = [v for v in versions if v < live]
+    kept = {live} | set(older[-(keep - 1):] if keep > 1 else [])
+    deleted = [v for v in versions if v not in kept]
+    for name in deleted:
+        qdrant_client.delete_collection(name)
+    return deleted
@@ -0,0 +1,134 @@
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from qdrant_client.models import (BinaryQuantization, BinaryQuantizationConfig, Distance, HnswConfigDiff,
+                                  QuantizationSearchParams, ScalarQuantization, ScalarQuantizationConfig,
+                                  ScalarType, SearchParams, VectorParams)
+
+# Collection profiles.
+# Ingest used to create the collection with Qdrant's defaults: full float32 vectors and the
+# HNSW graph in RAM, with no quantization. A profile bundles the settings that trade memory,
+# latency and recall against each other:
+#   quantization   "scalar" (int8, 4x smaller) or "binary" (1 bit per dimension, 32x smaller),
+#                  kept in RAM, with the top candidates rescored on the original vectors
+#   hnsw_m / hnsw_ef_construct   graph degree and build-time beam width
+#   hnsw_ef        search-time beam width, sent with every query
+#   on_disk_vectors / on_disk_payload   leave originals and payloads on disk (mmap), which only
+#                  rescoring and result payloads read
+# Ingest creates the collection from the profile in COLLECTION_PROFILE (or --profile). The
+# handlers get their search params from the settings the live collection was created with, so
+# searches match the index even when the two sides were started with different profiles.
+# benchmarks/bench_collection_profiles.py measures recall@k, latency and memory per profile.
+
+COLLECTION_PROFILE = os.getenv("COLLECTION_PROFILE", "default")
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    name: str
+    quantization: Optional[str] = None
+    # Candidates fetched per result from the quantized index before rescoring
+    oversampling: float = 2.0
+    rescore: bool = True
+    hnsw_m: Optional[int] = None
+    hnsw_ef_construct: Optional[int] = None
+    hnsw_ef: Optional[int] = None
+    on_disk_vectors: bool = False
+    on_disk_payload: bool = False
+
+    def vectors_config(self, dim: int) -> VectorParams:
+        return VectorParams(size=dim, distance=Distance.COSINE, on_disk=self.on_disk_vectors or None)
+
+    def hnsw_config(self) -> Optional[HnswConfigDiff]:
+        if self.hnsw_m is None and self.hnsw_ef_construct is None:
+            return None
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self):
+        if self.quantization == "scalar":
+            return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99,
+                                                                      always_ram=True))
+        if self.quantization == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+        return None
+
+    def search_params(self) -> Optional[SearchParams]:
+        """Params for searches of a collection created with this profile (None: Qdrant's defaults)."""
+        quantization = QuantizationSearchParams(rescore=self.rescore, oversampling=self.oversampling) \
+            if self.quantization else None
+        if quantization is None and self.hnsw_ef is None:
+            return None
+        return SearchParams(hnsw_ef=self.hnsw_ef, quantization=quantization)
+
+    def create_collection(self, qdrant_client, collection_name: str, dim: int) -> None:
+        qdrant_client.create_collection(
+            collection_name,
+            vectors_config=self.vectors_config(dim),
+            hnsw_config=self.hnsw_config(),
+            quantization_config=self.quantization_config(),
+            on_disk_payload=self.on_disk_payload or None,
+        )
+
+
+PROFILES: Dict[str, CollectionProfile] = {
+    # What Qdrant.from_documents created: float32 vectors and HNSW graph in RAM, default m=16 / ef_construct=100
+    "default": CollectionProfile("default"),
+    # Bigger graph and search beam: best recall, most memory
+    "accurate": CollectionProfile("accurate", hnsw_m=32, hnsw_ef_construct=256, hnsw_ef=256),
+    # int8 vectors in RAM, originals and payloads on disk: ~4x less RAM at nearly the same recall
+    "scalar": CollectionProfile("scalar", quantization="scalar", oversampling=2.0, hnsw_m=16, hnsw_ef_construct=128,
+                                hnsw_ef=128, on_disk_vectors=True, on_disk_payload=True),
+    # 1-bit vectors in RAM: ~32x less RAM; needs more oversampling to hold recall
+    "binary": CollectionProfile("binary", quantization="binary", oversampling=3.0, hnsw_m=16, hnsw_ef_construct=128,
+                                hnsw_ef=128, on_disk_vectors=True, on_disk_payload=True),
+}
+
+
+def get_profile(name: str = None) -> CollectionProfile:
+    name = name or COLLECTION_PROFILE
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"Unknown collection profile: '{name}'. Use one of: {', '.join(PROFILES)}.") from None
+
+
+def profile_of_collection(qdrant_client, collection_name: str) -> CollectionProfile:
+    """
+    The profile a collection (or alias) was created with, recognised from its quantization and
+    HNSW settings; COLLECTION_PROFILE if it matches none of them.
+    """
+    config = qdrant_client.get_collection(collection_name).config
+    quantization = config.quantization_config
+    kind = "scalar" if isinstance(quantization, ScalarQuantization) else \
+        "binary" if isinstance(quantization, BinaryQuantization) else None
+    hnsw = config.hnsw_config
+    for profile in PROFILES.values():
+        if profile.quantization == kind and hnsw.m == (profile.hnsw_m or 16) \
+                and hnsw.ef_construct == (profile.hnsw_ef_construct or 100):
+            return profile
+    return get_profile()
+
+
+def get_search_params(qdrant_client, collection_name: str) -> Optional[SearchParams]:
+    """
+    Search params matching the collection's profile, read again every EMBEDDING_RECHECK_SECONDS
+    (like the collection's embedding) so a running app follows an alias switch to a collection
+    built with another profile.
+    """
+    import resource_registry
+    from embedding_providers import EMBEDDING_RECHECK_SECONDS
+
+    # Per process and client, like the query embedding; cleared with the registry
+    state = resource_registry.get_or_create(("search_params", collection_name, id(qdrant_client)), dict)
+    if state and time.monotonic() - state["checked_at"] < EMBEDDING_RECHECK_SECONDS:
+        return state["search_params"]
+    try:
+        search_params = profile_of_collection(qdrant_client, collection_name).search_params()
+    except Exception as e:
+        print(f"Could not read the settings of collection '{collection_name}': {e}")
+        # Keep what was read before, or COLLECTION_PROFILE's, until the next check
+        search_params = state["search_params"] if state else get_profile().search_params()
+    state.update(search_params=search_params, checked_at=time.monotonic())
+    return search_params
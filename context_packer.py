@@ -0,0 +1,134 @@
+import os
+import re
+from typing import Dict, List, Tuple
+
+# Token-budgeted context packing.
+# The retrieved chunks used to be concatenated as-is: each repeats its own "File:/Pages:" header,
+# chunks from one section overlap or repeat boilerplate, and nothing capped the prompt size.
+# The packer walks chunks best-first, drops paragraphs already sent (exactly or nearly),
+# and cuts a chunk off at the first paragraph that would overrun the token budget. Tokens are
+# counted with the gpt-4 tokenizer (tiktoken) so the budget matches what the API bills.
+
+# Set CONTEXT_PACKING=0 to send the retrieved chunks concatenated as-is
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "1") != "0"
+# Room for the baseline's whole context, RERANK_MAX_K=3 chunks at ingest's 5000-character limit
+# (about 3750 tokens with their headers), so packing only removes duplicates unless this is lowered
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "4000"))
+# Paragraphs whose word-shingle Jaccard similarity reaches this are treated as duplicates
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_NEAR_DUPLICATE_THRESHOLD", "0.85"))
+TOKENIZER_MODEL = "gpt-4"
+
+_HEADER_PATTERN = re.compile(r"^File: (?P<file>[^\n]*)\nPages: (?P<pages>[^\n]*)\n*")
+_PARAGRAPH_SPLIT = re.compile(r"\n\s*\n")
+_SEPARATOR_ONLY = re.compile(r"^[\s\-_=*|]*$")
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """The tiktoken encoding for TOKENIZER_MODEL, or None if tiktoken or its data is unavailable."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+        except Exception as e:
+            print(f"tiktoken unavailable ({e}); estimating tokens as characters / 4.")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _normalize(paragraph: str) -> str:
+    return re.sub(r"\s+", " ", paragraph).strip().lower()
+
+
+def _shingles(normalized: str, size: int = 5) -> frozenset:
+    words = normalized.split(" ")
+    if len(words) <= size:
+        return frozenset([normalized])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    # Jaccard can't exceed the size ratio, so skip the set operations for clearly different lengths
+    if min(len(a), len(b)) < NEAR_DUPLICATE_THRESHOLD * max(len(a), len(b)):
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def pack_context(chunks: List[Dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, List[str], Dict]:
+    """
+    Packs chunks into a prompt context.
+    Each chunk is a dict with "text" (prompt text, optionally starting with the File:/Pages: header),
+    "file_name" and optionally "score" (higher is better; chunks without one keep their order).
+    Returns (context_str, file_names that made it into the context, stats).
+    """
+    ordered = sorted(enumerate(chunks), key=lambda item: (-item[1].get("score", 0.0), item[0]))
+
+    seen_exact = set()
+    kept_shingles: List[frozenset] = []
+    sections = []
+    used_files = []
+    tokens_used = 0
+    stats = {"paragraphs_in": 0, "duplicates_dropped": 0, "over_budget_dropped": 0}
+
+    for _, chunk in ordered:
+        text = chunk["text"]
+        file_name = chunk.get("file_name", "N/A")
+        label = f"Source (File: {file_name}):"
+        header = _HEADER_PATTERN.match(text)
+        if header:
+            # Fold the per-chunk header into the source label instead of repeating it as text
+            label = f"Source (File: {header.group('file')}, Pages: {header.group('pages')}):"
+            text = text[header.end():]
+
+        label_tokens = count_tokens(label + "\n---\n")
+        candidates = [p for p in _PARAGRAPH_SPLIT.split(text) if not _SEPARATOR_ONLY.match(p)]
+        stats["paragraphs_in"] += len(candidates)
+        paragraphs = []
+        for position, paragraph in enumerate(candidates):
+            normalized = _normalize(paragraph)
+            shingles = _shingles(normalized)
+            if normalized in seen_exact or any(_jaccard(shingles, kept) >= NEAR_DUPLICATE_THRESHOLD
+                                               for kept in kept_shingles):
+                stats["duplicates_dropped"] += 1
+                continue
+            cost = count_tokens(paragraph + "\n\n")
+            # The chunk's label is only paid for once it contributes its first paragraph
+            if tokens_used + cost + (0 if paragraphs else label_tokens) > token_budget:
+                # The rest of the chunk goes too: later paragraphs without this one would read out of context
+                stats["over_budget_dropped"] += len(candidates) - position
+                break
+            seen_exact.add(normalized)
+            kept_shingles.append(shingles)
+            if not paragraphs:
+                tokens_used += label_tokens
+            tokens_used += cost
+            paragraphs.append(paragraph.strip())
+
+        if paragraphs:
+            sections.append(f"{label}\n" + "\n\n".join(paragraphs) + "\n---\n")
+            used_files.append(file_name)
+
+    context_str = "".join(sections)
+    stats["context_tokens"] = count_tokens(context_str)
+    return context_str, used_files, stats
+
+
+def build_prompt_context(chunks: List[Dict]) -> Tuple[str, List[str]]:
+    """Context string and contributing file names for the handlers, packed unless CONTEXT_PACKING is off."""
+    if CONTEXT_PACKING:
+        context_str, used_files, _ = pack_context(chunks)
+        return context_str, used_files
+    context_str = "".join(f"Source (File: {c.get('file_name', 'N/A')}):\n{c['text']}\n---\n" for c in chunks)
+    return context_str, [c.get("file_name", "N/A") for c in chunks]
@@ -0,0 +1,155 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Exact-match cache of question embeddings.
+# Every question used to cost an embeddings API round trip before the search could even
+# start, including exact repeats. Vectors are stored as compact float32 (or float16) blobs
+# in SQLite, keyed by (model, normalized question text), and the least recently used rows
+# are evicted once the cache grows past `max_entries`.
+
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "query_embedding_cache.sqlite3")
+QUERY_EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_ENTRIES", "50000"))
+QUERY_EMBEDDING_CACHE_DTYPE = os.getenv("QUERY_EMBEDDING_CACHE_DTYPE", "float32")
+# Hits only update last_used in memory; the buffered times are written at most this often, or on the next put
+QUERY_EMBEDDING_CACHE_TOUCH_FLUSH_SECONDS = float(os.getenv("QUERY_EMBEDDING_CACHE_TOUCH_FLUSH_SECONDS", "30"))
+
+
+def normalize_query(text: str) -> str:
+    """Case-folds and collapses whitespace so trivially different spellings share one entry."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class QueryEmbeddingCache:
+    """SQLite-backed (model, normalized text) -> vector cache with LRU eviction."""
+
+    def __init__(self, db_path: str = QUERY_EMBEDDING_CACHE_PATH, max_entries: int = QUERY_EMBEDDING_CACHE_MAX_ENTRIES,
+                 dtype: str = QUERY_EMBEDDING_CACHE_DTYPE):
+        if dtype not in ("float32", "float16"):
+            raise ValueError("dtype must be 'float32' or 'float16'.")
+        self.dtype = np.dtype(dtype)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_embeddings (
+                model TEXT NOT NULL,
+                query TEXT NOT NULL,
+                dtype TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, query)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_query_embeddings_last_used ON query_embeddings (last_used)")
+        self._conn.commit()
+        # Kept up to date by put() and _evict(), so a put needn't count the table
+        self._count = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        # (model, query) -> last_used of hits not yet written to the database
+        self._touched = {}
+        self._touches_flushed_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, text: str, model: str) -> Optional[List[float]]:
+        key = normalize_query(text)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT dtype, vector FROM query_embeddings WHERE model = ? AND query = ?", (model, key)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touched[(model, key)] = time.time()
+            if time.monotonic() - self._touches_flushed_at >= QUERY_EMBEDDING_CACHE_TOUCH_FLUSH_SECONDS:
+                self._flush_touches()
+                self._conn.commit()
+        return np.frombuffer(row[1], dtype=row[0]).astype(np.float32).tolist()
+
+    def put(self, text: str, model: str, vector: List[float]) -> None:
+        blob = np.asarray(vector, dtype=self.dtype).tobytes()
+        key = normalize_query(text)
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO query_embeddings VALUES (?, ?, ?, ?, ?)",
+                (model, key, self.dtype.name, blob, time.time()),
+            ).rowcount
+            if inserted:
+                self._count += 1
+            else:
+                self._conn.execute(
+                    "UPDATE query_embeddings SET dtype = ?, vector = ?, last_used = ? WHERE model = ? AND query = ?",
+                    (self.dtype.name, blob, time.time(), model, key),
+                )
+            self._touched.pop((model, key), None)
+            # Eviction goes by last_used, so pending hits are written first
+            self._flush_touches()
+            self._evict()
+            self._conn.commit()
+
+    def _flush_touches(self) -> None:
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE query_embeddings SET last_used = ? WHERE model = ? AND query = ?",
+                [(last_used, model, key) for (model, key), last_used in self._touched.items()],
+            )
+            self._touched.clear()
+        self._touches_flushed_at = time.monotonic()
+
+    def _evict(self) -> None:
+        """Drops the least recently used rows, leaving 10% headroom so eviction runs rarely."""
+        if self._count <= self.max_entries:
+            return
+        # Other processes may share the file, so count for real before deleting
+        count = self._conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+        excess = max(count - int(self.max_entries * 0.9), 0)
+        self._conn.execute(
+            "DELETE FROM query_embeddings WHERE rowid IN "
+            "(SELECT rowid FROM query_embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self._count = count - excess
+
+    def get_or_compute(self, text: str, model: str, compute: Callable[[str], List[float]]) -> List[float]:
+        """Returns the cached vector, calling `compute(text)` and caching its result only on a miss."""
+        vector = self.get(text, model)
+        if vector is None:
+            vector = compute(text)
+            self.put(text, model, vector)
+        return vector
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """LangChain Embeddings wrapper that serves embed_query from a QueryEmbeddingCache."""
+
+    def __init__(self, embeddings: Embeddings, cache: QueryEmbeddingCache, model: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.cache.get_or_compute(text, self.model, self.embeddings.embed_query)
+
+
+def get_shared_cache() -> QueryEmbeddingCache:
+    """Returns the process-wide query embedding cache."""
+    import resource_registry
+
+    key = ("query_embedding_cache", QUERY_EMBEDDING_CACHE_PATH)
+    return resource_registry.get_or_create(key, lambda: QueryEmbeddingCache(QUERY_EMBEDDING_CACHE_PATH))
@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from qdrant_client.models import PointIdsList, PointStruct
+
+# Embedding providers.
+# Ingest and the query handlers each called text-embedding-ada-002 by name, so the index was
+# tied to 1536-d vectors and nothing checked that questions were embedded like the chunks.
+# An EmbeddingProvider embeds texts for both sides:
+#   openai   the embeddings API; text-embedding-3-* models return shortened vectors on request
+#            (`dimensions`, e.g. 512 or 256 instead of 1536), shrinking the index and every search
+#   local    a sentence-transformers model run on the CPU (`pip install sentence-transformers`);
+#            no API calls, vectors optionally truncated and renormalized
+#   hashing  feature hashing of words and character trigrams: deterministic, offline and
+#            model-free, for tests and benchmarks rather than for answering questions
+# Ingest embeds with EMBEDDING (or --embedding) and records the provider, model and dimensions
+# of each collection it builds in the COLLECTION_METADATA_NAME collection, one payload-only point
+# per collection (qdrant-client 1.12 can't set metadata on the collection itself), which also
+# carries the content version ingest records when it finishes (answer_cache.py). The handlers
+# embed questions with whatever the collection they search was recorded with, so a rebuild with
+# another model can't leave queries and index mismatched.
+# benchmarks/bench_embedding_providers.py compares index size, search latency and recall.
+
+EMBEDDING = os.getenv("EMBEDDING", "ada-002")
+COLLECTION_METADATA_NAME = os.getenv("COLLECTION_METADATA_NAME", "collection_metadata")
+# Seconds a collection's recorded embedding is trusted before the handlers read it again
+EMBEDDING_RECHECK_SECONDS = float(os.getenv("EMBEDDING_RECHECK_SECONDS", "300"))
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+
+# Native vector sizes of the OpenAI models; only the text-embedding-3 models can be shortened
+OPENAI_DIMENSIONS = {
+    "text-embedding-ada-002": 1536,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+}
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _hash_features(text: str) -> Counter:
+    words = _TOKEN_PATTERN.findall(text.casefold())
+    features = Counter(words)
+    for word in words:
+        padded = f"#{word}#"
+        features.update(f"#3{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def hashing_vector(text: str, dimensions: int) -> List[float]:
+    """Unit vector of signed, sublinearly weighted word and character-trigram hashes."""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, count in _hash_features(text).items():
+        # A stable digest, since Python's hash() is salted per process
+        digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+        vector[digest % dimensions] += (1.0 + math.log(count)) * (1.0 if digest >> 63 else -1.0)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+_model_lock = threading.Lock()
+
+
+def _sentence_transformer(model: str):
+    import resource_registry
+
+    def build():
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("Local embeddings need sentence-transformers: "
+                              "`pip install sentence-transformers`") from None
+        return SentenceTransformer(model, device="cpu")
+
+    return resource_registry.get_or_create(("sentence_transformer", model), build)
+
+
+@dataclass(frozen=True)
+class EmbeddingProvider:
+    kind: str
+    model: str
+    dimensions: int
+
+    @property
+    def native(self) -> bool:
+        """True when vectors are the model's full size (the only option for ada-002)."""
+        return OPENAI_DIMENSIONS.get(self.model) == self.dimensions
+
+    @property
+    def cache_key(self) -> str:
+        """Model name for the embedding caches; shortened vectors are cached apart from full ones."""
+        return self.model if self.native else f"{self.model}@{self.dimensions}"
+
+    def to_payload(self) -> Dict:
+        return {"kind": self.kind, "model": self.model, "dimensions": self.dimensions}
+
+    @classmethod
+    def from_payload(cls, payload: Dict) -> "EmbeddingProvider":
+        return cls(payload["kind"], payload["model"], int(payload["dimensions"]))
+
+    def _openai_kwargs(self) -> Dict:
+        return {} if self.native else {"dimensions": self.dimensions}
+
+    def _embed_locally(self, texts: List[str]) -> List[List[float]]:
+        if self.kind == "hashing":
+            return [hashing_vector(text, self.dimensions) for text in texts]
+        model = _sentence_transformer(self.model)
+        # One encode at a time; the model already uses every core
+        with _model_lock:
+            vectors = model.encode(list(texts), batch_size=LOCAL_EMBEDDING_BATCH_SIZE, convert_to_numpy=True)
+        return _normalize_rows(np.asarray(vectors, dtype=np.float32)[:, :self.dimensions]).tolist()
+
+    def embed(self, texts: List[str], openai_client=None) -> List[List[float]]:
+        """Vectors for `texts`, in order. The OpenAI provider sends one request through `openai_client`."""
+        if self.kind != "openai":
+            return self._embed_locally(texts)
+        response = openai_client.embeddings.create(model=self.model, input=texts, **self._openai_kwargs())
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def aembed(self, texts: List[str], async_openai_client=None) -> List[List[float]]:
+        """embed() for the asyncio handlers; local models run on a worker thread."""
+        if self.kind != "openai":
+            return await asyncio.to_thread(self._embed_locally, texts)
+        response = await async_openai_client.embeddings.create(model=self.model, input=texts,
+                                                               **self._openai_kwargs())
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    def langchain_embeddings(self, openai_api_key: str) -> Embeddings:
+        """LangChain Embeddings producing the same vectors, for the LangChain vector stores."""
+        if self.kind == "openai":
+            import resource_registry
+            return resource_registry.get_embeddings(self.model, openai_api_key,
+                                                    dimensions=self._openai_kwargs().get("dimensions"))
+        return ProviderEmbeddings(self)
+
+
+class ProviderEmbeddings(Embeddings):
+    """LangChain Embeddings over a local or hashing EmbeddingProvider."""
+
+    def __init__(self, provider: EmbeddingProvider):
+        self.provider = provider
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.provider.embed(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.provider.embed([text])[0]
+
+
+EMBEDDINGS: Dict[str, EmbeddingProvider] = {
+    # What the collection has always been built with
+    "ada-002": EmbeddingProvider("openai", "text-embedding-ada-002", 1536),
+    "3-small": EmbeddingProvider("openai", "text-embedding-3-small", 1536),
+    # Shortened text-embedding-3-small vectors: 3x / 6x smaller index, a little recall lost
+    "3-small-512": EmbeddingProvider("openai", "text-embedding-3-small", 512),
+    "3-small-256": EmbeddingProvider("openai", "text-embedding-3-small", 256),
+    "3-large-1024": EmbeddingProvider("openai", "text-embedding-3-large", 1024),
+    # Small CPU model, no API calls
+    "minilm": EmbeddingProvider("local", "sentence-transformers/all-MiniLM-L6-v2", 384),
+    # Offline tests and benchmarks only
+    "hashing": EmbeddingProvider("hashing", "hashing", 512),
+}
+
+
+def get_embedding(name: str = None) -> EmbeddingProvider:
+    name = name or EMBEDDING
+    try:
+        return EMBEDDINGS[name]
+    except KeyError:
+        raise ValueError(f"Unknown embedding: '{name}'. Use one of: {', '.join(EMBEDDINGS)}.") from None
+
+
+# --- collection metadata ----------------------------------------------------------------------
+
+def _metadata_id(collection_name: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"collection:{collection_name}"))
+
+
+def record_embedding(qdrant_client, collection_name: str, provider: EmbeddingProvider) -> None:
+    """Records that `collection_name` (a real collection, not an alias) holds `provider`'s vectors."""
+    if not qdrant_client.collection_exists(COLLECTION_METADATA_NAME):
+        # Payload only: no vectors to configure
+        qdrant_client.create_collection(COLLECTION_METADATA_NAME, vectors_config={})
+    qdrant_client.upsert(COLLECTION_METADATA_NAME, points=[PointStruct(
+        id=_metadata_id(collection_name), vector={},
+        payload={"collection": collection_name, "embedding": provider.to_payload(), "recorded_at": time.time()},
+    )])
+
+
+def record_collection_metadata(qdrant_client, collection_name: str, **fields) -> None:
+    """Adds `fields` to the record of `collection_name` (a real collection, not an alias), keeping the rest."""
+    if not qdrant_client.collection_exists(COLLECTION_METADATA_NAME):
+        qdrant_client.create_collection(COLLECTION_METADATA_NAME, vectors_config={})
+    records = qdrant_client.retrieve(COLLECTION_METADATA_NAME, ids=[_metadata_id(collection_name)], with_payload=True)
+    payload = {**(records[0].payload if records else {"collection": collection_name}), **fields}
+    qdrant_client.upsert(COLLECTION_METADATA_NAME, points=[PointStruct(
+        id=_metadata_id(collection_name), vector={}, payload=payload,
+    )])
+
+
+def collection_metadata(qdrant_client, collection_name: str) -> Dict:
+    """The record of a collection or of the collection an alias points at; empty if there is none."""
+    from collection_aliases import resolve_alias
+
+    if not qdrant_client.collection_exists(COLLECTION_METADATA_NAME):
+        return {}
+    target = resolve_alias(qdrant_client, collection_name) or collection_name
+    records = qdrant_client.retrieve(COLLECTION_METADATA_NAME, ids=[_metadata_id(target)], with_payload=True)
+    return records[0].payload if records else {}
+
+
+def recorded_embedding(qdrant_client, collection_name: str) -> Optional[EmbeddingProvider]:
+    """The provider recorded for a collection or the collection an alias points at; None if none was."""
+    payload = collection_metadata(qdrant_client, collection_name).get("embedding")
+    return EmbeddingProvider.from_payload(payload) if payload else None
+
+
+def forget_embeddings(qdrant_client, collection_names: List[str]) -> None:
+    """Drops the records of deleted collections."""
+    if collection_names and qdrant_client.collection_exists(COLLECTION_METADATA_NAME):
+        qdrant_client.delete(COLLECTION_METADATA_NAME,
+                             points_selector=PointIdsList(points=[_metadata_id(n) for n in collection_names]))
+
+
+def vector_size(qdrant_client, collection_name: str) -> int:
+    vectors = qdrant_client.get_collection(collection_name).config.params.vectors
+    if isinstance(vectors, dict):
+        vectors = next(iter(vectors.values()))
+    return vectors.size
+
+
+def check_dimensions(provider: EmbeddingProvider, dimensions: int, collection_name: str) -> None:
+    if dimensions and dimensions != provider.dimensions:
+        raise ValueError(f"Collection '{collection_name}' holds {dimensions}-d vectors but is searched with "
+                         f"{provider.cache_key} ({provider.dimensions}-d). Rebuild it with that embedding "
+                         f"or set EMBEDDING to the one it was built with.")
+
+
+def collection_embedding(qdrant_client, collection_name: str) -> EmbeddingProvider:
+    """
+    The provider to embed questions for `collection_name` with: the recorded one, or EMBEDDING for
+    collections built before providers were recorded. Raises ValueError if its vector size doesn't
+    match the collection's.
+    """
+    provider = recorded_embedding(qdrant_client, collection_name) or get_embedding()
+    check_dimensions(provider, vector_size(qdrant_client, collection_name), collection_name)
+    return provider
+
+
+def get_query_embedding(qdrant_client, collection_name: str) -> EmbeddingProvider:
+    """
+    collection_embedding() for the query handlers, read again every EMBEDDING_RECHECK_SECONDS so a
+    running app follows an alias switch to a collection built with another embedding.
+    """
+    import resource_registry
+
+    # Per process and client, like the search params; cleared with the registry
+    state = resource_registry.get_or_create(("query_embedding", collection_name, id(qdrant_client)), dict)
+    if state and time.monotonic() - state["checked_at"] < EMBEDDING_RECHECK_SECONDS:
+        return state["provider"]
+    try:
+        provider = collection_embedding(qdrant_client, collection_name)
+    except ValueError:
+        raise
+    except Exception as e:
+        print(f"Could not read the embedding of collection '{collection_name}': {e}")
+        # Keep what was read before, or EMBEDDING, until the next check
+        provider = state.get("provider") or get_embedding()
+    state.update(provider=provider, checked_at=time.monotonic())
+    return provider
@@ -0,0 +1,225 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import openai
+
+from context_packer import count_tokens
+from embedding_providers import OPENAI_DIMENSIONS, EmbeddingProvider
+
+# Explicit embedding stage for ingest.
+# Qdrant.from_documents used to embed chunks itself: fixed batches sent one after another,
+# the client's default retries, and no memory of what was embedded on the previous run.
+# Here chunks are packed into token-bounded batches that are sent several at a time under a
+# shared requests-per-minute / tokens-per-minute limiter, 429s and 5xx are retried with
+# exponential backoff (honouring Retry-After), and every vector is cached on disk under
+# (model, sha256(chunk text)) so an unchanged chunk is never embedded twice.
+# Local and hashing providers (see embedding_providers.py) go through the same batching and cache.
+
+CHUNK_EMBEDDING_CACHE_PATH = os.getenv("CHUNK_EMBEDDING_CACHE_PATH", "chunk_embedding_cache.sqlite3")
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "60000"))
+# The embeddings endpoint accepts at most 2048 inputs per request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "512"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+EMBED_RPM = int(os.getenv("EMBED_RPM", "3000"))
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "8"))
+MAX_BACKOFF_SECONDS = 60.0
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingCache:
+    """SQLite-backed (model, sha256(text)) -> float32 vector cache for ingest."""
+
+    def __init__(self, db_path: str = CHUNK_EMBEDDING_CACHE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.commit()
+
+    def get_many(self, model: str, hashes: Sequence[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = list(hashes[start:start + 500])
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM chunk_embeddings WHERE model = ? "
+                    f"AND text_hash IN ({','.join('?' * len(batch))})", [model] + batch,
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings VALUES (?, ?, ?)",
+                [(model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    """Sliding one-minute window over requests and tokens, shared by all embedding workers."""
+
+    def __init__(self, requests_per_minute: int = EMBED_RPM, tokens_per_minute: int = EMBED_TPM):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._sent = deque()  # (timestamp, tokens)
+        self._tokens_in_window = 0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> None:
+        """Blocks until a request of `tokens` tokens fits in the current window."""
+        # A single batch larger than the whole budget would otherwise wait forever
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0][0] >= 60.0:
+                    self._tokens_in_window -= self._sent.popleft()[1]
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if len(self._sent) >= self.requests_per_minute:
+                        wait = 60.0 - (now - self._sent[0][0])
+                    elif self._tokens_in_window + tokens > self.tokens_per_minute:
+                        wait = 60.0 - (now - self._sent[0][0])
+                    else:
+                        self._sent.append((now, tokens))
+                        self._tokens_in_window += tokens
+                        return
+            time.sleep(max(wait, 0.01))
+
+    def pause(self, seconds: float) -> None:
+        """Holds back every worker, e.g. after the server answers 429 with Retry-After."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def make_batches(texts: Sequence[str], max_tokens: int = EMBED_BATCH_TOKENS,
+                 max_size: int = EMBED_BATCH_SIZE) -> List[List[int]]:
+    """Groups text indices, in order, into batches of at most max_size texts and max_tokens tokens."""
+    batches, current, current_tokens = [], [], 0
+    for i, text in enumerate(texts):
+        tokens = count_tokens(text)
+        if current and (len(current) >= max_size or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class EmbeddingStage:
+    """
+    Embeds chunk texts through the cache, in token-bounded batches sent concurrently under a RateLimiter.
+    `provider` is an EmbeddingProvider or an OpenAI model name; `client` is only used by OpenAI providers.
+    """
+
+    def __init__(self, client: Optional[openai.OpenAI], provider: Union[EmbeddingProvider, str],
+                 cache: Optional[ChunkEmbeddingCache] = None,
+                 limiter: Optional[RateLimiter] = None, concurrency: int = EMBED_CONCURRENCY,
+                 batch_tokens: int = EMBED_BATCH_TOKENS, batch_size: int = EMBED_BATCH_SIZE,
+                 max_retries: int = EMBED_MAX_RETRIES):
+        # Retries are handled here so they can share the limiter's backoff
+        self.client = client.with_options(max_retries=0) if client is not None else None
+        if isinstance(provider, str):
+            provider = EmbeddingProvider("openai", provider, OPENAI_DIMENSIONS.get(provider, 1536))
+        self.provider = provider
+        # Cache key: shortened vectors are kept apart from the model's full-size ones
+        self.model = provider.cache_key
+        self.cache = cache
+        self.limiter = limiter or RateLimiter()
+        self.concurrency = max(1, concurrency)
+        self.batch_tokens = batch_tokens
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.stats = {"cached": 0, "embedded": 0, "requests": 0, "rate_limited": 0, "retries": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, **deltas) -> None:
+        with self._stats_lock:
+            for name, delta in deltas.items():
+                self.stats[name] += delta
+
+    @staticmethod
+    def _retry_after(error: Exception) -> float:
+        response = getattr(error, "response", None)
+        try:
+            return float(response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            return 0.0
+
+    def _embed_batch(self, texts: List[str], tokens: int) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens)
+            self._count(requests=1)
+            try:
+                return self.provider.embed(texts, self.client)
+            except (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError) as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = self._retry_after(e)
+                if isinstance(e, openai.RateLimitError):
+                    self._count(rate_limited=1)
+                    # Every worker waits out the server's Retry-After; only this one also backs off
+                    self.limiter.pause(retry_after)
+                self._count(retries=1)
+                backoff = min(MAX_BACKOFF_SECONDS, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.0)
+                time.sleep(max(backoff, retry_after))
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Vectors for `texts`, in order; only texts missing from the cache are sent to the API."""
+        hashes = [text_hash(t) for t in texts]
+        vectors: Dict[str, List[float]] = self.cache.get_many(self.model, list(set(hashes))) if self.cache else {}
+        self._count(cached=sum(1 for h in hashes if h in vectors))
+
+        # Identical chunks are embedded once
+        pending, seen = [], set()
+        for text, key in zip(texts, hashes):
+            if key not in vectors and key not in seen:
+                seen.add(key)
+                pending.append((key, text))
+
+        def run(batch: List[int]) -> None:
+            batch_texts = [pending[i][1] for i in batch]
+            embedded = self._embed_batch(batch_texts, sum(count_tokens(t) for t in batch_texts))
+            results = {pending[i][0]: vector for i, vector in zip(batch, embedded)}
+            # Cache each batch as it lands, so an interrupted run keeps the work already paid for
+            if self.cache:
+                self.cache.put_many(self.model, results)
+            vectors.update(results)
+            self._count(embedded=len(batch))
+
+        batches = make_batches([text for _, text in pending], self.batch_tokens, self.batch_size)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            # list() re-raises the first batch that ran out of retries
+            list(pool.map(run, batches))
+        return [vectors[key] for key in hashes]
+
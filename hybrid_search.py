@@ -0,0 +1,213 @@
+import hashlib
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+
+from local_vector_index import LocalVectorStore
+from search_filters import SearchFilter
+
+# Hybrid dense + BM25 retrieval.
+# Policy questions are full of literal codes and acronyms (I-1630, QMB, SLMB, QI-1) that dense
+# embeddings blur together, so a small k sometimes misses the one section quoting the code.
+# A local BM25 inverted index over the chunks produced by PDFChunkerForQdrant catches those
+# exact matches, and reciprocal-rank fusion merges its ranking with the dense one.
+
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", "bm25_index.json")
+# Distinct SearchFilters whose matching documents each index remembers
+BM25_FILTER_CACHE_SIZE = 256
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens; hyphenated codes like 'i-1630' are kept whole and also split into parts."""
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if "-" in token:
+            tokens.extend(token.split("-"))
+    return tokens
+
+
+def document_key(doc: Document) -> str:
+    """Identifies a chunk by its content so dense and lexical hits for it can be merged."""
+    return hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+class BM25Index:
+    """In-memory BM25 (Okapi) inverted index over LangChain documents."""
+
+    def __init__(self, documents: List[Document], k1: float = 1.5, b: float = 0.75, collection_version: str = ""):
+        self.documents = documents
+        self.k1 = k1
+        self.b = b
+        self.collection_version = collection_version
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._doc_lengths: List[int] = []
+        for doc_index, doc in enumerate(documents):
+            term_counts = Counter(tokenize(doc.page_content))
+            self._doc_lengths.append(sum(term_counts.values()))
+            for term, count in term_counts.items():
+                self._postings[term].append((doc_index, count))
+        self._avg_length = (sum(self._doc_lengths) / len(self._doc_lengths)) if self._doc_lengths else 0.0
+        # SearchFilter -> indexes of the documents it matches; filters are frozen, and questions
+        # name the same few documents again and again
+        self._allowed: Dict[SearchFilter, frozenset] = {}
+        n = len(documents)
+        self._idf = {term: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                     for term, postings in self._postings.items()}
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _allowed_documents(self, search_filter: SearchFilter) -> frozenset:
+        allowed = self._allowed.get(search_filter)
+        if allowed is None:
+            allowed = frozenset(i for i, doc in enumerate(self.documents) if search_filter.matches(doc.metadata))
+            if len(self._allowed) >= BM25_FILTER_CACHE_SIZE:
+                # Forget the oldest filter
+                self._allowed.pop(next(iter(self._allowed)), None)
+            self._allowed[search_filter] = allowed
+        return allowed
+
+    def search(self, query: str, k: int = 20,
+               search_filter: Optional[SearchFilter] = None) -> List[Tuple[Document, float]]:
+        """Returns up to k (document, score) pairs, best first; with `search_filter`, only among the documents it matches."""
+        allowed = self._allowed_documents(search_filter) if search_filter is not None else None
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc_index, tf in self._postings[term]:
+                if allowed is not None and doc_index not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_index] / self._avg_length)
+                scores[doc_index] += idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.documents[doc_index], score) for doc_index, score in best]
+
+    def save(self, path: str = BM25_INDEX_PATH) -> None:
+        """Persists the indexed documents; postings are rebuilt on load."""
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "collection_version": self.collection_version,
+            "documents": [{"page_content": d.page_content, "metadata": d.metadata} for d in self.documents],
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def load(cls, path: str = BM25_INDEX_PATH) -> "BM25Index":
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        documents = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in data["documents"]]
+        return cls(documents, k1=data["k1"], b=data["b"], collection_version=data.get("collection_version", ""))
+
+    @classmethod
+    def from_qdrant(cls, qdrant_client, collection_name: str, collection_version: str = "") -> "BM25Index":
+        """Builds the index from the LangChain-style payloads already stored in a Qdrant collection."""
+        documents, offset = [], None
+        while True:
+            points, offset = qdrant_client.scroll(
+                collection_name=collection_name, limit=256, offset=offset, with_payload=True, with_vectors=False,
+            )
+            for point in points:
+                payload = point.payload or {}
+                documents.append(Document(page_content=payload.get("page_content", ""),
+                                          metadata=payload.get("metadata") or {}))
+            if offset is None:
+                break
+        return cls(documents, collection_version=collection_version)
+
+
+def reciprocal_rank_fusion(ranked_lists: List[List[Document]], rrf_k: int = 60) -> List[Tuple[Document, float]]:
+    """Merges several best-first document rankings: score = sum over lists of 1 / (rrf_k + rank)."""
+    scores: Dict[str, float] = defaultdict(float)
+    by_key: Dict[str, Document] = {}
+    for ranked in ranked_lists:
+        for rank, doc in enumerate(ranked, start=1):
+            key = document_key(doc)
+            scores[key] += 1.0 / (rrf_k + rank)
+            by_key.setdefault(key, doc)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    return [(by_key[key], score) for key, score in fused]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fetches `fetch_k` dense and `fetch_k` BM25 candidates and returns the top `k` after RRF."""
+
+    vector_store: object
+    bm25_index: object
+    k: int = 3
+    fetch_k: int = 20
+    rrf_k: int = 60
+    # Extra arguments for the dense search, e.g. {"search_params": ...} for the collection's profile
+    search_kwargs: dict = Field(default_factory=dict)
+
+    def search_by_vector(self, query: str, query_vector: List[float], search_filter=None) -> List[Document]:
+        """
+        Hybrid search reusing an already computed query embedding. A search_filters.SearchFilter
+        restricts both the dense and the BM25 candidates.
+        """
+        return [doc for doc, _ in self.search_by_vector_with_scores(query, query_vector, search_filter)]
+
+    def search_by_vector_with_scores(self, query: str, query_vector: List[float], search_filter=None,
+                                     k: Optional[int] = None) -> List[Tuple[Document, float]]:
+        """search_by_vector() returning (document, RRF score) pairs, cut at `k` (default self.k)."""
+        return self.search_by_vector_with_relevance(query, query_vector, search_filter, k)[0]
+
+    def search_by_vector_with_relevance(self, query: str, query_vector: List[float], search_filter=None,
+                                        k: Optional[int] = None) -> Tuple[List[Tuple[Document, float]], Optional[float]]:
+        """
+        search_by_vector_with_scores() plus the best dense similarity among the candidates (None if
+        the dense search found nothing), which the relevance gate compares with its threshold.
+        """
+        search_kwargs = dict(self.search_kwargs)
+        if search_filter is not None:
+            # The local snapshot store evaluates the SearchFilter itself; Qdrant takes its own Filter
+            search_kwargs["filter"] = search_filter if isinstance(self.vector_store, LocalVectorStore) \
+                else search_filter.to_qdrant()
+        fetch_k = max(self.fetch_k, k or 0)
+        dense = self.vector_store.similarity_search_with_score_by_vector(query_vector, k=fetch_k, **search_kwargs)
+        lexical = [doc for doc, _ in self.bm25_index.search(query, k=fetch_k, search_filter=search_filter)]
+        fused = reciprocal_rank_fusion([[doc for doc, _ in dense], lexical], rrf_k=self.rrf_k)[:k or self.k]
+        return fused, max((score for _, score in dense), default=None)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        query_vector = self.vector_store.embeddings.embed_query(query)
+        return self.search_by_vector(query, query_vector)
+
+
+def load_or_build_index(qdrant_client, collection_name: str, collection_version: str,
+                        path: str = BM25_INDEX_PATH) -> BM25Index:
+    """
+    Loads the saved index if it matches the collection version, otherwise rebuilds it from
+    the collection and saves it. If neither works the index is empty, which leaves the fused
+    ranking equal to the dense one.
+    """
+    if os.path.exists(path):
+        try:
+            index = BM25Index.load(path)
+            if index.collection_version == collection_version:
+                return index
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not load BM25 index from '{path}': {e}")
+    try:
+        print(f"Building BM25 index from Qdrant collection '{collection_name}'...")
+        index = BM25Index.from_qdrant(qdrant_client, collection_name, collection_version=collection_version)
+        index.save(path)
+        print(f"BM25 index built over {len(index)} chunks.")
+        return index
+    except Exception as e:
+        print(f"Could not build BM25 index, using dense retrieval only: {e}")
+        return BM25Index([], collection_version=collection_version)
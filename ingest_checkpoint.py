@@ -0,0 +1,256 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+from langchain_core.documents import Document
+
+from ingest_manifest import FetchResult, IngestManifest, assign_point_ids
+
+# Checkpoints for resuming an interrupted ingest.
+# The manifest is only saved once a whole run succeeded, so a run that died on an LDH timeout
+# or an OpenAI / Qdrant error used to leave nothing behind but the embedding cache. The
+# checkpoint is a small SQLite journal written as the pipeline goes: the source list, how far
+# each source got (downloaded, chunked, embedded, done, failed), its chunks once converted, which
+# of their points have been upserted (per Qdrant request), and the manifest entry of every
+# finished source. Resuming replays that journal: finished sources are skipped outright,
+# converted ones skip the download and conversion, and points already in Qdrant aren't sent again.
+
+INGEST_CHECKPOINT_PATH = os.getenv("INGEST_CHECKPOINT_PATH", "ingest_checkpoint.sqlite3")
+
+# Per-source stages, in order
+STAGES = ("listed", "downloaded", "chunked", "embedded", "done")
+
+
+class IngestCheckpoint:
+    """SQLite journal of one ingest run's progress, shared by the pipeline's stage threads."""
+
+    def __init__(self, path: str = INGEST_CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS run (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS sources (
+                source TEXT PRIMARY KEY,
+                position INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                file_name TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                sha256 TEXT,
+                entry TEXT,
+                error TEXT,
+                updated REAL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                source TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                point_id TEXT NOT NULL,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                upserted INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source, position)
+            );
+            CREATE INDEX IF NOT EXISTS chunks_point_id ON chunks (point_id);
+        """)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    # --- run -------------------------------------------------------------------------------
+
+    def _get(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM run WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set(self, **values) -> None:
+        self._conn.executemany("INSERT OR REPLACE INTO run VALUES (?, ?)",
+                               [(key, str(value)) for key, value in values.items()])
+
+    def start(self, collection_name: str, incremental: bool, sources: List[str],
+              target_collection: Optional[str] = None) -> None:
+        """
+        Discards any previous journal and starts one for a run over `sources`.
+        `target_collection` is the collection the points are written to, if not `collection_name`
+        itself (a full rebuild writes a new version behind the collection alias).
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM run")
+            self._conn.execute("DELETE FROM sources")
+            self._conn.execute("DELETE FROM chunks")
+            self._set(collection_name=collection_name, target_collection=target_collection or collection_name,
+                      incremental=int(incremental), status="running", started=time.time(), collection_recreated=0)
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO sources (source, position, stage, updated) VALUES (?, ?, 'listed', ?)",
+                [(source, i, now) for i, source in enumerate(sources)])
+            self._conn.commit()
+
+    def unfinished(self, collection_name: str) -> bool:
+        """True if the journal holds a run into `collection_name` that never finished."""
+        with self._lock:
+            return self._get("status") == "running" and self._get("collection_name") == collection_name
+
+    @property
+    def incremental(self) -> bool:
+        with self._lock:
+            return self._get("incremental") == "1"
+
+    @property
+    def target_collection(self) -> Optional[str]:
+        with self._lock:
+            return self._get("target_collection")
+
+    @property
+    def collection_recreated(self) -> bool:
+        with self._lock:
+            return self._get("collection_recreated") == "1"
+
+    def mark_collection_recreated(self) -> None:
+        with self._lock:
+            self._set(collection_recreated=1)
+            self._conn.commit()
+
+    def finish(self) -> None:
+        with self._lock:
+            self._set(status="complete", finished=time.time())
+            self._conn.commit()
+
+    def sources(self) -> List[str]:
+        """The run's source list, in its original order."""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT source FROM sources ORDER BY position")]
+
+    # --- per source ------------------------------------------------------------------------
+
+    def source_state(self, source: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stage, file_name, etag, last_modified, sha256 FROM sources WHERE source = ?",
+                (source,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("stage", "file_name", "etag", "last_modified", "sha256"), row))
+
+    def _set_stage(self, source: str, stage: str, **columns) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        self._conn.execute(
+            f"UPDATE sources SET stage = ?, updated = ?{', ' + assignments if columns else ''} WHERE source = ?",
+            [stage, time.time(), *columns.values(), source])
+
+    def record_downloaded(self, result: FetchResult) -> None:
+        with self._lock:
+            self._set_stage(result.source, "downloaded", file_name=result.file_name, etag=result.etag,
+                            last_modified=result.last_modified, sha256=result.sha256, error=None)
+            self._conn.commit()
+
+    def record_chunked(self, result: FetchResult, documents: List[Document]) -> None:
+        """Stores a converted source's chunks, so a resumed run doesn't download or convert it again."""
+        rows = [(result.source, i, pid, doc.page_content, json.dumps(doc.metadata), 0)
+                for i, (doc, (pid, _)) in enumerate(zip(documents, assign_point_ids(documents)))]
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE source = ?", (result.source,))
+            self._conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._set_stage(result.source, "chunked")
+            self._conn.commit()
+
+    def load_documents(self, source: str) -> List[Document]:
+        with self._lock:
+            rows = self._conn.execute("SELECT page_content, metadata FROM chunks WHERE source = ? ORDER BY position",
+                                      (source,)).fetchall()
+        return [Document(page_content=content, metadata=json.loads(metadata)) for content, metadata in rows]
+
+    def upserted_ids(self, source: str) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute(
+                "SELECT point_id FROM chunks WHERE source = ? AND upserted = 1", (source,))}
+
+    def record_embedded(self, sources: Iterable[str]) -> None:
+        with self._lock:
+            for source in sources:
+                self._set_stage(source, "embedded")
+            self._conn.commit()
+
+    def mark_upserted(self, point_ids: List[str]) -> None:
+        """Called after each Qdrant upsert request, so at most one request's points are re-sent on resume."""
+        with self._lock:
+            for start in range(0, len(point_ids), 500):
+                batch = point_ids[start:start + 500]
+                self._conn.execute(f"UPDATE chunks SET upserted = 1 WHERE point_id IN ({','.join('?' * len(batch))})",
+                                   batch)
+            self._conn.commit()
+
+    def complete_sources(self, entries: Dict[str, Optional[Dict]]) -> None:
+        """Marks sources done, keeping the manifest entry each one ended with; their chunks are no longer needed."""
+        with self._lock:
+            for source, entry in entries.items():
+                self._set_stage(source, "done", entry=json.dumps(entry) if entry is not None else None)
+                self._conn.execute("DELETE FROM chunks WHERE source = ?", (source,))
+            self._conn.commit()
+
+    def record_failed(self, source: str, error: str) -> None:
+        with self._lock:
+            self._set_stage(source, "failed", error=error)
+            self._conn.commit()
+
+    def restore(self, manifest: IngestManifest) -> None:
+        """Applies the manifest entries of every source the interrupted run finished."""
+        with self._lock:
+            rows = self._conn.execute("SELECT source, entry FROM sources WHERE stage = 'done'").fetchall()
+        for source, entry in rows:
+            if entry is None:
+                manifest.files.pop(source, None)
+            else:
+                manifest.files[source] = json.loads(entry)
+
+    # --- reporting -------------------------------------------------------------------------
+
+    def status(self) -> Dict:
+        with self._lock:
+            run = dict(self._conn.execute("SELECT key, value FROM run").fetchall())
+            stages = dict(self._conn.execute("SELECT stage, COUNT(*) FROM sources GROUP BY stage").fetchall())
+            chunks, upserted = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(upserted), 0) FROM chunks").fetchone()
+            failed = self._conn.execute(
+                "SELECT source, error FROM sources WHERE stage = 'failed' ORDER BY position").fetchall()
+        return {
+            "collection_name": run.get("collection_name"),
+            "target_collection": run.get("target_collection"),
+            "mode": "incremental" if run.get("incremental") == "1" else "full rebuild",
+            "status": run.get("status", "none"),
+            "started": float(run["started"]) if "started" in run else None,
+            "finished": float(run["finished"]) if "finished" in run else None,
+            "sources": sum(stages.values()),
+            "stages": {stage: stages.get(stage, 0) for stage in STAGES + ("failed",)},
+            "pending_chunks": chunks,
+            "pending_chunks_upserted": upserted,
+            "failed": [{"source": source, "error": error} for source, error in failed],
+        }
+
+
+def format_status(status: Dict) -> str:
+    """Human-readable summary of IngestCheckpoint.status()."""
+    if status["status"] == "none":
+        return "No ingest run has been checkpointed."
+    started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(status["started"])) if status["started"] else "?"
+    lines = [
+        f"{status['mode'].capitalize()} of '{status['collection_name']}'"
+        + (f" (into '{status['target_collection']}')"
+           if status["target_collection"] not in (None, status["collection_name"]) else "")
+        + f" started {started}: "
+        + ("complete" if status["status"] == "complete" else "not finished (resume with --resume)"),
+        f"Sources: {status['stages']['done']}/{status['sources']} done"
+        + "".join(f", {count} {stage}" for stage, count in status["stages"].items() if count and stage != "done"),
+    ]
+    if status["pending_chunks"]:
+        lines.append(f"Chunks of unfinished sources: {status['pending_chunks_upserted']}/{status['pending_chunks']} "
+                     f"upserted")
+    for failure in status["failed"]:
+        lines.append(f"  failed: {failure['source']}: {failure['error']}")
+    return "\n".join(lines)
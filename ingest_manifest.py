@@ -0,0 +1,186 @@
+import hashlib
+import json
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from langchain_core.documents import Document
+
+from pdf_chunker import download_pdf
+
+# Incremental re-ingestion.
+# The manifest remembers, per source PDF, the ETag / Last-Modified the server sent, the sha256
+# of the bytes, and a hash of every chunk stored for it (its text and metadata) under its point
+# id. On a refresh, a conditional GET (or an identical sha256) marks a PDF unchanged and it is
+# skipped; changed PDFs are re-chunked and only chunks whose text or metadata changed get
+# embedded and upserted.
+# Point ids are derived from the file name and chunk content, so the same chunk always lands
+# on the same point and chunks that disappeared from a PDF can be deleted by id.
+
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.json")
+# Pruning is skipped when more than this share of the manifest's sources is missing from a listing,
+# which is far more likely a partial crawl than a manual that lost that many PDFs
+INGEST_PRUNE_MAX_DROP = float(os.getenv("INGEST_PRUNE_MAX_DROP", "0.1"))
+
+# Fixed namespace so point ids are stable across machines and runs
+_POINT_NAMESPACE = uuid.UUID("5f0e8a2c-3d0b-4c5e-9a57-1c0f3a9d6b42")
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def payload_hash(doc: Document) -> str:
+    """Hash of everything a chunk's point stores, so a metadata-only change (a new date, section) is an update."""
+    return chunk_hash(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata},
+                                 sort_keys=True, default=str))
+
+
+def point_id(file_name: str, content_hash: str, occurrence: int = 0) -> str:
+    """Deterministic Qdrant point id for the `occurrence`-th chunk of a file with this content hash."""
+    return str(uuid.uuid5(_POINT_NAMESPACE, f"{file_name}/{content_hash}/{occurrence}"))
+
+
+def assign_point_ids(documents: List[Document]) -> List[Tuple[str, str]]:
+    """(point id, content hash) for each document; repeated identical chunks in one file get distinct ids."""
+    seen: Dict[Tuple[str, str], int] = {}
+    assigned = []
+    for doc in documents:
+        content_hash = chunk_hash(doc.page_content)
+        key = (doc.metadata.get("file_name", ""), content_hash)
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        assigned.append((point_id(key[0], content_hash, occurrence), content_hash))
+    return assigned
+
+
+@dataclass
+class FetchResult:
+    source: str
+    file_name: str
+    changed: bool
+    content: Optional[bytes] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    sha256: Optional[str] = None
+    error: Optional[str] = None
+
+
+def _file_name_for(source: str) -> str:
+    base_name = os.path.basename(source.split("?")[0])
+    return base_name if base_name.lower().endswith(".pdf") else "download.pdf"
+
+
+def fetch_if_changed(source: str, entry: Optional[Dict], timeout: float = 30) -> FetchResult:
+    """
+    Downloads (or reads) a source unless the manifest entry shows it unchanged.
+    URLs use a conditional GET with the stored ETag / Last-Modified over the shared keep-alive
+    session; a 200 whose bytes hash to the stored sha256 also counts as unchanged, for servers
+    that don't send validators.
+    """
+    entry = entry or {}
+    file_name = _file_name_for(source)
+    try:
+        if source.startswith("http"):
+            headers = {}
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+            status, content, response_headers = download_pdf(source, headers=headers, timeout=timeout)
+            if status == 304:
+                return FetchResult(source, file_name, changed=False, etag=entry.get("etag"),
+                                   last_modified=entry.get("last_modified"), sha256=entry.get("sha256"))
+            etag, last_modified = response_headers.get("ETag"), response_headers.get("Last-Modified")
+        else:
+            path = Path(source)
+            file_name = path.name
+            content = path.read_bytes()
+            etag, last_modified = None, None
+    except (IOError, requests.RequestException, ValueError) as e:
+        return FetchResult(source, file_name, changed=False, error=str(e))
+
+    sha256 = hashlib.sha256(content).hexdigest()
+    changed = sha256 != entry.get("sha256")
+    return FetchResult(source, file_name, changed=changed, content=content if changed else None,
+                       etag=etag, last_modified=last_modified, sha256=sha256)
+
+
+class IngestManifest:
+    """Per-source fetch validators and per-chunk payload hashes for one collection, stored as JSON."""
+
+    def __init__(self, path: str = INGEST_MANIFEST_PATH, collection_name: str = "", files: Optional[Dict] = None):
+        self.path = path
+        self.collection_name = collection_name
+        # source -> {"file_name", "etag", "last_modified", "sha256", "chunks": {point_id: payload_hash}}
+        self.files: Dict[str, Dict] = files or {}
+
+    @classmethod
+    def load(cls, path: str, collection_name: str) -> "IngestManifest":
+        """The saved manifest, or an empty one if it is missing or belongs to another collection."""
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(path, collection_name)
+        if data.get("collection_name") != collection_name:
+            return cls(path, collection_name)
+        return cls(path, collection_name, data.get("files"))
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"collection_name": self.collection_name, "files": self.files}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def apply(self, fetched: List[FetchResult],
+              documents_by_source: Dict[str, List[Document]]) -> Tuple[List[Document], List[str], List[str]]:
+        """
+        Records fetched sources and works out what the collection needs for them.
+        `documents_by_source` holds the chunks of every source fetched as changed.
+        Returns (documents to upsert, their point ids, point ids to delete).
+        """
+        to_upsert, upsert_ids, to_delete = [], [], []
+        for result in fetched:
+            # Failed downloads and changed PDFs that produced no chunks keep their old entry and points
+            if result.error or (result.changed and not documents_by_source.get(result.source)):
+                continue
+            entry = self.files.setdefault(result.source, {"chunks": {}})
+            entry.update(file_name=result.file_name, etag=result.etag, last_modified=result.last_modified,
+                         sha256=result.sha256)
+            if not result.changed:
+                continue
+
+            old_chunks = entry.get("chunks", {})
+            documents = documents_by_source[result.source]
+            new_chunks = {}
+            for doc, (pid, _) in zip(documents, assign_point_ids(documents)):
+                # The id follows the text; the stored hash also covers the metadata in the payload
+                new_chunks[pid] = payload_hash(doc)
+                if old_chunks.get(pid) != new_chunks[pid]:
+                    to_upsert.append(doc)
+                    upsert_ids.append(pid)
+            to_delete.extend(pid for pid in old_chunks if pid not in new_chunks)
+            entry["chunks"] = new_chunks
+        return to_upsert, upsert_ids, to_delete
+
+    def prune_skip_reason(self, listed_sources: Iterable[str],
+                          max_drop: float = INGEST_PRUNE_MAX_DROP) -> Optional[str]:
+        """Why pruning against this listing looks unsafe, or None if it doesn't."""
+        listed = set(listed_sources)
+        missing = sum(1 for source in self.files if source not in listed)
+        if self.files and missing > max_drop * len(self.files):
+            return (f"{missing} of the {len(self.files)} source(s) in the manifest are missing from this listing "
+                    f"(more than {max_drop:.0%})")
+        return None
+
+    def prune(self, listed_sources: Iterable[str]) -> List[str]:
+        """Drops sources that are no longer listed; returns the point ids they had."""
+        listed = set(listed_sources)
+        to_delete = []
+        for source in [s for s in self.files if s not in listed]:
+            to_delete.extend(self.files.pop(source).get("chunks", {}))
+        return to_delete
@@ -0,0 +1,337 @@
+import email.utils
+import multiprocessing
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+from qdrant_client.models import PointIdsList, PointStruct
+
+from collection_profiles import CollectionProfile, get_profile
+from embedding_providers import record_embedding
+from embedding_stage import EmbeddingStage
+from ingest_checkpoint import IngestCheckpoint
+from ingest_manifest import FetchResult, IngestManifest, fetch_if_changed
+from pdf_chunker import PDFChunkerForQdrant
+from search_filters import create_payload_indexes
+
+# Streaming ingest.
+# The batch flow held every Document of every PDF (and then every vector) in memory before the
+# first point reached Qdrant. Here each stage runs on its own thread and hands work to the next
+# through a bounded queue:
+#   discover -> download (thread pool) -> convert + chunk (process pool) -> embed -> upsert
+# so a slow stage applies back-pressure instead of letting work pile up, memory stays flat as
+# the corpus grows, and downloading, converting, embedding and upserting overlap in time.
+# With a checkpoint (see ingest_checkpoint.py) every stage also records its progress, and a
+# resumed run skips whatever the checkpoint shows as already done.
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "8"))
+# Chunks per embed + upsert round, and points per Qdrant upsert request within a round
+INGEST_UPSERT_BATCH = int(os.getenv("INGEST_UPSERT_BATCH", "256"))
+UPSERT_POINTS_PER_REQUEST = 64
+
+_DONE = object()
+
+
+class _Cancelled(Exception):
+    pass
+
+
+class IngestPipeline:
+    """Runs one ingest over a stream of PDF sources into a Qdrant collection, updating the manifest as it goes."""
+
+    def __init__(self, chunker: PDFChunkerForQdrant, stage: EmbeddingStage, qdrant_client, collection_name: str,
+                 manifest: IngestManifest, recreate: bool = False, queue_size: int = INGEST_QUEUE_SIZE,
+                 upsert_batch: int = INGEST_UPSERT_BATCH, checkpoint: Optional[IngestCheckpoint] = None,
+                 profile: Optional[CollectionProfile] = None):
+        self.chunker = chunker
+        self.stage = stage
+        self.qdrant_client = qdrant_client
+        self.collection_name = collection_name
+        self.manifest = manifest
+        self.recreate = recreate
+        self.queue_size = queue_size
+        self.upsert_batch = upsert_batch
+        self.checkpoint = checkpoint
+        # Vector, HNSW and quantization settings for the collection when it is (re)created
+        self.profile = profile or get_profile()
+        self.stats = {"sources": 0, "resumed": 0, "changed": 0, "failed": 0, "chunks": 0, "upserted": 0,
+                      "deleted": 0}
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._collection_ready = not recreate
+        self._indexes_ready = False
+
+    def _put(self, q: queue.Queue, item) -> None:
+        # Poll so a failure downstream can't leave this stage blocked on a full queue forever
+        while True:
+            if self._stop.is_set():
+                raise _Cancelled()
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: queue.Queue):
+        while True:
+            if self._stop.is_set():
+                raise _Cancelled()
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+
+    def _run_stage(self, target, *args) -> threading.Thread:
+        def run():
+            try:
+                target(*args)
+            except _Cancelled:
+                pass
+            except BaseException as e:
+                self._errors.append(e)
+                self._stop.set()
+
+        thread = threading.Thread(target=run, name=target.__name__, daemon=True)
+        thread.start()
+        return thread
+
+    # --- stages -----------------------------------------------------------------------------
+
+    def _download(self, sources: Iterable[str], out_q: queue.Queue) -> None:
+        """Conditional downloads on a thread pool, with at most a few times its size in flight."""
+        max_in_flight = self.chunker.download_workers * 2
+        with ThreadPoolExecutor(max_workers=self.chunker.download_workers) as pool:
+            in_flight = set()
+            for source in sources:
+                self.stats["sources"] += 1
+                state = self.checkpoint.source_state(source) if self.checkpoint else None
+                if state and state["stage"] == "done":
+                    # Finished before the interruption; its manifest entry was restored from the checkpoint
+                    self.stats["resumed"] += 1
+                    continue
+                if state and state["stage"] in ("chunked", "embedded"):
+                    # Its chunks are in the checkpoint, so there is nothing to download
+                    self.stats["resumed"] += 1
+                    self._put(out_q, FetchResult(source, state["file_name"], changed=True, etag=state["etag"],
+                                                 last_modified=state["last_modified"], sha256=state["sha256"]))
+                    continue
+                in_flight.add(pool.submit(fetch_if_changed, source, self.manifest.files.get(source)))
+                if len(in_flight) >= max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        self._put(out_q, future.result())
+            for future in in_flight:
+                self._put(out_q, future.result())
+        self._put(out_q, _DONE)
+
+    def _convert(self, in_q: queue.Queue, out_q: queue.Queue) -> None:
+        """
+        Converts + chunks each changed PDF in a worker process. In-memory chunkers get the bytes
+        directly; otherwise the PDF is written to a scratch folder first. Sources resumed from the
+        checkpoint come without bytes and take their chunks from it instead.
+        """
+        max_in_flight = self.chunker.convert_workers * 2
+        in_flight: Dict = {}
+
+        def forward(futures) -> None:
+            for future in futures:
+                result, scratch_dir = in_flight.pop(future)
+                try:
+                    documents = future.result()
+                except Exception as e:
+                    print(f"--- ❌ Critical error processing '{result.source}': {e}. Skipping. ---")
+                    documents = []
+                if scratch_dir is not None:
+                    shutil.rmtree(scratch_dir, ignore_errors=True)
+                if self.checkpoint and documents:
+                    self.checkpoint.record_chunked(result, documents)
+                self._put(out_q, (result, documents))
+
+        # spawn rather than fork: this process is running several threads
+        with ProcessPoolExecutor(max_workers=self.chunker.convert_workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            while True:
+                result = self._get(in_q)
+                if result is _DONE:
+                    break
+                if result.error:
+                    print(f"--- ❌ Error downloading '{result.source}': {result.error}. Keeping its previous chunks. ---")
+                if not result.changed:
+                    self._put(out_q, (result, []))
+                    continue
+                if self.checkpoint:
+                    if result.content is None:
+                        self._put(out_q, (result, self.checkpoint.load_documents(result.source)))
+                        continue
+                    self.checkpoint.record_downloaded(result)
+                pdf, scratch_dir = result.content, None
+                if not self.chunker.in_memory:
+                    # Each PDF gets its own folder so it keeps its file name
+                    scratch_dir = self.chunker.download_dir / os.urandom(4).hex()
+                    scratch_dir.mkdir(parents=True)
+                    pdf = scratch_dir / result.file_name
+                    pdf.write_bytes(result.content)
+                    pdf = str(pdf)
+                result.content = None
+                future = pool.submit(self.chunker._convert_and_chunk, result.source, result.file_name, pdf)
+                in_flight[future] = (result, scratch_dir)
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    forward(done)
+            forward(list(in_flight))
+        self._put(out_q, _DONE)
+
+    def _embed(self, in_q: queue.Queue, out_q: queue.Queue) -> None:
+        """Diffs each source against the manifest and embeds its new chunks in rounds of upsert_batch."""
+        documents: List[Document] = []
+        point_ids: List[str] = []
+        to_delete: List[str] = []
+        # Sources whose whole diff is in this round, finished once the round is upserted
+        sources: List[str] = []
+
+        def flush() -> None:
+            if documents or to_delete or sources:
+                vectors = self.stage.embed([doc.page_content for doc in documents]) if documents else []
+                if self.checkpoint:
+                    self.checkpoint.record_embedded(sources)
+                self._put(out_q, (list(point_ids), vectors, list(documents), list(to_delete), list(sources)))
+                documents.clear()
+                point_ids.clear()
+                to_delete.clear()
+                sources.clear()
+
+        while True:
+            item = self._get(in_q)
+            if item is _DONE:
+                break
+            result, source_documents = item
+            if result.error or (result.changed and not source_documents):
+                self.stats["failed"] += 1
+            elif result.changed:
+                self.stats["changed"] += 1
+                self.stats["chunks"] += len(source_documents)
+                self._fill_document_date(result, source_documents)
+            new_documents, new_ids, stale_ids = self.manifest.apply(
+                [result], {result.source: source_documents} if source_documents else {})
+            if self.checkpoint:
+                if result.error or (result.changed and not source_documents):
+                    self.checkpoint.record_failed(result.source, result.error or "no chunks")
+                    continue
+                # Points a previous attempt already upserted aren't embedded or sent again
+                upserted = self.checkpoint.upserted_ids(result.source)
+                if upserted:
+                    kept = [i for i, pid in enumerate(new_ids) if pid not in upserted]
+                    new_documents, new_ids = [new_documents[i] for i in kept], [new_ids[i] for i in kept]
+                sources.append(result.source)
+            documents.extend(new_documents)
+            point_ids.extend(new_ids)
+            to_delete.extend(stale_ids)
+            if len(documents) >= self.upsert_batch:
+                flush()
+        flush()
+        self._put(out_q, _DONE)
+
+    @staticmethod
+    def _fill_document_date(result, documents: List[Document]) -> None:
+        """Dates chunks of PDFs that record no date of their own by the server's Last-Modified."""
+        if not result.last_modified or all(doc.metadata.get("document_date") for doc in documents):
+            return
+        try:
+            date = email.utils.parsedate_to_datetime(result.last_modified).date().isoformat()
+        except (TypeError, ValueError):
+            return
+        for doc in documents:
+            if not doc.metadata.get("document_date"):
+                doc.metadata["document_date"] = date
+
+    def _ensure_collection(self, dim: int) -> None:
+        if not self._indexes_ready and self._collection_ready:
+            # Collections updated in place may predate the payload indexes
+            create_payload_indexes(self.qdrant_client, self.collection_name)
+            self._indexes_ready = True
+        if self._collection_ready:
+            return
+        if self.qdrant_client.collection_exists(self.collection_name):
+            self.qdrant_client.delete_collection(self.collection_name)
+        # Same layout Qdrant.from_documents creates (one unnamed cosine vector), tuned by the profile
+        self.profile.create_collection(self.qdrant_client, self.collection_name, dim)
+        create_payload_indexes(self.qdrant_client, self.collection_name)
+        self._indexes_ready = True
+        # So the handlers embed questions the way these chunks are embedded
+        record_embedding(self.qdrant_client, self.collection_name, self.stage.provider)
+        if self.checkpoint:
+            self.checkpoint.mark_collection_recreated()
+        self._collection_ready = True
+
+    def _upsert(self, in_q: queue.Queue) -> None:
+        """Writes points in the LangChain payload layout and deletes stale ones."""
+        while True:
+            item = self._get(in_q)
+            if item is _DONE:
+                break
+            point_ids, vectors, documents, to_delete, sources = item
+            if vectors:
+                self._ensure_collection(len(vectors[0]))
+                for i in range(0, len(point_ids), UPSERT_POINTS_PER_REQUEST):
+                    self.qdrant_client.upsert(self.collection_name, points=[
+                        PointStruct(id=pid, vector=vector,
+                                    payload={"page_content": doc.page_content, "metadata": doc.metadata})
+                        for pid, vector, doc in zip(point_ids[i:i + UPSERT_POINTS_PER_REQUEST],
+                                                    vectors[i:i + UPSERT_POINTS_PER_REQUEST],
+                                                    documents[i:i + UPSERT_POINTS_PER_REQUEST])
+                    ])
+                    if self.checkpoint:
+                        self.checkpoint.mark_upserted(point_ids[i:i + UPSERT_POINTS_PER_REQUEST])
+                self.stats["upserted"] += len(point_ids)
+            if to_delete and self._collection_ready:
+                self.qdrant_client.delete(self.collection_name, points_selector=PointIdsList(points=to_delete))
+                self.stats["deleted"] += len(to_delete)
+            if self.checkpoint and sources:
+                self.checkpoint.complete_sources({source: self.manifest.files.get(source) for source in sources})
+
+    # --- driver -----------------------------------------------------------------------------
+
+    def run(self, sources: Iterable[str], prune_missing: bool = False) -> Dict:
+        """
+        Streams `sources` through every stage and returns the run's stats.
+        With prune_missing, points of sources in the manifest but not in `sources` are deleted at the end,
+        unless so many are missing that `sources` looks like a partial listing.
+        The manifest is updated in memory; the caller saves it once the run succeeded.
+        """
+        start = time.perf_counter()
+        listed: List[str] = []
+
+        def discovered():
+            for source in sources:
+                listed.append(source)
+                yield source
+
+        fetched_q, chunked_q = queue.Queue(maxsize=self.queue_size), queue.Queue(maxsize=self.queue_size)
+        # Each embedded round carries upsert_batch full vectors, so only keep one waiting behind the upsert
+        embedded_q = queue.Queue(maxsize=1)
+        threads = [
+            self._run_stage(self._download, discovered(), fetched_q),
+            self._run_stage(self._convert, fetched_q, chunked_q),
+            self._run_stage(self._embed, chunked_q, embedded_q),
+            self._run_stage(self._upsert, embedded_q),
+        ]
+        for thread in threads:
+            thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+        skip_reason = self.manifest.prune_skip_reason(listed) if prune_missing and listed else None
+        if skip_reason:
+            print(f"Not pruning: {skip_reason}. Check the PDF listing, or raise INGEST_PRUNE_MAX_DROP.")
+        elif prune_missing and listed:
+            stale_ids = self.manifest.prune(listed)
+            if stale_ids and self._collection_ready:
+                self.qdrant_client.delete(self.collection_name, points_selector=PointIdsList(points=stale_ids))
+                self.stats["deleted"] += len(stale_ids)
+        self.stats["seconds"] = round(time.perf_counter() - start, 2)
+        return self.stats
@@ -1,9 +1,20 @@
+import argparse
 import os
 import openai
-from langchain_community.vectorstores import Qdrant
-from langchain_openai import OpenAIEmbeddings
+from qdrant_client import QdrantClient
 from website_scraper import webScraper
 from pdf_chunker import PDFChunkerForQdrant
+from answer_cache import record_collection_version
+from hybrid_search import BM25Index, BM25_INDEX_PATH
+from ingest_manifest import IngestManifest, INGEST_MANIFEST_PATH
+from ingest_checkpoint import IngestCheckpoint, INGEST_CHECKPOINT_PATH, format_status
+from collection_profiles import COLLECTION_PROFILE, PROFILES, get_profile
+from collection_aliases import (garbage_collect, live_collection, smoke_check, swap_alias, version_name,
+                                wait_until_ready, warm_up)
+from ingest_pipeline import IngestPipeline
+from embedding_stage import ChunkEmbeddingCache, CHUNK_EMBEDDING_CACHE_PATH, EmbeddingStage
+from embedding_providers import (EMBEDDING, EMBEDDINGS, forget_embeddings, get_embedding, recorded_embedding,
+                                 vector_size)
 
 # --- Load credentials from environment variables ---
 # This is a more secure practice than hardcoding keys in the script.
@@ -17,65 +28,190 @@ if OPENAI_API_KEY:
     os.environ["OPENAI_API_KEY"] = OPENAI_API_KEY
     openai.api_key = OPENAI_API_KEY
 
-def main():
-    """
-    Main function to scrape data, create embeddings, and load to Qdrant.
-    """
-    print("Starting the data loading process...")
-
-    # --- API Key and Connection Validation Block ---
+def validate_openai() -> bool:
+    """Checks the OpenAI API key and connection with a lightweight call before any work starts."""
     try:
         print("Validating OpenAI API key and connection...")
         # Make a lightweight API call to test the key and connection
         client = openai.OpenAI()
         client.models.list()
         print("OpenAI API key is valid and connection is successful.")
+        return True
     except openai.AuthenticationError:
         print("ERROR: OpenAI API key is invalid or incorrect. Please check your credentials.")
-        return # Stop execution if the key is wrong
+        return False
     except openai.APIConnectionError as e:
         print(f"ERROR: Failed to connect to OpenAI API. Please check your network connection, firewall, or proxy settings.")
         print(f"Underlying error: {e.__cause__}")
-        return # Stop execution if connection fails
+        return False
+
+def main(incremental: bool = False, resume: bool = False, profile: str = COLLECTION_PROFILE,
+         embedding: str = EMBEDDING, prune: bool = False):
+    """
+    Main function to scrape data, create embeddings, and load to Qdrant.
+    With incremental=True, only PDFs that changed since the last run (per the ingest manifest)
+    are converted and embedded, and the live collection is updated in place. Otherwise a new
+    version is built next to it and the `medicaid_app` alias is switched over once it checks out.
+    With resume=True, an interrupted run picks up where its checkpoint left off, in the mode it
+    was started in, instead of starting over.
+    `profile` names the collection profile (quantization, HNSW, on-disk storage) a rebuild creates
+    the new collection with; see collection_profiles.py.
+    `embedding` names the embedding provider a rebuild embeds with (see embedding_providers.py);
+    updates and resumed runs keep the one their collection was built with.
+    With prune=True, an incremental run also deletes the chunks of PDFs no longer listed on the
+    site; it is skipped when discovery failed to fetch a page or the listing shrank sharply.
+    """
+    print("Starting the data loading process...")
+    provider = get_embedding(embedding)
+
+    # The alias the query handlers search; each full rebuild is a new medicaid_app_v<timestamp> behind it
+    collection_name = "medicaid_app"
+    checkpoint = IngestCheckpoint(INGEST_CHECKPOINT_PATH)
+    if resume and not checkpoint.unfinished(collection_name):
+        print("No interrupted run to resume; starting a new one.")
+        resume = False
+    if resume:
+        incremental = checkpoint.incremental
+    manifest = IngestManifest.load(INGEST_MANIFEST_PATH, collection_name) if incremental \
+        else IngestManifest(INGEST_MANIFEST_PATH, collection_name)
+    qdrant_client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    live = live_collection(qdrant_client, collection_name)
+    if incremental and not resume and not (manifest.files and live):
+        print("No ingest manifest or collection to update; doing a full rebuild instead.")
+        incremental = False
+        manifest = IngestManifest(INGEST_MANIFEST_PATH, collection_name)
+    if incremental and not resume:
+        # Chunks added in place must be embedded like the ones already there
+        built_with = recorded_embedding(qdrant_client, live)
+        if (built_with or provider) != provider or vector_size(qdrant_client, live) != provider.dimensions:
+            print(f"'{live}' was not embedded with {provider.cache_key}; doing a full rebuild instead.")
+            incremental = False
+            manifest = IngestManifest(INGEST_MANIFEST_PATH, collection_name)
+    if resume:
+        target = checkpoint.target_collection
+        if incremental or checkpoint.collection_recreated:
+            provider = recorded_embedding(qdrant_client, target) or provider
+    else:
+        target = live if incremental else version_name(collection_name)
+
+    # --- API Key and Connection Validation Block ---
+    if provider.kind == "openai" and not validate_openai():
+        return # Stop execution if the key is wrong or the connection fails
     # --- End of Validation Block ---
 
-    # 1. Scrape PDFs and chunk them
-    chunker = PDFChunkerForQdrant(max_char_limit=5000)
+    # 1. Scrape PDF URLs
+    # Parallel download + conversion; worker counts come from PDF_DOWNLOAD_WORKERS / PDF_CONVERT_WORKERS
+    chunker = PDFChunkerForQdrant(max_char_limit=5000, parallel=True)
     scraper = webScraper("user")
-    
-    print("Scraping website for PDF URLs and processing documents...")
-    documents = scraper.getWebsitePdfUrls(chunker)
-    
-    if not documents:
+
+    if resume:
+        # Same PDF list as the interrupted run, and the manifest entries of the PDFs it finished
+        print(f"Resuming the interrupted run:\n{format_status(checkpoint.status())}")
+        pdf_urls = checkpoint.sources()
+        checkpoint.restore(manifest)
+    else:
+        # Plain HTTP crawl of PDF_SEED_URLS (see pdf_discovery.py); PDF_SELENIUM_FALLBACK=1 adds a browser fallback
+        print("Scraping website for PDF URLs...")
+        pdf_urls = scraper.getPdfUrls()
+        if not pdf_urls:
+            print("No PDF URLs were found. Exiting.")
+            return
+        checkpoint.start(collection_name, incremental, pdf_urls, target_collection=target)
+
+    if prune and resume:
+        print("Not pruning: a resumed run reuses the interrupted run's PDF list; rerun with --incremental --prune.")
+        prune = False
+    elif prune and scraper.crawl_stats.get("pages_failed"):
+        # A page that failed to load hides its PDFs, and pruning would delete their live chunks
+        print(f"Not pruning: discovery failed to fetch {scraper.crawl_stats['pages_failed']} page(s), "
+              f"so the PDF list may be incomplete.")
+        prune = False
+
+    # 2. Stream the PDFs through download -> convert + chunk -> embed -> upsert.
+    # Embedding uses token-bounded batches sent concurrently under the EMBED_RPM / EMBED_TPM limits,
+    # skipping any chunk text already in the on-disk cache. Each document's metadata (file_name and
+    # the precomputed prompt_text) is stored in its point payload, under a point id derived from its
+    # content so later incremental runs can update it in place.
+    # Progress is checkpointed per PDF and per upsert request, so a failed run can be resumed with --resume.
+    # Local and hashing providers embed in-process and need no OpenAI client
+    stage = EmbeddingStage(openai.OpenAI() if provider.kind == "openai" else None, provider,
+                           cache=ChunkEmbeddingCache(CHUNK_EMBEDDING_CACHE_PATH))
+    # A resumed full rebuild only creates its collection if the interrupted run hadn't yet
+    recreate = not incremental and not (resume and checkpoint.collection_recreated)
+    pipeline = IngestPipeline(chunker, stage, qdrant_client, target, manifest, recreate=recreate,
+                              checkpoint=checkpoint, profile=get_profile(profile))
+    if incremental:
+        print(f"Updating collection '{target}' with the PDFs that changed...")
+    else:
+        print(f"Building Qdrant collection '{target}' with the '{profile}' profile and {provider.cache_key} embeddings"
+              + (f"; '{collection_name}' keeps serving '{live}' meanwhile..." if live else "..."))
+    stats = pipeline.run(pdf_urls, prune_missing=prune and incremental)
+    print(f"\nIngest finished: {stats}")
+    print(f"Embedding stage: {stage.stats}")
+
+    if not incremental and not resume and not stats["upserted"]:
         print("No documents were processed. Exiting.")
         return
 
-    print(f"\nSuccessfully processed {len(documents)} documents. Now loading to Qdrant Cloud...")
-    
-    # 2. Initialize embeddings
-    embeddings = OpenAIEmbeddings()
-    
-    # 3. Load documents into Qdrant Cloud
-    collection_name = "medicaid_app"
-    
-    print(f"Attempting to load documents into Qdrant collection: '{collection_name}'...")
-    qdrant_vectorstore = Qdrant.from_documents(
-        documents,
-        embeddings,
-        url=QDRANT_URL,
-        api_key=QDRANT_API_KEY,
-        collection_name=collection_name,
-        force_recreate=True, # Use True to start fresh. Use False to add to an existing collection.
-    )
-
-    print(f"\nFinished persisting {len(documents)} documents to Qdrant Cloud in collection '{collection_name}'.")
+    # Recorded once per ingest, so the handlers read the version instead of scrolling every point id
+    updated = bool(stats["upserted"] or stats["deleted"] or resume)
+    collection_version = record_collection_version(qdrant_client, target) if updated else None
+
+    # 3. A new version only goes live once Qdrant has indexed it and it passes the smoke check
+    if not incremental:
+        print(f"Waiting for Qdrant to index '{target}'...")
+        if not wait_until_ready(qdrant_client, target):
+            print(f"'{target}' is still being optimized; checking it anyway.")
+        warm_up(qdrant_client, target)
+        report = smoke_check(qdrant_client, target, live)
+        print(f"Smoke check: {report}")
+        if not report["ok"]:
+            print(f"ERROR: '{target}' failed the smoke check ({report['reason']}); '{collection_name}' still "
+                  f"serves '{live}'. Fix the cause and rerun with --resume.")
+            return
+        previous = swap_alias(qdrant_client, collection_name, target)
+        print(f"Alias '{collection_name}' now points at '{target}' (was '{previous}').")
+        deleted = garbage_collect(qdrant_client, collection_name)
+        if deleted:
+            forget_embeddings(qdrant_client, deleted)
+            print(f"Deleted old collection version(s): {', '.join(deleted)}")
+
+    # Only record the refresh once Qdrant has it, so a failed run is resumed (or redone) next time
+    manifest.save()
+    checkpoint.finish()
+
+    # 4. Save the BM25 index used by hybrid retrieval, tagged with the collection it matches
+    if not updated:
+        print("Collection is up to date.")
+        return
+    bm25_index = BM25Index.from_qdrant(qdrant_client, collection_name, collection_version=collection_version)
+    bm25_index.save(BM25_INDEX_PATH)
+    print(f"Saved BM25 index over {len(bm25_index)} chunks to '{BM25_INDEX_PATH}'.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape, chunk, embed and load the eligibility manual into Qdrant.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only re-process PDFs that changed since the last run (see ingest_manifest.py)")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted run from its checkpoint (see ingest_checkpoint.py)")
+    parser.add_argument("--status", action="store_true",
+                        help="show the progress of the last (or current) run and exit")
+    parser.add_argument("--profile", choices=list(PROFILES), default=COLLECTION_PROFILE,
+                        help="collection profile for a rebuild (see collection_profiles.py)")
+    parser.add_argument("--embedding", choices=list(EMBEDDINGS), default=EMBEDDING,
+                        help="embedding provider for a rebuild (see embedding_providers.py)")
+    parser.add_argument("--prune", action="store_true",
+                        help="with --incremental, delete the chunks of PDFs no longer listed on the site")
+    args = parser.parse_args()
+
+    if args.status:
+        print(format_status(IngestCheckpoint(INGEST_CHECKPOINT_PATH).status()))
     # Check if all required environment variables are loaded before running main()
-    if not all([QDRANT_URL, QDRANT_API_KEY, OPENAI_API_KEY]):
+    elif not all([QDRANT_URL, QDRANT_API_KEY, OPENAI_API_KEY]):
         print("---")
         print("ERROR: One or more required environment variables are not set.")
         print("Please set QDRANT_URL, QDRANT_API_KEY, and OPENAI_API_KEY before running the script.")
         print("---")
     else:
-        main()
\ No newline at end of file
+        main(incremental=args.incremental, resume=args.resume, profile=args.profile, embedding=args.embedding,
+             prune=args.prune)
\ No newline at end of file
@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import threading
+from typing import Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from embedding_providers import EmbeddingProvider, recorded_embedding
+from search_filters import SearchFilter, document_code
+
+# In-process exact vector search.
+# The corpus is one state's eligibility manual (a few thousand chunks), small enough that an
+# exact top-k over every chunk is a single matrix-vector product. A snapshot directory holds:
+#   vectors.npy    - (n, dim) unit-normalized float32 or float16 matrix, memory-mapped on load
+#   payloads.jsonl - one {"id": ..., "payload": {...}} record per row, in LangChain payload layout
+#   offsets.npy    - (n + 1) byte offsets of each record in payloads.jsonl
+#   meta.json      - dim, dtype, count, the collection version the snapshot was taken from and the
+#                    embedding its vectors were made with (see embedding_providers.py)
+# LocalVectorStore puts this behind the same LangChain VectorStore interface as the Qdrant store.
+# Filtered searches mask rows on numpy columns of the filterable metadata (see search_filters.py),
+# decoded from payloads.jsonl on the first filtered search, before taking the top k.
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_vector_index")
+
+# Rows scored per block, so float16 snapshots are upcast a slice at a time rather than all at once
+_BLOCK_ROWS = 8192
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def write_snapshot(out_dir: str, ids: List[Any], vectors, payloads: List[dict], dtype: str = "float32",
+                   collection_version: str = "", embedding_provider: Optional[EmbeddingProvider] = None) -> None:
+    """Writes a snapshot directory from parallel lists of point ids, vectors and payloads."""
+    if dtype not in ("float32", "float16"):
+        raise ValueError("dtype must be 'float32' or 'float16'.")
+    os.makedirs(out_dir, exist_ok=True)
+    matrix = _normalize_rows(np.asarray(vectors, dtype=np.float32)).astype(dtype)
+    np.save(os.path.join(out_dir, "vectors.npy"), matrix)
+
+    offsets = [0]
+    with open(os.path.join(out_dir, "payloads.jsonl"), "wb") as f:
+        for point_id, payload in zip(ids, payloads):
+            line = (json.dumps({"id": point_id, "payload": payload}) + "\n").encode("utf-8")
+            f.write(line)
+            offsets.append(offsets[-1] + len(line))
+    np.save(os.path.join(out_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"dim": int(matrix.shape[1]) if len(matrix) else 0, "dtype": dtype, "count": len(ids),
+                   "collection_version": collection_version,
+                   "embedding": embedding_provider.to_payload() if embedding_provider else None}, f)
+    print(f"Wrote local vector index with {len(ids)} vectors ({dtype}) to '{out_dir}'.")
+
+
+def snapshot_from_qdrant(qdrant_client, collection_name: str, out_dir: str = LOCAL_INDEX_DIR,
+                         dtype: str = "float32", collection_version: str = "") -> None:
+    """Copies every point (vector + payload) of a Qdrant collection into a snapshot directory."""
+    ids, vectors, payloads, offset = [], [], [], None
+    while True:
+        points, offset = qdrant_client.scroll(
+            collection_name=collection_name, limit=256, offset=offset, with_payload=True, with_vectors=True,
+        )
+        for point in points:
+            vector = point.vector
+            if isinstance(vector, dict):
+                # Single unnamed vector is all the LangChain collection has; take the first named one otherwise
+                vector = next(iter(vector.values()))
+            ids.append(point.id)
+            vectors.append(vector)
+            payloads.append(point.payload or {})
+        if offset is None:
+            break
+    write_snapshot(out_dir, ids, vectors, payloads, dtype=dtype, collection_version=collection_version,
+                   embedding_provider=recorded_embedding(qdrant_client, collection_name))
+
+
+def snapshot_from_documents(documents: List[Document], embeddings: Embeddings, out_dir: str = LOCAL_INDEX_DIR,
+                            dtype: str = "float32", collection_version: str = "",
+                            embedding_provider: Optional[EmbeddingProvider] = None) -> None:
+    """
+    Embeds ingest output (PDFChunkerForQdrant documents) and writes it as a snapshot directory;
+    `embedding_provider`, the provider behind `embeddings`, is recorded for the query side.
+    """
+    vectors = embeddings.embed_documents([d.page_content for d in documents])
+    payloads = [{"page_content": d.page_content, "metadata": d.metadata} for d in documents]
+    write_snapshot(out_dir, list(range(len(documents))), vectors, payloads, dtype=dtype,
+                   collection_version=collection_version, embedding_provider=embedding_provider)
+
+
+class LocalVectorIndex:
+    """Memory-mapped snapshot answering exact top-k cosine queries."""
+
+    def __init__(self, index_dir: str = LOCAL_INDEX_DIR):
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.vectors = np.load(os.path.join(index_dir, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(index_dir, "offsets.npy"))
+        self._payload_bytes = np.memmap(os.path.join(index_dir, "payloads.jsonl"), dtype=np.uint8, mode="r") \
+            if self.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        self._columns = None
+        self._columns_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @property
+    def collection_version(self) -> str:
+        return self.meta.get("collection_version", "")
+
+    @property
+    def embedding(self) -> Optional[EmbeddingProvider]:
+        """The provider the snapshot's vectors were made with, if recorded."""
+        payload = self.meta.get("embedding")
+        return EmbeddingProvider.from_payload(payload) if payload else None
+
+    def record(self, row: int) -> dict:
+        """Returns the {"id", "payload"} record stored for a row."""
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return json.loads(self._payload_bytes[start:end].tobytes())
+
+    def _metadata_columns(self) -> dict:
+        """document_code, chapter and document_date per row, plus the rows of each section code."""
+        if self._columns is None:
+            with self._columns_lock:
+                if self._columns is None:
+                    codes, chapters, dates, section_rows = [], [], [], {}
+                    for row in range(len(self)):
+                        metadata = self.record(row)["payload"].get("metadata") or {}
+                        codes.append(metadata.get("document_code") or document_code(metadata.get("file_name", "")))
+                        chapters.append(metadata.get("chapter"))
+                        dates.append(metadata.get("document_date") or "")
+                        for section in metadata.get("sections") or ():
+                            section_rows.setdefault(section, []).append(row)
+                    self._columns = {
+                        "document_code": np.array(codes, dtype=object),
+                        "chapter": np.array(chapters, dtype=object),
+                        "document_date": np.array(dates, dtype=str),
+                        "sections": {s: np.array(rows, dtype=np.int64) for s, rows in section_rows.items()},
+                    }
+        return self._columns
+
+    def filter_mask(self, search_filter: SearchFilter) -> np.ndarray:
+        """Boolean mask of the rows SearchFilter.matches() accepts, computed on the metadata columns."""
+        columns = self._metadata_columns()
+        mask = np.ones(len(self), dtype=bool)
+        if search_filter.document_codes:
+            mask &= np.isin(columns["document_code"], list(search_filter.document_codes))
+        if search_filter.chapters:
+            mask &= np.isin(columns["chapter"], list(search_filter.chapters))
+        if search_filter.sections:
+            in_sections = np.zeros(len(self), dtype=bool)
+            for section in search_filter.sections:
+                in_sections[columns["sections"].get(section, [])] = True
+            mask &= in_sections
+        dates = columns["document_date"]
+        if search_filter.date_from or search_filter.date_to:
+            mask &= dates != ""
+        if search_filter.date_from:
+            mask &= dates >= search_filter.date_from[:10]
+        if search_filter.date_to:
+            mask &= dates <= search_filter.date_to[:10]
+        return mask
+
+    def search(self, query_vector, k: int = 3, mask: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Returns the k (row, cosine score) pairs with the highest scores, best first; with a boolean
+        `mask` (see filter_mask), only among the rows it selects.
+        """
+        n = len(self)
+        if n == 0:
+            return []
+        query = np.array(query_vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        if self.vectors.dtype == np.float32 and n <= _BLOCK_ROWS:
+            scores = self.vectors @ query
+        else:
+            scores = np.empty(n, dtype=np.float32)
+            for start in range(0, n, _BLOCK_ROWS):
+                block = np.asarray(self.vectors[start:start + _BLOCK_ROWS], dtype=np.float32)
+                scores[start:start + len(block)] = block @ query
+        rows = np.arange(n) if mask is None else np.flatnonzero(mask)
+        k = min(k, len(rows))
+        if k == 0:
+            return []
+        candidate_scores = scores if mask is None else scores[rows]
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = top[np.argsort(-candidate_scores[top])]
+        return [(int(rows[i]), float(candidate_scores[i])) for i in top]
+
+
+class LocalVectorStore(VectorStore):
+    """Read-only LangChain VectorStore over a LocalVectorIndex; a drop-in for the Qdrant store at query time."""
+
+    def __init__(self, index: LocalVectorIndex, embeddings: Embeddings):
+        self.index = index
+        self._embeddings = embeddings
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embeddings
+
+    def _to_document(self, row: int) -> Document:
+        payload = self.index.record(row)["payload"]
+        return Document(page_content=payload.get("page_content", ""), metadata=payload.get("metadata") or {})
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """
+        Exact top-k search. A `filter` must be a search_filters.SearchFilter, applied to the
+        index's metadata columns before ranking; Qdrant filters can't be evaluated here and are rejected.
+        """
+        search_filter = kwargs.get("filter")
+        mask = None
+        if search_filter is not None:
+            if not isinstance(search_filter, SearchFilter):
+                raise ValueError(f"LocalVectorStore can only filter on a search_filters.SearchFilter, "
+                                 f"not {type(search_filter).__name__}.")
+            mask = self.index.filter_mask(search_filter)
+        return [(self._to_document(row), score) for row, score in self.index.search(embedding, k, mask=mask)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self._embeddings.embed_query(query), k, **kwargs)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self._embeddings.embed_query(query), k, **kwargs)
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    def all_documents(self) -> List[Document]:
+        """Every stored chunk, e.g. for building the BM25 index without a Qdrant round trip."""
+        return [self._to_document(row) for row in range(len(self.index))]
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("LocalVectorStore is read-only; rebuild the snapshot to add documents.")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   index_dir: str = LOCAL_INDEX_DIR, **kwargs: Any) -> "LocalVectorStore":
+        documents = [Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas or [{}] * len(texts))]
+        snapshot_from_documents(documents, embedding, out_dir=index_dir, **kwargs)
+        return cls(LocalVectorIndex(index_dir), embedding)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Snapshot a Qdrant collection into a local vector index.")
+    parser.add_argument("--collection", default="medicaid_app")
+    parser.add_argument("--out-dir", default=LOCAL_INDEX_DIR)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+
+    from qdrant_client import QdrantClient
+    from answer_cache import get_collection_version
+
+    client = QdrantClient(url=os.getenv("QDRANT_URL"), api_key=os.getenv("QDRANT_API_KEY"))
+    snapshot_from_qdrant(client, args.collection, out_dir=args.out_dir, dtype=args.dtype,
+                         collection_version=get_collection_version(client, args.collection))
+
+
+if __name__ == "__main__":
+    main()
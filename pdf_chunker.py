@@ -9,40 +9,149 @@ import re
 from pathlib import Path
 import requests
 import shutil
-from typing import List, Dict, Tuple
-from collections import defaultdict
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from typing import List, Dict, Tuple, Optional, Union, Mapping
+from bs4 import BeautifulSoup
+
+from resource_registry import get_requests_session
+from search_filters import document_code, section_code
 
 # Assumption: You have installed the necessary libraries
 # pip install requests langchain-community langchain-core pymupdf
 try:
     from langchain_core.documents import Document
-    from langchain_pymupdf4llm import PyMuPDF4LLMLoader
+    from langchain_core.documents.base import Blob
+    from langchain_pymupdf4llm import PyMuPDF4LLMLoader, PyMuPDF4LLMParser
 except ImportError:
     raise ImportError(
         "LangChain libraries not found. Please install with: "
         "`pip install langchain-community langchain-core pymupdf`"
     )
 
+# Parallel mode: downloads are network-bound and run on threads; markdown conversion and
+# chunking are CPU-bound and run in worker processes. Set PDF_PARALLEL=1 to make it the default.
+PDF_PARALLEL = os.getenv("PDF_PARALLEL", "0") == "1"
+PDF_DOWNLOAD_WORKERS = int(os.getenv("PDF_DOWNLOAD_WORKERS", "8"))
+# 0 means one conversion process per CPU core
+PDF_CONVERT_WORKERS = int(os.getenv("PDF_CONVERT_WORKERS", "0"))
+
+# In-memory mode: downloaded PDFs are opened by PyMuPDF straight from the response bytes instead of
+# being written to ./temp_pdf_downloads and read back. Set PDF_IN_MEMORY=0 to go through disk.
+PDF_IN_MEMORY = os.getenv("PDF_IN_MEMORY", "1") == "1"
+# Downloads are read in blocks of this size, and refused past PDF_MAX_BYTES
+PDF_READ_BLOCK_BYTES = 1 << 16
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(200 * 2 ** 20)))
+
+
+def download_pdf(url: str, headers: Optional[Dict[str, str]] = None, timeout: float = 30,
+                 max_bytes: int = PDF_MAX_BYTES) -> Tuple[int, bytes, Mapping[str, str]]:
+    """
+    GETs `url` over the shared keep-alive session and returns (status code, body, response headers).
+    Pass If-None-Match / If-Modified-Since in `headers` for a conditional GET; a 304 comes back
+    with an empty body. The body is streamed in blocks so an oversized file is dropped early.
+    """
+    with get_requests_session().get(url, headers=headers, timeout=timeout, stream=True) as response:
+        if response.status_code == 304:
+            # Reading the (empty) body hands the connection back to the pool instead of closing it
+            return 304, response.content, response.headers
+        response.raise_for_status()
+        if int(response.headers.get("Content-Length") or 0) > max_bytes:
+            raise ValueError(f"'{url}' is larger than {max_bytes} bytes")
+        blocks, size = [], 0
+        for block in response.iter_content(PDF_READ_BLOCK_BYTES):
+            size += len(block)
+            if size > max_bytes:
+                raise ValueError(f"'{url}' is larger than {max_bytes} bytes")
+            blocks.append(block)
+        return response.status_code, b"".join(blocks), response.headers
+
+
+# Chunks are lists of spans into the converted pages' text rather than strings built up with +=,
+# so splitting and consolidating never copy text; each chunk's text is assembled exactly once,
+# when its Document is created.
+_CHUNK_SEPARATOR = "\n\n---\n\n"
+
+
+class _Span:
+    """Characters [start, end) of buffers[buffer]."""
+    __slots__ = ("buffer", "start", "end")
+
+    def __init__(self, buffer: int, start: int, end: int):
+        self.buffer = buffer
+        self.start = start
+        self.end = end
+
+
+class _Chunk:
+    """
+    A chunk as spans over the shared page buffers, with its text length kept alongside, and the
+    header line of every section it holds text of.
+    """
+    __slots__ = ("buffers", "page_numbers", "spans", "length", "headers")
+
+    def __init__(self, buffers: List[str], page_numbers: List[int], spans: List[_Span], length: int,
+                 headers: Optional[List[str]] = None):
+        self.buffers = buffers
+        self.page_numbers = page_numbers
+        self.spans = spans
+        self.length = length
+        self.headers = headers if headers is not None else []
+
+    def text(self) -> str:
+        return "".join([self.buffers[span.buffer][span.start:span.end] for span in self.spans])
+
+    def pages(self) -> List[int]:
+        """Page number of every span except separators, as the string-based chunker's page lists recorded them."""
+        separator = len(self.buffers) - 1
+        return [self.page_numbers[span.buffer] for span in self.spans if span.buffer != separator]
+
+
 class PDFChunkerForQdrant:
     """
     Processes one or more PDFs according to a specific 5-step algorithm,
     preparing documents for storage in a vector database like Qdrant.
     """
 
-    def __init__(self, max_char_limit: int):
+    def __init__(self, max_char_limit: int, parallel: bool = PDF_PARALLEL,
+                 download_workers: int = PDF_DOWNLOAD_WORKERS, convert_workers: int = PDF_CONVERT_WORKERS,
+                 in_memory: bool = PDF_IN_MEMORY):
         if not isinstance(max_char_limit, int) or max_char_limit <= 0:
             raise ValueError("max_char_limit must be a positive integer.")
         self.max_char_limit = max_char_limit
-        self.download_dir = Path("./temp_pdf_downloads")
-        self.download_dir.mkdir(exist_ok=True)
+        self.parallel = parallel
+        self.download_workers = max(1, download_workers)
+        self.convert_workers = convert_workers if convert_workers > 0 else (os.cpu_count() or 1)
+        self.in_memory = in_memory
+        # Created on first use; in-memory mode never needs it
+        self._download_dir: Optional[Path] = None
+        # Copies of the chunker are pickled into conversion processes; only the creating process cleans up
+        self._owner_pid = os.getpid()
+
+    @property
+    def download_dir(self) -> Path:
+        """This chunker's own folder under ./temp_pdf_downloads, so chunkers never delete each other's downloads."""
+        if self._download_dir is None:
+            Path("./temp_pdf_downloads").mkdir(exist_ok=True)
+            self._download_dir = Path(tempfile.mkdtemp(dir="./temp_pdf_downloads"))
+        return self._download_dir
 
     def __del__(self):
+        if getattr(self, "_owner_pid", None) != os.getpid() or getattr(self, "_download_dir", None) is None:
+            return
         if self.download_dir.exists():
             shutil.rmtree(self.download_dir)
+            try:
+                self.download_dir.parent.rmdir()
+            except OSError:
+                pass  # Another chunker's folder is still in use
             print("\nCleaned up temporary download directory.")
 
     def process_pdfs(self, pdf_sources: List[str]) -> List[Document]:
         """Processes a list of PDFs from URLs or local paths."""
+        if self.parallel and len(pdf_sources) > 1:
+            return self._process_pdfs_parallel(pdf_sources)
         all_documents = []
         print(f"--- Starting batch processing for {len(pdf_sources)} source(s) ---")
         for source in pdf_sources:
@@ -56,45 +165,110 @@ class PDFChunkerForQdrant:
         print(f"\n--- ✅ Batch processing complete. Generated a total of {len(all_documents)} documents. ---")
         return all_documents
 
+    def _process_pdfs_parallel(self, pdf_sources: List[str]) -> List[Document]:
+        """
+        Same output as the serial loop, in the same order: URLs are downloaded on a thread pool,
+        and each PDF is handed to a process pool for conversion and chunking as soon as it has arrived.
+        """
+        print(f"--- Starting parallel processing for {len(pdf_sources)} source(s) "
+              f"({self.download_workers} download threads, {self.convert_workers} conversion processes) ---")
+        results: List[Optional[List[Document]]] = [None] * len(pdf_sources)
+
+        # spawn rather than fork: the download threads are running while workers start
+        with ThreadPoolExecutor(max_workers=self.download_workers) as downloads, \
+                ProcessPoolExecutor(max_workers=self.convert_workers,
+                                    mp_context=multiprocessing.get_context("spawn")) as conversions:
+            download_futures = {downloads.submit(self._fetch_pdf, source): i for i, source in enumerate(pdf_sources)}
+            conversion_futures = {}
+            for future in as_completed(download_futures):
+                i = download_futures[future]
+                try:
+                    file_name, pdf = future.result()
+                except (IOError, FileNotFoundError, requests.RequestException, ValueError) as e:
+                    print(f"--- ❌ Error processing '{pdf_sources[i]}': {e}. Skipping this file. ---")
+                    results[i] = []
+                    continue
+                except Exception as e:
+                    print(f"--- ❌ Critical error processing '{pdf_sources[i]}': {e}. Skipping. ---")
+                    results[i] = []
+                    continue
+                conversion_futures[conversions.submit(self._convert_and_chunk, pdf_sources[i], file_name, pdf)] = i
+
+            for future in as_completed(conversion_futures):
+                i = conversion_futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"--- ❌ Critical error processing '{pdf_sources[i]}': {e}. Skipping. ---")
+                    results[i] = []
+
+        all_documents = [doc for documents in results for doc in documents or []]
+        print(f"\n--- ✅ Batch processing complete. Generated a total of {len(all_documents)} documents. ---")
+        return all_documents
+
+    def _convert_and_chunk(self, pdf_source: str, file_name: str, pdf: Union[str, bytes]) -> List[Document]:
+        """Process-pool half of the parallel mode: conversion and steps 2-5 for a fetched PDF (path or bytes)."""
+        try:
+            print(f"\n--- Starting processing for: {pdf_source} ---")
+            return self._chunk_pages(file_name, self._convert_pdf(pdf, file_name))
+        except (IOError, FileNotFoundError, ValueError) as e:
+            print(f"--- ❌ Error processing '{pdf_source}': {e}. Skipping this file. ---")
+            return []
+
     def _process_single_pdf(self, pdf_source: str) -> List[Document]:
         """Orchestrates the 5-step processing pipeline for a single PDF."""
         try:
             print(f"\n--- Starting processing for: {pdf_source} ---")
 
             file_name, pages = self._load_and_convert_pdf(pdf_source)
-            if not pages:
-                return []
+            return self._chunk_pages(file_name, pages)
 
-            initial_chunks_data = self._create_initial_chunks(pages)
-            print(f"Steps 2 & 3: Divided into {len(initial_chunks_data)} initial chunks.")
+        except (IOError, FileNotFoundError, requests.RequestException, ValueError) as e:
+            print(f"--- ❌ Error processing '{pdf_source}': {e}. Skipping this file. ---")
+            return []
 
-            consolidated_data = self._consolidate_chunks(initial_chunks_data)
-            print(f"Step 4: Consolidated into {len(consolidated_data)} final chunks.")
-            #for chunk in consolidated_data:
-                #print("\nchunky--------------------\n", chunk)
+    def _chunk_pages(self, file_name: str, pages: List[Document]) -> List[Document]:
+        """Steps 2-5 for one converted PDF."""
+        if not pages:
+            return []
 
-            final_documents = self._create_langchain_documents(consolidated_data, file_name)
+        initial_chunks_data = self._create_initial_chunks(pages)
+        print(f"Steps 2 & 3: Divided into {len(initial_chunks_data)} initial chunks.")
 
-            print(f"--- ✅ Successfully processed '{file_name}' into {len(final_documents)} documents. ---")
-            return final_documents
+        consolidated_data = self._consolidate_chunks(initial_chunks_data)
+        print(f"Step 4: Consolidated into {len(consolidated_data)} final chunks.")
+        #for chunk in consolidated_data:
+            #print("\nchunky--------------------\n", chunk)
 
-        except (IOError, FileNotFoundError, requests.RequestException, ValueError) as e:
-            print(f"--- ❌ Error processing '{pdf_source}': {e}. Skipping this file. ---")
-            return []
+        final_documents = self._create_langchain_documents(consolidated_data, file_name,
+                                                           document_date=self._document_date(pages))
+
+        print(f"--- ✅ Successfully processed '{file_name}' into {len(final_documents)} documents. ---")
+        return final_documents
 
     def _load_and_convert_pdf(self, pdf_source: str) -> Tuple[str, List[Document]]:
         """Step 1: Downloads/finds PDF and converts to markdown pages."""
+        file_name, pdf = self._fetch_pdf(pdf_source)
+        return file_name, self._convert_pdf(pdf, file_name)
+
+    def _fetch_pdf(self, pdf_source: str) -> Tuple[str, Union[str, bytes]]:
+        """
+        Step 1a: Downloads a URL or checks a local path; returns (file_name, PDF).
+        The PDF is the downloaded bytes in in-memory mode, otherwise a path on disk.
+        """
         if pdf_source.startswith("http"):
-            response = requests.get(pdf_source, timeout=30)
-            response.raise_for_status()
+            _, content, _ = download_pdf(pdf_source)
             base_name = os.path.basename(pdf_source.split("?")[0])
             if not base_name.lower().endswith('.pdf'):
                 base_name = "download.pdf"
+            file_name = base_name
+            if self.in_memory:
+                print(f"Downloaded '{file_name}' ({len(content)} bytes)")
+                return file_name, content
 
             pdf_path = self.download_dir / f"{Path(base_name).stem}_{os.urandom(4).hex()}.pdf"
-            pdf_path.write_bytes(response.content)
+            pdf_path.write_bytes(content)
             source_path_for_loader = str(pdf_path)
-            file_name = base_name
             print(f"Downloaded '{file_name}' to '{pdf_path}'")
         else:
             pdf_path = Path(pdf_source)
@@ -102,94 +276,113 @@ class PDFChunkerForQdrant:
                  raise FileNotFoundError(f"Local PDF file not found at: {pdf_source}")
             file_name = pdf_path.name
             source_path_for_loader = str(pdf_path)
+        return file_name, source_path_for_loader
 
+    def _convert_pdf(self, pdf: Union[str, bytes], file_name: str) -> List[Document]:
+        """Step 1b: Converts a PDF, given as a path on disk or as its bytes, to markdown pages."""
         print(f"Loading and converting '{file_name}' to markdown...")
-        loader = PyMuPDF4LLMLoader(source_path_for_loader)
+        if isinstance(pdf, bytes):
+            # PyMuPDF opens the blob as an in-memory stream; nothing touches the disk
+            loaded_pages = list(PyMuPDF4LLMParser(mode="page").lazy_parse(Blob.from_data(pdf, path=file_name)))
+        else:
+            loaded_pages = PyMuPDF4LLMLoader(pdf).load()
         # Add the file_name to each page's metadata right away
-        loaded_pages = loader.load()
         for page in loaded_pages:
             page.metadata['file_name'] = file_name
-        return file_name, loaded_pages
+        return loaded_pages
 
-    def _create_initial_chunks(self, pages: List[Document]) -> List[Dict]:
+    def _create_initial_chunks(self, pages: List[Document]) -> List["_Chunk"]:
         """Steps 2 & 3: Identify sections and chunk them by page, tracking page numbers."""
         file_name = pages[0].metadata['file_name']
         prefix = os.path.splitext(file_name)[0][:2]
         header_pattern = re.compile(rf"^\s*(\*\*{re.escape(prefix)}[^\*]+\*\*)\s*$", re.MULTILINE)
+        # Every header contains this; a substring test is far cheaper than running the pattern over the page
+        header_marker = f"**{prefix}"
 
-        sections = []
-        current_section_pages = []
-
-        for page in pages:
-            page_num = page.metadata.get('page', 0)
-            content = page.page_content
-            headers_on_page = list(header_pattern.finditer(content))
-
-            if not headers_on_page:
-                current_section_pages.append({'num': page_num, 'content': content})
-            else:
-                last_pos = 0
-                for match in headers_on_page:
-                    pre_header_content = content[last_pos:match.start()]
-                    if pre_header_content.strip():
-                        current_section_pages.append({'num': page_num, 'content': pre_header_content})
-
-                    if current_section_pages:
-                        sections.append(current_section_pages)
-
-                    current_section_pages = [{'num': page_num, 'content': match.group(0)}]
-                    last_pos = match.end()
+        # Every piece of text is a span into its page's content; the last buffer is the separator
+        # _consolidate_chunks puts between chunks, which belongs to no page
+        buffers = [page.page_content for page in pages] + [_CHUNK_SEPARATOR]
+        page_numbers = [page.metadata.get('page', 0) for page in pages] + [-1]
 
-                remaining_content = content[last_pos:]
-                if remaining_content.strip():
-                    # This content belongs to the new section started by the last header
-                    current_section_pages.append({'num': page_num, 'content': remaining_content})
-
-        if current_section_pages:
-            sections.append(current_section_pages)
+        sections = []
+        current_section_spans = []
+        # Header line of each section; text before the first header has none
+        section_headers = []
+        current_header = None
+
+        for i, content in enumerate(buffers[:-1]):
+            last_pos = 0
+            for match in (header_pattern.finditer(content) if header_marker in content else ()):
+                # Content before the header
+                if content[last_pos:match.start()].strip():
+                    current_section_spans.append(_Span(i, last_pos, match.start()))
+
+                if current_section_spans:
+                    sections.append(current_section_spans)
+                    section_headers.append(current_header)
+
+                current_section_spans = [_Span(i, match.start(), match.end())]
+                current_header = match.group(1)
+                last_pos = match.end()
+
+            if last_pos == 0:
+                # No header on this page: all of it (even if blank) continues the current section
+                current_section_spans.append(_Span(i, 0, len(content)))
+            elif content[last_pos:].strip():
+                # This content belongs to the new section started by the last header
+                current_section_spans.append(_Span(i, last_pos, len(content)))
+
+        if current_section_spans:
+            sections.append(current_section_spans)
+            section_headers.append(current_header)
 
         initial_chunks = []
-        for section_pages in sections:
-            section_content = "".join([p['content'] for p in section_pages])
+        for section_spans, header in zip(sections, section_headers):
+            section_length = sum(span.end - span.start for span in section_spans)
+            headers = [header] if header else []
 
-            if len(section_content) <= self.max_char_limit:
-                page_nums = [p['num'] for p in section_pages]
-                initial_chunks.append({'content': section_content, 'pages': page_nums})
+            if section_length <= self.max_char_limit:
+                initial_chunks.append(_Chunk(buffers, page_numbers, section_spans, section_length, headers))
             else:
-                current_chunk_content = ""
-                current_chunk_pages = []
-
-                for page_data in section_pages:
-                    page_len = len(page_data['content'])
-                    if current_chunk_content and len(current_chunk_content) + page_len > self.max_char_limit:
-                        initial_chunks.append({'content': current_chunk_content, 'pages': current_chunk_pages})
-                        current_chunk_content = page_data['content']
-                        current_chunk_pages = [page_data['num']]
+                current_spans, current_length = [], 0
+
+                for span in section_spans:
+                    span_length = span.end - span.start
+                    if current_length and current_length + span_length > self.max_char_limit:
+                        initial_chunks.append(_Chunk(buffers, page_numbers, current_spans, current_length,
+                                                     list(headers)))
+                        current_spans, current_length = [span], span_length
                     else:
-                        current_chunk_content += page_data['content']
-                        current_chunk_pages.append(page_data['num'])
+                        current_spans.append(span)
+                        current_length += span_length
 
-                if current_chunk_content:
-                    initial_chunks.append({'content': current_chunk_content, 'pages': current_chunk_pages})
+                if current_length:
+                    initial_chunks.append(_Chunk(buffers, page_numbers, current_spans, current_length,
+                                                 list(headers)))
 
         return initial_chunks
 
-    def _consolidate_chunks(self, chunks_data: List[Dict]) -> List[Dict]:
-        """Step 4: Combines smaller chunks, merging their content and page lists."""
+    def _consolidate_chunks(self, chunks_data: List["_Chunk"]) -> List["_Chunk"]:
+        """Step 4: Combines smaller chunks, joining their spans with a separator span."""
         if not chunks_data:
             return []
 
+        first = chunks_data[0]
+        separator = _Span(len(first.buffers) - 1, 0, len(_CHUNK_SEPARATOR))
         consolidated = []
-        current_chunk = chunks_data[0].copy()
-        separator = "\n\n---\n\n"
+        current_chunk = _Chunk(first.buffers, first.page_numbers, list(first.spans), first.length,
+                               list(first.headers))
 
         for next_chunk in chunks_data[1:]:
-            if len(current_chunk['content']) + len(separator) + len(next_chunk['content']) <= self.max_char_limit:
-                current_chunk['content'] += separator + next_chunk['content']
-                current_chunk['pages'].extend(next_chunk['pages'])
+            if current_chunk.length + len(_CHUNK_SEPARATOR) + next_chunk.length <= self.max_char_limit:
+                current_chunk.spans.append(separator)
+                current_chunk.spans.extend(next_chunk.spans)
+                current_chunk.length += len(_CHUNK_SEPARATOR) + next_chunk.length
+                current_chunk.headers.extend(next_chunk.headers)
             else:
                 consolidated.append(current_chunk)
-                current_chunk = next_chunk.copy()
+                current_chunk = _Chunk(next_chunk.buffers, next_chunk.page_numbers, list(next_chunk.spans),
+                                       next_chunk.length, list(next_chunk.headers))
 
         consolidated.append(current_chunk)
         return consolidated
@@ -215,22 +408,58 @@ class PDFChunkerForQdrant:
         ranges.append(str(start) if start == end else f"{start}-{end}")
         return ", ".join(ranges)
 
-    def _create_langchain_documents(self, consolidated_data: List[Dict], file_name: str) -> List[Document]:
-        """Step 5: Creates final Langchain Document objects with detailed metadata."""
+    @staticmethod
+    def _document_date(pages: List[Document]) -> Optional[str]:
+        """The PDF's modification date, else its creation date, as 'YYYY-MM-DD'; None if it records neither."""
+        metadata = pages[0].metadata
+        for key in ('moddate', 'modDate', 'creationdate', 'creationDate'):
+            # ISO ('2024-01-05T10:00:00-06:00') or PDF ('D:20240105100000-06'00'') dates
+            match = re.match(r"(?:D:)?(\d{4})-?(\d{2})-?(\d{2})", str(metadata.get(key) or ''))
+            if match:
+                return "-".join(match.groups())
+        return None
+
+    @staticmethod
+    def _to_prompt_text(content: str) -> str:
+        """Plain text exactly as the query handlers used to extract it from each retrieved chunk."""
+        return BeautifulSoup(content, "html.parser").get_text(separator=" ", strip=True)
+
+    def _create_langchain_documents(self, consolidated_data: List["_Chunk"], file_name: str,
+                                    document_date: Optional[str] = None) -> List[Document]:
+        """
+        Step 5: Creates final Langchain Document objects with detailed metadata.
+        Besides the text header, each chunk's pages, sections and document are stored as structured
+        fields that searches can filter on (see search_filters.py).
+        """
+        code = document_code(file_name)
+        chapter = code.split("-")[0] if code else os.path.splitext(file_name)[0][:2].rstrip("-")
         final_documents = []
         for chunk_data in consolidated_data:
-            formatted_pages = self._format_page_numbers(chunk_data['pages'])
+            page_list = chunk_data.pages()
+            formatted_pages = self._format_page_numbers(page_list)
+            # Each header once, in order; a section split over several chunks repeats in each of them
+            headers = [h.strip("*").strip() for h in dict.fromkeys(chunk_data.headers)]
 
-            # Create the full content with the required header
+            # Create the full content with the required header; this is the only place chunk text is built
             full_content = (
                 f"File: {file_name}\n"
                 f"Pages: {formatted_pages}\n\n"
-                f"{chunk_data['content']}"
+                f"{chunk_data.text()}"
             )
 
             doc = Document(
                 page_content=full_content,
-                metadata={'file_name': file_name}
+                metadata={
+                    'file_name': file_name,
+                    # Prompt-ready text, so the query path doesn't re-parse every retrieved chunk
+                    'prompt_text': self._to_prompt_text(full_content),
+                    'document_code': code,
+                    'chapter': chapter,
+                    'sections': [c for c in dict.fromkeys(section_code(h) for h in headers) if c],
+                    'section_headers': headers,
+                    'pages': sorted(set(p + 1 for p in page_list)),
+                    'document_date': document_date,
+                }
             )
             final_documents.append(doc)
         return final_documents
@@ -0,0 +1,150 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import requests
+from bs4 import BeautifulSoup
+from requests.utils import requote_uri
+
+from resource_registry import get_requests_session
+
+# PDF discovery over plain HTTP.
+# The scraper used to start a full Chrome through Selenium, wait for the page's JavaScript and
+# read the PDF links off one page. The crawler below fetches the seed pages with the shared
+# requests session and parses them with BeautifulSoup, following same-site links breadth-first
+# up to a depth limit, one level at a time with every page of a level fetched concurrently.
+# PDF links are normalized (absolute, no fragment, lower-case host, no default port) and
+# deduplicated in the order they were found. A renderer such as Selenium can still be plugged
+# in for seed pages whose links only appear after JavaScript runs.
+
+PDF_SEED_URLS = [url.strip() for url in os.getenv("PDF_SEED_URLS", "https://ldh.la.gov/page/1681").split(",")
+                 if url.strip()]
+# 0 reads only the seed pages (what the Selenium scraper did); 1 also reads the pages they link to, and so on
+PDF_CRAWL_DEPTH = int(os.getenv("PDF_CRAWL_DEPTH", "0"))
+PDF_CRAWL_WORKERS = int(os.getenv("PDF_CRAWL_WORKERS", "8"))
+PDF_CRAWL_MAX_PAGES = int(os.getenv("PDF_CRAWL_MAX_PAGES", "200"))
+# Comma-separated host names the crawl may visit (subdomains included); empty means the seeds' hosts
+PDF_ALLOWED_DOMAINS = [d.strip().lower() for d in os.getenv("PDF_ALLOWED_DOMAINS", "").split(",") if d.strip()]
+# Set PDF_SELENIUM_FALLBACK=1 to render seed pages that show no PDF links in a browser
+PDF_SELENIUM_FALLBACK = os.getenv("PDF_SELENIUM_FALLBACK", "0") == "1"
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+# Links to these are never fetched as pages
+_SKIP_EXTENSIONS = (".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".zip", ".jpg", ".jpeg", ".png", ".gif",
+                    ".mp3", ".mp4")
+
+
+def normalize_url(href: str, base_url: str) -> Optional[str]:
+    """Absolute form of `href` as found on `base_url`, or None if it isn't an http(s) link."""
+    try:
+        parts = urlsplit(urljoin(base_url, href.strip()))
+        scheme, host, port = parts.scheme.lower(), parts.hostname or "", parts.port
+    except ValueError:
+        return None
+    if scheme not in _DEFAULT_PORTS or not host:
+        return None
+    netloc = host if port in (None, _DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+    return requote_uri(urlunsplit((scheme, netloc, parts.path or "/", parts.query, "")))
+
+
+def is_pdf_url(url: str) -> bool:
+    return urlsplit(url).path.lower().endswith(".pdf")
+
+
+def extract_links(html: Union[str, bytes], page_url: str) -> Tuple[List[str], List[str]]:
+    """(PDF links, other page links) on a page, normalized and deduplicated in document order."""
+    soup = BeautifulSoup(html, "html.parser")
+    base = soup.find("base", href=True)
+    base_url = urljoin(page_url, base["href"]) if base else page_url
+    pdfs, pages, seen = [], [], set()
+    for anchor in soup.find_all("a", href=True):
+        url = normalize_url(anchor["href"], base_url)
+        if url is None or url in seen:
+            continue
+        seen.add(url)
+        (pdfs if is_pdf_url(url) else pages).append(url)
+    return pdfs, pages
+
+
+class PdfCrawler:
+    """Breadth-first discovery of PDF links from seed pages, over HTTP with a depth, page and domain budget."""
+
+    def __init__(self, seeds: Iterable[str] = None, max_depth: int = PDF_CRAWL_DEPTH,
+                 allowed_domains: Iterable[str] = None, workers: int = PDF_CRAWL_WORKERS,
+                 max_pages: int = PDF_CRAWL_MAX_PAGES, timeout: float = 30,
+                 render: Optional[Callable[[str], str]] = None):
+        self.seeds = [url for url in (normalize_url(s, s) for s in (seeds or PDF_SEED_URLS)) if url]
+        self.max_depth = max_depth
+        self.allowed_domains = [d.lower() for d in (allowed_domains or PDF_ALLOWED_DOMAINS)] or \
+            sorted({urlsplit(url).hostname for url in self.seeds})
+        self.workers = max(1, workers)
+        self.max_pages = max_pages
+        self.timeout = timeout
+        # render(url) -> HTML after JavaScript ran; tried on seed pages where plain HTML has no PDF links
+        self.render = render
+        self.stats = {"pages_fetched": 0, "pages_rendered": 0, "pages_failed": 0, "pdfs_found": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _allowed(self, url: str) -> bool:
+        host = urlsplit(url).hostname or ""
+        return any(host == domain or host.endswith("." + domain) for domain in self.allowed_domains)
+
+    def _fetch_html(self, url: str) -> Optional[bytes]:
+        """The page's HTML, or None if it isn't HTML or couldn't be fetched."""
+        try:
+            with get_requests_session().get(url, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                # Only HTML is read; anything else is left unread on the wire
+                if "html" not in response.headers.get("Content-Type", "text/html").lower():
+                    return None
+                # Bytes, so BeautifulSoup can pick the encoding from the page's own <meta charset>
+                return response.content
+        except requests.RequestException as e:
+            print(f"--- ❌ Error fetching '{url}': {e}. Skipping this page. ---")
+            self._count("pages_failed")
+            return None
+
+    def _read_page(self, url: str, is_seed: bool) -> Tuple[List[str], List[str]]:
+        html = self._fetch_html(url)
+        self._count("pages_fetched")
+        pdfs, pages = extract_links(html, url) if html else ([], [])
+        if is_seed and not pdfs and self.render:
+            print(f"No PDF links in the HTML of '{url}'; rendering it in a browser...")
+            try:
+                pdfs, pages = extract_links(self.render(url), url)
+                self._count("pages_rendered")
+            except Exception as e:
+                print(f"--- ❌ Error rendering '{url}': {e}. ---")
+        return pdfs, pages
+
+    def crawl(self) -> List[str]:
+        """Every PDF URL reachable within the limits, deduplicated, in discovery order."""
+        pdf_urls: Dict[str, None] = {}
+        visited: Set[str] = set()
+        level = [url for url in dict.fromkeys(self.seeds) if self._allowed(url)]
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for depth in range(self.max_depth + 1):
+                level = level[:max(0, self.max_pages - len(visited))]
+                if not level:
+                    break
+                visited.update(level)
+                next_level: Dict[str, None] = {}
+                # map keeps results in submission order, so the output doesn't depend on timing
+                for pdfs, pages in pool.map(lambda url: self._read_page(url, depth == 0), level):
+                    for url in pdfs:
+                        if self._allowed(url):
+                            pdf_urls.setdefault(url)
+                    for url in pages:
+                        if url not in visited and self._allowed(url) and \
+                                not urlsplit(url).path.lower().endswith(_SKIP_EXTENSIONS):
+                            next_level.setdefault(url)
+                level = list(next_level)
+        self.stats["pdfs_found"] = len(pdf_urls)
+        print(f"Discovered {len(pdf_urls)} PDF link(s) on {self.stats['pages_fetched']} page(s).")
+        return list(pdf_urls)
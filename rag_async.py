@@ -0,0 +1,187 @@
+import asyncio
+from typing import Dict, List
+
+# Process-wide registry of long-lived Qdrant / OpenAI clients
+import resource_registry
+# Semantic cache of final answers for near-duplicate questions
+import answer_cache
+# Exact-match cache of question embeddings
+import embedding_cache
+# Prompt, context and answer formatting shared with the synchronous handler
+import rag_handler
+# Search params matching how the collection was built (quantization, HNSW ef)
+import collection_profiles
+# Filters on structured chunk metadata, e.g. the documents a question names
+import search_filters
+# The embedding (model and dimensions) each collection was built with
+import embedding_providers
+# Over-fetch, rerank locally and send fewer, more distinct chunks
+import reranking
+# Skips the LLM for questions nothing in the collection is relevant to
+import relevance_gate
+
+# Asyncio version of the query path (embed -> search -> generate).
+# Each stage awaits AsyncOpenAI / AsyncQdrantClient instead of blocking a thread, so a single
+# process can keep many questions in flight at once. Every stage runs under its own timeout,
+# and cancelling the calling task cancels whichever request is currently outstanding.
+
+# Seconds allowed for each stage before the question is abandoned
+STAGE_TIMEOUTS = {
+    "embed": 15.0,
+    "search": 15.0,
+    "generate": 120.0,
+}
+
+
+class StageTimeoutError(Exception):
+    """Raised when one stage of the async pipeline exceeds its timeout."""
+
+    def __init__(self, stage: str, timeout: float):
+        super().__init__(f"The '{stage}' stage did not finish within {timeout:g} seconds.")
+        self.stage = stage
+        self.timeout = timeout
+
+
+async def _run_stage(stage: str, coroutine, timeouts: Dict[str, float]):
+    timeout = timeouts.get(stage, STAGE_TIMEOUTS[stage])
+    try:
+        return await asyncio.wait_for(coroutine, timeout=timeout)
+    except asyncio.TimeoutError:
+        raise StageTimeoutError(stage, timeout) from None
+
+
+async def embed_query_async(query: str, openai_client, provider=None) -> List[float]:
+    """
+    Embeds the question with `provider` (EMBEDDING if not given), serving exact repeats from the
+    local query embedding cache. The cache is SQLite, so it is read and written off the event loop.
+    """
+    provider = provider or embedding_providers.get_embedding()
+    cache = embedding_cache.get_shared_cache()
+    vector = await asyncio.to_thread(cache.get, query, provider.cache_key)
+    if vector is None:
+        vector = (await provider.aembed([query], openai_client))[0]
+        await asyncio.to_thread(cache.put, query, provider.cache_key, vector)
+    return vector
+
+
+async def perform_qdrant_search_async(query_vector: List[float], qdrant_client,
+                                     limit: int = reranking.RERANK_MAX_K, search_params=None, search_filter=None):
+    """Searches Qdrant and returns the scored points; a search_filter that matches nothing is dropped."""
+    async def search(query_filter):
+        response = await qdrant_client.query_points(
+            collection_name=rag_handler.COLLECTION_NAME,
+            query=query_vector,
+            query_filter=query_filter,
+            limit=limit,
+            search_params=search_params,
+            with_payload=True,
+        )
+        return response.points
+
+    points = await search(search_filter.to_qdrant() if search_filter else None)
+    if not points and search_filter is not None:
+        points = await search(None)
+    return points
+
+
+async def generate_rag_answer_async(query: str, context_str: str, openai_client) -> str:
+    """Generates an answer with the same prompt as the synchronous handler."""
+    response = await openai_client.chat.completions.create(
+        model=rag_handler.CHAT_MODEL,
+        messages=rag_handler.build_messages(query, context_str),
+        temperature=0.0,
+    )
+    return response.choices[0].message.content
+
+
+async def get_final_answer_async(user_question: str, qdrant_url: str, qdrant_api_key: str, openai_api_key: str,
+                                 prefer_grpc: bool = False, use_answer_cache: bool = True,
+                                 timeouts: Dict[str, float] = None, retrieval: str = "qdrant") -> str:
+    """
+    Async entry point shared by rag_handler and rag_handler_langchain.
+    `timeouts` overrides STAGE_TIMEOUTS per stage ('embed', 'search', 'generate').
+    retrieval="langchain" retrieves the way rag_handler_langchain does, following its RETRIEVAL_MODE
+    and VECTOR_BACKEND. Hybrid and local-snapshot searches have no async client, so they run in a
+    worker thread; dense Qdrant search still uses the async client.
+    """
+    timeouts = timeouts or {}
+    langchain_handler = None
+    if retrieval == "langchain":
+        # Imported here because rag_handler_langchain re-exports this function
+        import rag_handler_langchain as langchain_handler
+    try:
+        openai_client = resource_registry.get_async_openai_client(openai_api_key)
+        sync_qdrant_client = resource_registry.get_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+
+        # 1. Embed the question the way the searched vectors were embedded (looked up off the event loop)
+        if langchain_handler is not None:
+            provider = await asyncio.to_thread(langchain_handler.get_embedding_provider, qdrant_url, qdrant_api_key,
+                                               prefer_grpc)
+        else:
+            provider = await asyncio.to_thread(embedding_providers.get_query_embedding, sync_qdrant_client,
+                                               rag_handler.COLLECTION_NAME)
+        query_vector = await _run_stage("embed", embed_query_async(user_question, openai_client, provider), timeouts)
+
+        # Serve near-duplicate questions from the answer cache. The cache is keyed to the
+        # synchronous client, which it uses to re-check the collection version now and then,
+        # so the lookup runs off the event loop.
+        cache = None
+        if use_answer_cache:
+            cache = answer_cache.get_shared_cache(sync_qdrant_client, rag_handler.COLLECTION_NAME)
+            cached = await asyncio.to_thread(cache.lookup, query_vector, user_question)
+            if cached is not None:
+                return rag_handler.format_answer(cached.answer, cached.source_urls)
+
+        # 2. Retrieve relevant documents
+        if langchain_handler is not None and not (langchain_handler.RETRIEVAL_MODE == "dense"
+                                                  and langchain_handler.VECTOR_BACKEND == "qdrant"):
+            # BM25 fusion or the in-process snapshot: the synchronous retrieval, in a worker thread
+            retrieved_docs, relevance = await _run_stage(
+                "search", asyncio.to_thread(langchain_handler.retrieve_documents_with_relevance, user_question,
+                                            query_vector, qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc),
+                timeouts)
+            if not retrieved_docs:
+                return "Could not find any relevant documents in the database to answer the question."
+            early_exit = await asyncio.to_thread(langchain_handler.check_relevance, relevance, retrieved_docs,
+                                                 qdrant_url, qdrant_api_key, prefer_grpc)
+            if early_exit is not None:
+                return early_exit
+            context_str, unique_urls = langchain_handler.build_context(retrieved_docs)
+        else:
+            qdrant_client = resource_registry.get_async_qdrant_client(qdrant_url, qdrant_api_key,
+                                                                      prefer_grpc=prefer_grpc)
+            # From the collection's settings, re-read now and then; off the event loop like the cache lookup
+            search_params = await asyncio.to_thread(collection_profiles.get_search_params, sync_qdrant_client,
+                                                    rag_handler.COLLECTION_NAME)
+            reranker = reranking.get_reranker()
+            search_results = await _run_stage(
+                "search", perform_qdrant_search_async(query_vector, qdrant_client,
+                                                      limit=reranking.fetch_limit(reranker),
+                                                      search_params=search_params,
+                                                      search_filter=search_filters.filter_for_question(user_question)),
+                timeouts)
+            if not search_results:
+                return "Could not find any relevant documents in the database to answer the question."
+            # Nothing close enough to answer from: suggest the nearest documents instead of calling gpt-4
+            if not relevance_gate.get_shared_gate().should_answer(relevance_gate.relevance(search_results),
+                                                                  provider.cache_key):
+                return relevance_gate.early_exit_answer(rag_handler.suggested_urls(search_results))
+            if reranker is not None:
+                # CPU work (a cross-encoder can take a while), kept off the event loop
+                search_results = await asyncio.to_thread(reranking.rerank_points, user_question, search_results,
+                                                         reranker)
+            context_str, unique_urls = rag_handler.build_context(search_results)
+
+        # 3. Generate a complete answer using the retrieved context
+        answer = await _run_stage("generate", generate_rag_answer_async(user_question, context_str, openai_client),
+                                  timeouts)
+        if cache is not None:
+            await asyncio.to_thread(cache.store, user_question, query_vector, answer, unique_urls)
+        return rag_handler.format_answer(answer, unique_urls)
+
+    except StageTimeoutError as e:
+        print(f"\nTimed out: {e}")
+        return f"The request timed out: {e}"
+    except Exception as e:
+        print(f"\nAn error occurred: {e}")
+        return f"An error occurred while processing your request: {e}"
@@ -1,82 +1,193 @@
 import os
 import textwrap
-from openai import OpenAI
-from qdrant_client import QdrantClient
 from bs4 import BeautifulSoup
 
+# Process-wide registry of long-lived Qdrant / OpenAI clients
+import resource_registry
+# Semantic cache of final answers for near-duplicate questions
+import answer_cache
+# Exact-match cache of question embeddings
+import embedding_cache
+# Token-budgeted, deduplicated prompt context
+import context_packer
+# Search params matching how the collection was built (quantization, HNSW ef)
+import collection_profiles
+# Filters on structured chunk metadata, e.g. the documents a question names
+import search_filters
+# The embedding (model and dimensions) each collection was built with
+import embedding_providers
+# Over-fetch, rerank locally and send fewer, more distinct chunks
+import reranking
+# Skips the LLM for questions nothing in the collection is relevant to
+import relevance_gate
+
+# Alias of the live collection version; ingest switches it atomically (see collection_aliases.py)
+COLLECTION_NAME = "medicaid_app"
+CHAT_MODEL = "gpt-4"
+SOURCE_URL_PREFIX = "https://ldh.la.gov/assets/medicaid/MedicaidEligibilityPolicy/"
+
+SYSTEM_PROMPT = textwrap.dedent("""
+    You are a helpful AI assistant. Your task is to answer the user's question based ONLY on the provided context.
+    Do not use any external knowledge.
+    If the context does not contain the answer, state that you cannot answer based on the provided information.
+""")
+
 # This function will be the main entry point for the Streamlit app
-def get_final_answer(user_question: str, qdrant_url: str, qdrant_api_key: str, openai_api_key: str) -> str:
+def get_final_answer(user_question: str, qdrant_url: str, qdrant_api_key: str, openai_api_key: str,
+                     prefer_grpc: bool = False, use_answer_cache: bool = True) -> str:
     """Main function to execute the RAG process."""
     try:
-        # 1. Initialize API clients with credentials
-        openai_client = OpenAI(api_key=openai_api_key)
-        qdrant_client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
+        # 1. Get the shared API clients for these credentials (built once per process)
+        openai_client = resource_registry.get_openai_client(openai_api_key)
+        qdrant_client = resource_registry.get_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+
+        # Embed the question once, as the collection was embedded; it serves both the answer cache and the search
+        provider = embedding_providers.get_query_embedding(qdrant_client, COLLECTION_NAME)
+        query_vector = embed_query(user_question, openai_client, provider)
+
+        # Serve near-duplicate questions straight from the answer cache
+        cache = answer_cache.get_shared_cache(qdrant_client, COLLECTION_NAME) if use_answer_cache else None
+        if cache is not None:
+            cached = cache.lookup(query_vector, user_question)
+            if cached is not None:
+                return format_answer(cached.answer, cached.source_urls)
 
         # 2. Retrieve relevant documents from Qdrant
-        search_results = perform_qdrant_search(user_question, qdrant_client, openai_client)
+        search_results = perform_qdrant_search(user_question, qdrant_client, openai_client, query_vector=query_vector,
+                                               rerank=False)
 
         if not search_results:
             return "Could not find any relevant documents in the database to answer the question."
 
+        # Nothing close enough to answer from: suggest the nearest documents instead of calling gpt-4
+        if not relevance_gate.get_shared_gate().should_answer(relevance_gate.relevance(search_results),
+                                                              provider.cache_key):
+            return relevance_gate.early_exit_answer(suggested_urls(search_results))
+        search_results = rerank_results(user_question, search_results)
+
         # 3. Generate a complete answer using the retrieved context
-        final_answer = generate_rag_answer(user_question, search_results, openai_client)
-        return final_answer
+        answer, unique_urls = generate_rag_answer(user_question, search_results, openai_client, append_sources=False)
+        if cache is not None:
+            cache.store(user_question, query_vector, answer, unique_urls)
+        return format_answer(answer, unique_urls)
 
     except Exception as e:
         print(f"\nAn error occurred: {e}")
         return f"An error occurred while processing your request: {e}"
 
-def perform_qdrant_search(query, qdrant_client, openai_client):
-    """Searches Qdrant and returns the search results."""
-    collection_name = "medicaid_app"
-    model_name = "text-embedding-ada-002"
-    
-    response = openai_client.embeddings.create(input=query, model=model_name)
-    query_vector = response.data[0].embedding
-
-    search_results = qdrant_client.search(
-        collection_name=collection_name,
-        query_vector=query_vector,
-        limit=3,
-        with_payload=True
-    )
-    return search_results
+async def get_final_answer_async(user_question: str, qdrant_url: str, qdrant_api_key: str, openai_api_key: str,
+                                 **kwargs) -> str:
+    """Asyncio variant of get_final_answer (see rag_async.get_final_answer_async for options)."""
+    # Imported here because rag_async builds on the helpers in this module
+    import rag_async
+    return await rag_async.get_final_answer_async(user_question, qdrant_url, qdrant_api_key, openai_api_key, **kwargs)
+
+def embed_query(query, openai_client, provider=None):
+    """
+    Embeds the question with `provider`, the embedding the collection was built with (EMBEDDING
+    if not given); repeated questions come from the local cache.
+    """
+    provider = provider or embedding_providers.get_embedding()
+
+    def compute(text):
+        return provider.embed([text], openai_client)[0]
+
+    return embedding_cache.get_shared_cache().get_or_compute(query, provider.cache_key, compute)
+
+def perform_qdrant_search(query, qdrant_client, openai_client, query_vector=None, search_filter=None, rerank=True):
+    """
+    Searches Qdrant and returns the search results.
+    `search_filter` (a search_filters.SearchFilter) defaults to the documents the question names;
+    if nothing matches it, the search is repeated unfiltered.
+    With a RERANKER set, RERANK_FETCH_K hits are fetched and reranked down to at most RERANK_MAX_K;
+    rerank=False returns them as fetched, for rerank_results() later.
+    """
+    if query_vector is None:
+        query_vector = embed_query(query, openai_client,
+                                   embedding_providers.get_query_embedding(qdrant_client, COLLECTION_NAME))
+    if search_filter is None:
+        search_filter = search_filters.filter_for_question(query)
+    reranker = reranking.get_reranker()
+
+    def search(query_filter):
+        return qdrant_client.search(
+            collection_name=COLLECTION_NAME,
+            query_vector=query_vector,
+            query_filter=query_filter,
+            limit=reranking.fetch_limit(reranker),
+            search_params=collection_profiles.get_search_params(qdrant_client, COLLECTION_NAME),
+            with_payload=True
+        )
 
-def generate_rag_answer(query, search_results, openai_client):
-    """Generates an answer using OpenAI with the provided search results as context."""
-    context_str = ""
-    source_urls = []
+    search_results = search(search_filter.to_qdrant() if search_filter else None)
+    if not search_results and search_filter is not None:
+        search_results = search(None)
+    return rerank_results(query, search_results) if rerank else search_results
+
+def rerank_results(query, search_results):
+    """Reranks over-fetched search results down to the chunks to send; as they are without a RERANKER."""
+    reranker = reranking.get_reranker()
+    if reranker is None:
+        return search_results
+    return reranking.rerank_points(query, search_results, reranker)
+
+def source_url(file_name):
+    return f"{SOURCE_URL_PREFIX}{file_name}"
+
+def suggested_urls(search_results):
+    """Source URLs of the search results, best first, for the early-exit response."""
+    return [source_url(result.payload.get('metadata', {}).get('file_name', 'N/A')) for result in search_results]
+
+def format_answer(answer, unique_urls):
+    """Appends the "Files Referred" block to an answer."""
+    return answer + "\n\n**Files Referred:**\n" + "\n".join([f"- {url}" for url in unique_urls])
+
+def build_context(search_results):
+    """Builds the prompt context and the sorted list of unique source URLs from Qdrant search results."""
+    chunks = []
     for result in search_results:
         payload = result.payload
-        soup = BeautifulSoup(payload.get('page_content', ''), "html.parser")
-        page_content_text = soup.get_text(separator=" ", strip=True)
-        file_name = payload.get('metadata', {}).get('file_name', 'N/A')
-        
-        context_str += f"Source (File: {file_name}):\n{page_content_text}\n---\n"
-        # Append the full URL
-        source_urls.append(f"https://ldh.la.gov/assets/medicaid/MedicaidEligibilityPolicy/{file_name}")
+        metadata = payload.get('metadata', {})
+        # Chunks ingested with a precomputed prompt_text need no parsing here
+        page_content_text = metadata.get('prompt_text')
+        if page_content_text is None:
+            soup = BeautifulSoup(payload.get('page_content', ''), "html.parser")
+            page_content_text = soup.get_text(separator=" ", strip=True)
+        # No score: results arrive best first, from Qdrant or in the reranker's order
+        chunks.append({"text": page_content_text, "file_name": metadata.get('file_name', 'N/A')})
+
+    # Deduplicate overlapping paragraphs and cap the context at the token budget
+    context_str, used_files = context_packer.build_prompt_context(chunks)
+    # Append the full URL
+    source_urls = [source_url(file_name) for file_name in used_files]
 
     unique_urls = sorted(list(set(source_urls)))
-    
-    system_prompt = textwrap.dedent("""
-        You are a helpful AI assistant. Your task is to answer the user's question based ONLY on the provided context.
-        Do not use any external knowledge.
-        If the context does not contain the answer, state that you cannot answer based on the provided information.
-    """)
-    
+    return context_str, unique_urls
+
+def build_messages(query, context_str):
+    """Builds the chat messages sent to the LLM."""
     user_prompt = f"Context:\n{context_str}\nQuestion: {query}"
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+def generate_rag_answer(query, search_results, openai_client, append_sources=True):
+    """
+    Generates an answer using OpenAI with the provided search results as context.
+    With append_sources=False returns (answer, unique_urls) instead of the formatted answer.
+    """
+    context_str, unique_urls = build_context(search_results)
 
     response = openai_client.chat.completions.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
+        model=CHAT_MODEL,
+        messages=build_messages(query, context_str),
         temperature=0.0,
     )
     
     answer = response.choices[0].message.content
+    if not append_sources:
+        return answer, unique_urls
+
     # Append the unique URLs to the final answer
-    answer += "\n\n**Files Referred:**\n" + "\n".join([f"- {url}" for url in unique_urls])
-    
-    return answer
+    return format_answer(answer, unique_urls)
\ No newline at end of file
@@ -1,15 +1,36 @@
 import os
 import textwrap
+import threading
+import time
 from bs4 import BeautifulSoup
 
 # LangChain & Qdrant imports
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_qdrant import Qdrant
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
-# Qdrant client for vector store initialization
-from qdrant_client import QdrantClient
+# Process-wide registry of long-lived Qdrant / OpenAI clients
+import resource_registry
+# Semantic cache of final answers for near-duplicate questions
+import answer_cache
+# Exact-match cache of question embeddings
+import embedding_cache
+# Dense + BM25 retrieval fused with reciprocal-rank fusion
+import hybrid_search
+# In-process exact vector search over a memory-mapped snapshot of the collection
+import local_vector_index
+# Token-budgeted, deduplicated prompt context
+import context_packer
+# Search params matching how the collection was built (quantization, HNSW ef)
+import collection_profiles
+# Filters on structured chunk metadata, e.g. the documents a question names
+import search_filters
+# The embedding (model and dimensions) each collection was built with
+import embedding_providers
+# Over-fetch, rerank locally and send fewer, more distinct chunks
+import reranking
+# Skips the LLM for questions nothing in the collection is relevant to
+import relevance_gate
 
 # Langsmith for logging and tracing
 from langsmith import traceable
@@ -19,81 +40,364 @@ from langsmith import traceable
 # os.environ["LANGCHAIN_API_KEY"] = "YOUR_LANGSMITH_API_KEY"
 # os.environ["LANGCHAIN_PROJECT"] = "YOUR_PROJECT_NAME" # Optional: "default" is used if not set
 
-# This function will be the main entry point for the Streamlit app
-@traceable(name="RAG Pipeline")
-def get_final_answer(user_question: str, qdrant_url: str, qdrant_api_key: str, openai_api_key: str) -> str:
+# Alias of the live collection version; ingest switches it atomically (see collection_aliases.py)
+COLLECTION_NAME = "medicaid_app"
+CHAT_MODEL = "gpt-4"
+SOURCE_URL_PREFIX = "https://ldh.la.gov/assets/medicaid/MedicaidEligibilityPolicy/"
+
+# "hybrid" fuses dense and BM25 results; "dense" is vector search only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Chunks sent to the LLM; with a RERANKER set, the most of them (see reranking.py)
+RETRIEVAL_K = reranking.RERANK_MAX_K
+# "qdrant" searches the remote collection; "local" searches a snapshot in LOCAL_INDEX_DIR in-process
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+
+# Serializes hybrid retriever rebuilds, so a version change builds one BM25 index rather than one per thread
+_retriever_lock = threading.Lock()
+
+SYSTEM_PROMPT = textwrap.dedent("""
+    You are a helpful AI assistant. Your task is to answer the user's question based ONLY on the provided context.
+    Do not use any external knowledge.
+    If the context does not contain the answer, state that you cannot answer based on the provided information.
+""")
+
+def get_embedding_provider(qdrant_url: str, qdrant_api_key: str, prefer_grpc: bool = False):
+    """The embedding the searched vectors were made with, as recorded by the collection or the local snapshot."""
+    if VECTOR_BACKEND == "local":
+        def read_snapshot():
+            index = local_vector_index.LocalVectorIndex(local_vector_index.LOCAL_INDEX_DIR)
+            provider = index.embedding or embedding_providers.get_embedding()
+            embedding_providers.check_dimensions(provider, index.meta.get("dim"), local_vector_index.LOCAL_INDEX_DIR)
+            return provider
+
+        return resource_registry.get_or_create(("snapshot_embedding", local_vector_index.LOCAL_INDEX_DIR),
+                                               read_snapshot)
+    qdrant_client = resource_registry.get_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+    return embedding_providers.get_query_embedding(qdrant_client, COLLECTION_NAME)
+
+def get_vector_store(qdrant_url: str, qdrant_api_key: str, openai_api_key: str, prefer_grpc: bool = False):
+    """Returns the shared LangChain vector store for the medicaid collection (Qdrant or local snapshot)."""
+    provider = get_embedding_provider(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+
+    def build_vector_store():
+        # Repeated questions are embedded from the local cache instead of the embedding API
+        embeddings = embedding_cache.CachedQueryEmbeddings(
+            provider.langchain_embeddings(openai_api_key),
+            embedding_cache.get_shared_cache(),
+            provider.cache_key,
+        )
+        if VECTOR_BACKEND == "local":
+            index = local_vector_index.LocalVectorIndex(local_vector_index.LOCAL_INDEX_DIR)
+            return local_vector_index.LocalVectorStore(index, embeddings)
+        return Qdrant(
+            client=resource_registry.get_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc),
+            collection_name=COLLECTION_NAME,
+            embeddings=embeddings,
+        )
+
+    # A collection rebuilt with another embedding gets a vector store of its own
+    key = ("vector_store", VECTOR_BACKEND, COLLECTION_NAME, provider, qdrant_url, prefer_grpc,
+           resource_registry.fingerprint(qdrant_api_key), resource_registry.fingerprint(openai_api_key))
+    return resource_registry.get_or_create(key, build_vector_store)
+
+def get_search_kwargs(qdrant_url: str, qdrant_api_key: str, prefer_grpc: bool = False) -> dict:
+    """Extra dense-search arguments for the collection's profile; none for the local snapshot, which is exact."""
+    if VECTOR_BACKEND == "local":
+        return {}
+    qdrant_client = resource_registry.get_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+    search_params = collection_profiles.get_search_params(qdrant_client, COLLECTION_NAME)
+    return {"search_params": search_params} if search_params else {}
+
+def get_hybrid_retriever(qdrant_url: str, qdrant_api_key: str, openai_api_key: str,
+                         prefer_grpc: bool = False) -> hybrid_search.HybridRetriever:
     """
-    Main function to execute the RAG process using LangChain and log with Langsmith.
+    Returns the shared hybrid retriever, loading or building its BM25 index on first use. The
+    collection version and search params are read again every EMBEDDING_RECHECK_SECONDS; a new
+    version (an incremental update or an alias switch) gets a retriever with a BM25 index of its
+    own, and new search params (a switch to a collection with another profile) a retriever using them.
     """
-    try:
-        # 1. Initialize LangChain components
-        # Initialize embeddings model
-        embeddings = OpenAIEmbeddings(
-            model="text-embedding-ada-002",
-            api_key=openai_api_key
-        )
+    provider = get_embedding_provider(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+    vector_store = get_vector_store(qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc=prefer_grpc)
 
-        # Initialize Qdrant client and LangChain vector store
-        qdrant_client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key)
-        vector_store = Qdrant(
-            client=qdrant_client,
-            collection_name="medicaid_app",
-            embeddings=embeddings
-        )
+    def read_version() -> str:
+        if VECTOR_BACKEND == "local":
+            return vector_store.index.collection_version
+        qdrant_client = resource_registry.get_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+        try:
+            return answer_cache.get_collection_version(qdrant_client, COLLECTION_NAME)
+        except Exception as e:
+            print(f"Could not read collection version for the BM25 index: {e}")
+            # Keep the index already built until the next check
+            return state.get("version", "")
 
-        # Create a retriever to fetch relevant documents
-        retriever = vector_store.as_retriever(search_kwargs={"k": 3})
+    def build_index(collection_version: str) -> hybrid_search.BM25Index:
+        if VECTOR_BACKEND == "local":
+            # The snapshot already holds every chunk, so index those directly
+            return hybrid_search.BM25Index(vector_store.all_documents(), collection_version=collection_version)
+        qdrant_client = resource_registry.get_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+        return hybrid_search.load_or_build_index(qdrant_client, COLLECTION_NAME, collection_version)
 
-        # 2. Retrieve relevant documents from Qdrant
-        retrieved_docs = retriever.invoke(user_question)
+    key = ("hybrid_retriever", VECTOR_BACKEND, COLLECTION_NAME, provider, qdrant_url, prefer_grpc,
+           resource_registry.fingerprint(qdrant_api_key), resource_registry.fingerprint(openai_api_key))
+    state = resource_registry.get_or_create(key, dict)
+    if state and time.monotonic() - state["checked_at"] < embedding_providers.EMBEDDING_RECHECK_SECONDS:
+        return state["retriever"]
+    # One thread re-checks (and rebuilds) at a time; meanwhile the others keep the current retriever
+    if not _retriever_lock.acquire(blocking=not state):
+        return state["retriever"]
+    try:
+        if not state or time.monotonic() - state["checked_at"] >= embedding_providers.EMBEDDING_RECHECK_SECONDS:
+            collection_version = read_version()
+            search_kwargs = get_search_kwargs(qdrant_url, qdrant_api_key, prefer_grpc)
+            retriever = state.get("retriever")
+            if retriever is None or collection_version != state["version"]:
+                retriever = hybrid_search.HybridRetriever(vector_store=vector_store, k=RETRIEVAL_K,
+                                                          bm25_index=build_index(collection_version),
+                                                          search_kwargs=search_kwargs)
+            elif search_kwargs != retriever.search_kwargs:
+                retriever = hybrid_search.HybridRetriever(vector_store=vector_store, k=RETRIEVAL_K,
+                                                          bm25_index=retriever.bm25_index, search_kwargs=search_kwargs)
+            state.update(retriever=retriever, version=collection_version, checked_at=time.monotonic())
+    finally:
+        _retriever_lock.release()
+    return state["retriever"]
 
-        if not retrieved_docs:
-            return "Could not find any relevant documents in the database to answer the question."
+def retrieve_documents(user_question: str, query_vector: list, qdrant_url: str, qdrant_api_key: str,
+                       openai_api_key: str, prefer_grpc: bool = False, search_filter=None) -> list:
+    """
+    Fetches the top RETRIEVAL_K chunks for a question using the configured RETRIEVAL_MODE.
+    `search_filter` (a search_filters.SearchFilter) defaults to the documents the question names;
+    if nothing matches it, the search is repeated unfiltered.
+    With a RERANKER set, RERANK_FETCH_K candidates are fetched and reranked down to at most RETRIEVAL_K.
+    """
+    return retrieve_documents_with_relevance(user_question, query_vector, qdrant_url, qdrant_api_key, openai_api_key,
+                                             prefer_grpc=prefer_grpc, search_filter=search_filter)[0]
 
-        # 3. Prepare context and source URLs from retrieved documents
-        context_str = ""
-        source_urls = []
-        for doc in retrieved_docs:
-            soup = BeautifulSoup(doc.page_content, "html.parser")
-            page_content_text = soup.get_text(separator=" ", strip=True)
-            file_name = doc.metadata.get('file_name', 'N/A')
+def retrieve_documents_with_relevance(user_question: str, query_vector: list, qdrant_url: str, qdrant_api_key: str,
+                                      openai_api_key: str, prefer_grpc: bool = False, search_filter=None) -> tuple:
+    """
+    retrieve_documents() plus the question's relevance for the relevance gate: the best dense
+    similarity among the candidates, before fusion and reranking (None if there were none).
+    """
+    if search_filter is None:
+        search_filter = search_filters.filter_for_question(user_question)
+    reranker = reranking.get_reranker()
+    k = reranking.fetch_limit(reranker)
 
-            context_str += f"Source (File: {file_name}):\n{page_content_text}\n---\n"
-            source_urls.append(f"https://ldh.la.gov/assets/medicaid/MedicaidEligibilityPolicy/{file_name}")
+    def search(active_filter):
+        if RETRIEVAL_MODE == "hybrid":
+            retriever = get_hybrid_retriever(qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc=prefer_grpc)
+            return retriever.search_by_vector_with_relevance(user_question, query_vector, search_filter=active_filter,
+                                                             k=k)
+        vector_store = get_vector_store(qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc=prefer_grpc)
+        search_kwargs = get_search_kwargs(qdrant_url, qdrant_api_key, prefer_grpc)
+        if active_filter is not None:
+            # The local snapshot store applies the SearchFilter itself
+            search_kwargs["filter"] = active_filter if VECTOR_BACKEND == "local" else active_filter.to_qdrant()
+        scored = vector_store.similarity_search_with_score_by_vector(query_vector, k=k, **search_kwargs)
+        return scored, max((score for _, score in scored), default=None)
 
-        unique_urls = sorted(list(set(source_urls)))
+    scored_documents, relevance = search(search_filter)
+    if not scored_documents and search_filter is not None:
+        scored_documents, relevance = search(None)
+    if reranker is not None:
+        return reranking.rerank_documents(user_question, scored_documents, reranker), relevance
+    return [doc for doc, _ in scored_documents], relevance
 
-        # 4. Generate a complete answer using the retrieved context with a LangChain chain
-        # Define the prompt template
-        system_prompt = textwrap.dedent("""
-            You are a helpful AI assistant. Your task is to answer the user's question based ONLY on the provided context.
-            Do not use any external knowledge.
-            If the context does not contain the answer, state that you cannot answer based on the provided information.
-        """)
-        
+def get_rag_chain(openai_api_key: str):
+    """Returns the shared prompt | llm | parser LCEL chain."""
+    def build_chain():
         prompt_template = ChatPromptTemplate.from_messages([
-            ("system", system_prompt),
+            ("system", SYSTEM_PROMPT),
             ("user", "Context:\n{context}\nQuestion: {question}")
         ])
+        llm = resource_registry.get_chat_model(CHAT_MODEL, openai_api_key, temperature=0.0)
+        return prompt_template | llm | StrOutputParser()
 
-        # Initialize the language model
-        llm = ChatOpenAI(
-            model="gpt-4",
-            temperature=0.0,
-            api_key=openai_api_key
-        )
+    key = ("rag_chain", CHAT_MODEL, resource_registry.fingerprint(openai_api_key))
+    return resource_registry.get_or_create(key, build_chain)
+
+def get_relevance_gate() -> relevance_gate.RelevanceGate:
+    """Returns the shared relevance gate, e.g. for its count of LLM calls avoided."""
+    return relevance_gate.get_shared_gate()
+
+def get_answer_cache(qdrant_url: str, qdrant_api_key: str, prefer_grpc: bool = False) -> answer_cache.SemanticAnswerCache:
+    """Returns the shared semantic answer cache for the medicaid collection."""
+    qdrant_client = resource_registry.get_qdrant_client(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+    return answer_cache.get_shared_cache(qdrant_client, COLLECTION_NAME)
+
+def source_url(file_name: str) -> str:
+    return f"{SOURCE_URL_PREFIX}{file_name}"
+
+def check_relevance(relevance, retrieved_docs: list, qdrant_url: str, qdrant_api_key: str,
+                    prefer_grpc: bool = False):
+    """
+    None if the question should go to the LLM; otherwise the relevance gate's canned response,
+    suggesting the retrieved documents.
+    """
+    provider = get_embedding_provider(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+    if relevance_gate.get_shared_gate().should_answer(relevance, provider.cache_key):
+        return None
+    return relevance_gate.early_exit_answer([source_url(doc.metadata.get('file_name', 'N/A')) for doc in retrieved_docs])
+
+def format_answer(answer: str, unique_urls: list) -> str:
+    """Appends the "Files Referred" block to an answer."""
+    return answer + "\n\n**Files Referred:**\n" + "\n".join([f"- {url}" for url in unique_urls])
+
+def build_context(retrieved_docs: list) -> tuple:
+    """Builds the prompt context and the sorted list of unique source URLs from retrieved documents."""
+    chunks = []
+    for doc in retrieved_docs:
+        # Chunks ingested with a precomputed prompt_text need no parsing here
+        page_content_text = doc.metadata.get('prompt_text')
+        if page_content_text is None:
+            soup = BeautifulSoup(doc.page_content, "html.parser")
+            page_content_text = soup.get_text(separator=" ", strip=True)
+        chunks.append({"text": page_content_text, "file_name": doc.metadata.get('file_name', 'N/A')})
+
+    # Deduplicate overlapping paragraphs and cap the context at the token budget
+    context_str, used_files = context_packer.build_prompt_context(chunks)
+    source_urls = [source_url(file_name) for file_name in used_files]
 
-        # Create the generation chain using LangChain Expression Language (LCEL)
-        rag_chain = prompt_template | llm | StrOutputParser()
+    unique_urls = sorted(list(set(source_urls)))
+    return context_str, unique_urls
+
+def warm_up(qdrant_url: str, qdrant_api_key: str, openai_api_key: str, prefer_grpc: bool = False) -> None:
+    """Builds the shared clients ahead of the first question."""
+    get_vector_store(qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc=prefer_grpc)
+    if RETRIEVAL_MODE == "hybrid":
+        get_hybrid_retriever(qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc=prefer_grpc)
+    get_rag_chain(openai_api_key)
+
+async def get_final_answer_async(user_question: str, qdrant_url: str, qdrant_api_key: str, openai_api_key: str,
+                                 **kwargs) -> str:
+    """
+    Asyncio variant of get_final_answer, retrieving with RETRIEVAL_MODE and VECTOR_BACKEND
+    (see rag_async.get_final_answer_async for options).
+    """
+    # Imported here because rag_async builds on the helpers in this module
+    import rag_async
+    return await rag_async.get_final_answer_async(user_question, qdrant_url, qdrant_api_key, openai_api_key,
+                                                  retrieval="langchain", **kwargs)
+
+# This function will be the main entry point for the Streamlit app
+@traceable(name="RAG Pipeline")
+def get_final_answer(user_question: str, qdrant_url: str, qdrant_api_key: str, openai_api_key: str,
+                     prefer_grpc: bool = False, use_answer_cache: bool = True) -> str:
+    """
+    Main function to execute the RAG process using LangChain and log with Langsmith.
+    """
+    try:
+        # 1. Get the shared LangChain components (built once per process)
+        vector_store = get_vector_store(qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc=prefer_grpc)
+
+        # Embed the question once; the vector serves both the answer cache and the search
+        query_vector = vector_store.embeddings.embed_query(user_question)
+
+        # Serve near-duplicate questions straight from the answer cache
+        cache = get_answer_cache(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc) if use_answer_cache else None
+        if cache is not None:
+            cached = cache.lookup(query_vector, user_question)
+            if cached is not None:
+                return format_answer(cached.answer, cached.source_urls)
+
+        # 2. Retrieve relevant documents from Qdrant (fused with BM25 matches in hybrid mode)
+        retrieved_docs, relevance = retrieve_documents_with_relevance(user_question, query_vector, qdrant_url,
+                                                                      qdrant_api_key, openai_api_key,
+                                                                      prefer_grpc=prefer_grpc)
+
+        if not retrieved_docs:
+            return "Could not find any relevant documents in the database to answer the question."
+
+        # Nothing close enough to answer from: suggest the nearest documents instead of calling gpt-4
+        early_exit = check_relevance(relevance, retrieved_docs, qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+        if early_exit is not None:
+            return early_exit
+
+        # 3. Prepare context and source URLs from retrieved documents
+        context_str, unique_urls = build_context(retrieved_docs)
+
+        # 4. Generate a complete answer using the retrieved context with the shared LangChain chain
+        rag_chain = get_rag_chain(openai_api_key)
         
         # Invoke the chain
         answer = rag_chain.invoke({"context": context_str, "question": user_question})
 
+        if cache is not None:
+            cache.store(user_question, query_vector, answer, unique_urls)
+
         # Append the unique URLs to the final answer
-        answer += "\n\n**Files Referred:**\n" + "\n".join([f"- {url}" for url in unique_urls])
-        
-        return answer
+        return format_answer(answer, unique_urls)
+
+    except Exception as e:
+        print(f"\nAn error occurred: {e}")
+        return f"An error occurred while processing your request: {e}"
+
+@traceable(name="RAG Pipeline (streaming)")
+def stream_final_answer(user_question: str, qdrant_url: str, qdrant_api_key: str, openai_api_key: str,
+                        prefer_grpc: bool = False, use_answer_cache: bool = True, timings: dict = None):
+    """
+    Streaming variant of get_final_answer: yields the answer token by token as gpt-4 produces it,
+    followed by the "Files Referred" block.
+    If a `timings` dict is passed it is filled with time_to_first_token and total_time (seconds).
+    """
+    if timings is None:
+        timings = {}
+    start = time.perf_counter()
+
+    def first_token_seen():
+        if "time_to_first_token" not in timings:
+            timings["time_to_first_token"] = time.perf_counter() - start
+
+    try:
+        vector_store = get_vector_store(qdrant_url, qdrant_api_key, openai_api_key, prefer_grpc=prefer_grpc)
+        query_vector = vector_store.embeddings.embed_query(user_question)
+
+        cache = get_answer_cache(qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc) if use_answer_cache else None
+        cached = cache.lookup(query_vector, user_question) if cache is not None else None
+        if cached is not None:
+            first_token_seen()
+            yield format_answer(cached.answer, cached.source_urls)
+            return
+
+        retrieved_docs, relevance = retrieve_documents_with_relevance(user_question, query_vector, qdrant_url,
+                                                                      qdrant_api_key, openai_api_key,
+                                                                      prefer_grpc=prefer_grpc)
+        if not retrieved_docs:
+            first_token_seen()
+            yield "Could not find any relevant documents in the database to answer the question."
+            return
+
+        early_exit = check_relevance(relevance, retrieved_docs, qdrant_url, qdrant_api_key, prefer_grpc=prefer_grpc)
+        if early_exit is not None:
+            first_token_seen()
+            yield early_exit
+            return
+
+        context_str, unique_urls = build_context(retrieved_docs)
+
+        # Stream the completion instead of waiting for the whole answer
+        answer_parts = []
+        for token in get_rag_chain(openai_api_key).stream({"context": context_str, "question": user_question}):
+            if not token:
+                continue
+            first_token_seen()
+            answer_parts.append(token)
+            yield token
+
+        answer = "".join(answer_parts)
+        if cache is not None:
+            cache.store(user_question, query_vector, answer, unique_urls)
+
+        # The "Files Referred" block goes out after the last answer token
+        yield format_answer("", unique_urls)
 
     except Exception as e:
         print(f"\nAn error occurred: {e}")
-        return f"An error occurred while processing your request: {e}"
\ No newline at end of file
+        first_token_seen()
+        yield f"An error occurred while processing your request: {e}"
+    finally:
+        timings["total_time"] = time.perf_counter() - start
+        if "time_to_first_token" in timings:
+            print(f"Streamed answer: first token after {timings['time_to_first_token']:.2f}s, "
+                  f"complete after {timings['total_time']:.2f}s")
\ No newline at end of file
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+# Relevance-threshold early exit.
+# Off-topic questions used to go to gpt-4 with the three least-bad chunks, only to come back
+# seconds later as "cannot answer based on the provided information". The handlers now compare
+# the question's relevance (the best dense similarity among the first-stage search hits, before
+# any reranking) with a threshold calibrated for the collection's embedding. Below it they
+# return a canned response suggesting the closest documents and never call the LLM.
+# Thresholds come from RELEVANCE_THRESHOLD, or per embedding from RELEVANCE_THRESHOLDS_PATH,
+# which the calibration CLI writes from a labeled question set:
+#   python relevance_gate.py labeled_questions.jsonl --max-false-refusals 0.02
+# (one {"question": "...", "answerable": true | false} per line). Without either, every
+# question goes to the LLM as before. The gate counts the LLM calls it avoided.
+
+# Set RELEVANCE_GATE=0 to always call the LLM
+RELEVANCE_GATE = os.getenv("RELEVANCE_GATE", "1") != "0"
+# One threshold for every embedding, overriding the calibrated ones
+RELEVANCE_THRESHOLD = os.getenv("RELEVANCE_THRESHOLD")
+RELEVANCE_THRESHOLDS_PATH = os.getenv("RELEVANCE_THRESHOLDS_PATH", "relevance_thresholds.json")
+# Documents suggested with the canned response
+RELEVANCE_SUGGESTIONS = int(os.getenv("RELEVANCE_SUGGESTIONS", "3"))
+
+EARLY_EXIT_MESSAGE = (
+    "I couldn't find anything in the Louisiana Medicaid eligibility policy documents that answers "
+    "this question closely enough, so no answer was generated. Try rephrasing the question, or look "
+    "through the documents closest to it."
+)
+
+
+def early_exit_answer(source_urls: List[str]) -> str:
+    """The canned response, with up to RELEVANCE_SUGGESTIONS distinct suggested documents."""
+    suggestions = list(dict.fromkeys(source_urls))[:RELEVANCE_SUGGESTIONS]
+    if not suggestions:
+        return EARLY_EXIT_MESSAGE
+    return EARLY_EXIT_MESSAGE + "\n\n**Suggested Documents:**\n" + "\n".join(f"- {url}" for url in suggestions)
+
+
+def relevance(search_results) -> Optional[float]:
+    """The best first-stage score among Qdrant search hits; None if there were none."""
+    return max((hit.score for hit in search_results), default=None)
+
+
+def load_thresholds(path: str = RELEVANCE_THRESHOLDS_PATH) -> Dict[str, Dict]:
+    """{embedding cache key: calibration record} from a thresholds file; empty if there is none."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not load relevance thresholds from '{path}': {e}")
+        return {}
+
+
+def save_threshold(embedding_key: str, record: Dict, path: str = RELEVANCE_THRESHOLDS_PATH) -> None:
+    """Stores one embedding's calibration record, keeping the others."""
+    thresholds = load_thresholds(path)
+    thresholds[embedding_key] = record
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(thresholds, f, indent=2)
+
+
+class RelevanceGate:
+    """Decides per question whether retrieval found enough to be worth an LLM call, and counts the calls avoided."""
+
+    def __init__(self, threshold: Optional[float] = None, thresholds_path: str = RELEVANCE_THRESHOLDS_PATH,
+                 enabled: bool = True):
+        self.threshold = threshold
+        self.thresholds_path = thresholds_path
+        self.enabled = enabled
+        self._thresholds: Dict[str, Dict] = {}
+        self._thresholds_mtime = None
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.llm_calls_avoided = 0
+
+    def threshold_for(self, embedding_key: str) -> Optional[float]:
+        """The fixed threshold, else the one calibrated for this embedding; None if neither is set."""
+        if self.threshold is not None:
+            return self.threshold
+        # Re-read the file when the calibration CLI rewrites it, so a running app picks it up
+        try:
+            mtime = os.path.getmtime(self.thresholds_path)
+        except OSError:
+            mtime = None
+        if mtime != self._thresholds_mtime:
+            self._thresholds = load_thresholds(self.thresholds_path) if mtime is not None else {}
+            self._thresholds_mtime = mtime
+        record = self._thresholds.get(embedding_key)
+        return record["threshold"] if record else None
+
+    def should_answer(self, relevance: Optional[float], embedding_key: str) -> bool:
+        """False when `relevance` is below the embedding's threshold, i.e. the LLM call should be skipped."""
+        threshold = self.threshold_for(embedding_key) if self.enabled else None
+        answer = threshold is None or relevance is None or relevance >= threshold
+        with self._lock:
+            self.checked += 1
+            if not answer:
+                self.llm_calls_avoided += 1
+        return answer
+
+    def stats(self) -> dict:
+        return {
+            "checked": self.checked,
+            "llm_calls_avoided": self.llm_calls_avoided,
+            "avoided_rate": self.llm_calls_avoided / self.checked if self.checked else 0.0,
+        }
+
+
+def get_shared_gate() -> RelevanceGate:
+    """Returns the process-wide gate the query handlers share."""
+    import resource_registry
+
+    return resource_registry.get_or_create(("relevance_gate",), lambda: RelevanceGate(
+        threshold=float(RELEVANCE_THRESHOLD) if RELEVANCE_THRESHOLD else None,
+        enabled=RELEVANCE_GATE,
+    ))
+
+
+# --- calibration ------------------------------------------------------------------------------
+
+def calibrate(scores: Sequence[float], answerable: Sequence[bool], max_false_refusals: float = 0.02,
+              curve_points: int = 10) -> Dict:
+    """
+    The highest threshold that refuses at most `max_false_refusals` of the answerable questions,
+    with what it does on this set: the share of answerable questions refused and of unanswerable
+    ones caught (LLM calls avoided), and the same for `curve_points` thresholds across the range.
+    """
+    positives = sorted(s for s, a in zip(scores, answerable) if a)
+    negatives = [s for s, a in zip(scores, answerable) if not a]
+    if not positives:
+        raise ValueError("Calibration needs at least one answerable question.")
+
+    def outcome(threshold: float) -> Dict:
+        return {
+            "threshold": threshold,
+            "false_refusals": round(sum(s < threshold for s in positives) / len(positives), 4),
+            "unanswerable_caught": round(sum(s < threshold for s in negatives) / len(negatives), 4)
+            if negatives else None,
+            "llm_calls_avoided": round(sum(s < threshold for s in scores) / len(scores), 4),
+        }
+
+    # Questions score below the threshold to be refused, so it sits on the first answerable score kept
+    allowed = int(max_false_refusals * len(positives))
+    result = outcome(positives[min(allowed, len(positives) - 1)])
+    low, high = min(scores), max(scores)
+    result["curve"] = [outcome(low + (high - low) * i / (curve_points - 1)) for i in range(curve_points)] \
+        if curve_points > 1 and high > low else []
+    return result
+
+
+def _read_labeled(path: str) -> List[Dict]:
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                questions.append({"question": record["question"], "answerable": bool(record["answerable"])})
+    return questions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Calibrate the relevance threshold on a JSONL file of {\"question\", \"answerable\"} records.")
+    parser.add_argument("input", help="labeled questions, one JSON object per line")
+    parser.add_argument("--max-false-refusals", type=float, default=0.02,
+                        help="share of answerable questions the threshold may refuse")
+    parser.add_argument("--output", default=RELEVANCE_THRESHOLDS_PATH, help="thresholds file to update")
+    parser.add_argument("--dry-run", action="store_true", help="print the calibration without saving it")
+    parser.add_argument("--prefer-grpc", action="store_true")
+    parser.add_argument("--qdrant-url", default=os.getenv("QDRANT_URL"))
+    parser.add_argument("--qdrant-api-key", default=os.getenv("QDRANT_API_KEY"))
+    parser.add_argument("--openai-api-key", default=os.getenv("OPENAI_API_KEY"))
+    args = parser.parse_args()
+
+    if not all([args.qdrant_url, args.openai_api_key]):
+        print("ERROR: Set QDRANT_URL, QDRANT_API_KEY and OPENAI_API_KEY (or pass them as options).")
+        return
+
+    # The handlers' own first stage, so calibrated scores are the ones the gate will see
+    import embedding_providers
+    import rag_handler
+    import resource_registry
+
+    openai_client = resource_registry.get_openai_client(args.openai_api_key)
+    qdrant_client = resource_registry.get_qdrant_client(args.qdrant_url, args.qdrant_api_key,
+                                                        prefer_grpc=args.prefer_grpc)
+    provider = embedding_providers.get_query_embedding(qdrant_client, rag_handler.COLLECTION_NAME)
+    labeled = _read_labeled(args.input)
+    scores = []
+    for item in labeled:
+        query_vector = rag_handler.embed_query(item["question"], openai_client, provider)
+        hits = rag_handler.perform_qdrant_search(item["question"], qdrant_client, openai_client,
+                                                 query_vector=query_vector, rerank=False)
+        score = relevance(hits)
+        # Nothing found at all counts as the lowest possible cosine similarity
+        scores.append(score if score is not None else -1.0)
+
+    result = calibrate(scores, [item["answerable"] for item in labeled], args.max_false_refusals)
+    record = {key: result[key] for key in ("threshold", "false_refusals", "unanswerable_caught", "llm_calls_avoided")}
+    record.update(questions=len(labeled), max_false_refusals=args.max_false_refusals,
+                  collection=rag_handler.COLLECTION_NAME, calibrated_at=time.strftime("%Y-%m-%dT%H:%M:%S%z"))
+    print(json.dumps({"embedding": provider.cache_key, **record, "curve": result["curve"]}, indent=2))
+    if not args.dry_run:
+        save_threshold(provider.cache_key, record, args.output)
+        print(f"Saved the threshold for {provider.cache_key} to '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
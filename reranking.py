@@ -0,0 +1,313 @@
+import math
+import os
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from hybrid_search import tokenize
+from search_filters import detect_document_codes, document_code
+
+# Two-stage retrieval.
+# The handlers used to send the top 3 search hits to gpt-4 however weak or repetitive they were:
+# three slices of one section, or a third chunk far below the first two. With a RERANKER set,
+# they over-fetch RERANK_FETCH_K candidates from the cheap first stage (Qdrant, or the hybrid
+# retriever), then on the CPU:
+#   1. rescore every candidate against the question with the reranker
+#        lexical        IDF-weighted term coverage, BM25 over the candidates, question bigrams,
+#                       section-header matches and document codes, blended with the first-stage score
+#        cross-encoder  a small sentence-transformers cross-encoder reading (question, chunk) pairs,
+#                       blended with the lexical features (`pip install sentence-transformers`)
+#   2. keep the k best up to the first drop of RERANK_SCORE_GAP or more in reranked score, between
+#      RERANK_MIN_K and RERANK_MAX_K, so a clear winner goes out alone
+#   3. pick those k by maximal marginal relevance, so near-duplicate chunks and further slices of
+#      an already chosen section give way to the next best distinct one
+# Fewer, better chunks mean fewer prompt tokens per answer. Rerankers are pluggable: anything
+# with a score(query, candidates) -> scores method can be registered in RERANKERS.
+# benchmarks/bench_reranking.py measures precision, tokens sent and rerank latency.
+
+# "none" keeps single-stage retrieval of the top RERANK_MAX_K hits
+RERANKER = os.getenv("RERANKER", "none")
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "30"))
+RERANK_MIN_K = int(os.getenv("RERANK_MIN_K", "1"))
+# The most chunks sent to the LLM, reranked or not
+RERANK_MAX_K = int(os.getenv("RERANK_MAX_K", "3"))
+RERANK_SCORE_GAP = float(os.getenv("RERANK_SCORE_GAP", "0.15"))
+# 1.0 ranks by relevance alone; lower values trade relevance for diversity
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+CROSS_ENCODER_MODEL = os.getenv("CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+# Similarity MMR assumes between two chunks of the same file and section, whatever their words
+SAME_SECTION_SIMILARITY = 0.9
+
+# Words that say nothing about which chunk answers the question
+_STOPWORDS = frozenset("""
+    a about an and are as at be by can could do does did for from has have how i if in into is it
+    its me my of on or our should tell than that the their them there these they this to was we
+    what when where which who why will with would you your
+""".split())
+
+
+@dataclass
+class Candidate:
+    """One first-stage hit: its text and metadata for the reranker, and the handler's own object."""
+    text: str
+    metadata: Dict
+    # First-stage score: cosine similarity, or the RRF score in hybrid mode
+    score: float
+    item: object
+    rerank_score: float = 0.0
+    _terms: Optional[Counter] = field(default=None, repr=False)
+
+    @property
+    def terms(self) -> Counter:
+        if self._terms is None:
+            self._terms = Counter(t for t in tokenize(self.text) if t not in _STOPWORDS)
+        return self._terms
+
+
+def candidates_from_points(points) -> List[Candidate]:
+    """Candidates from Qdrant ScoredPoints with LangChain-style payloads."""
+    candidates = []
+    for point in points:
+        payload = point.payload or {}
+        metadata = payload.get("metadata") or {}
+        text = metadata.get("prompt_text") or payload.get("page_content", "")
+        candidates.append(Candidate(text, metadata, point.score, point))
+    return candidates
+
+
+def candidates_from_documents(scored_documents) -> List[Candidate]:
+    """Candidates from (LangChain Document, score) pairs."""
+    return [Candidate(doc.metadata.get("prompt_text") or doc.page_content, doc.metadata, score, doc)
+            for doc, score in scored_documents]
+
+
+def query_terms(query: str) -> List[str]:
+    return [t for t in dict.fromkeys(tokenize(query)) if t not in _STOPWORDS]
+
+
+def _min_max(values: Sequence[float]) -> List[float]:
+    low, high = min(values), max(values)
+    if high - low < 1e-12:
+        return [1.0] * len(values)
+    return [(v - low) / (high - low) for v in values]
+
+
+class LexicalReranker:
+    """
+    Scores candidates with lexical features of the question and chunk, computed over the candidate
+    set alone (no corpus statistics needed), blended with the first-stage score. Scores are in [0, 1].
+    """
+
+    DEFAULT_WEIGHTS = {
+        "first_stage": 0.35,
+        "bm25": 0.2,
+        "coverage": 0.2,
+        "bigrams": 0.1,
+        "header": 0.1,
+        "code": 0.05,
+    }
+
+    def __init__(self, weights: Dict[str, float] = None, k1: float = 1.2, b: float = 0.75):
+        self.weights = dict(weights or self.DEFAULT_WEIGHTS)
+        self.k1 = k1
+        self.b = b
+
+    def features(self, query: str, candidates: List[Candidate]) -> List[Dict[str, float]]:
+        """Per-candidate feature values, each in [0, 1]."""
+        terms = query_terms(query)
+        n = len(candidates)
+        document_frequency = Counter(t for c in candidates for t in set(c.terms) if t in terms)
+        idf = {t: math.log(1 + (n - document_frequency[t] + 0.5) / (document_frequency[t] + 0.5)) for t in terms}
+        total_idf = sum(idf.values()) or 1.0
+        lengths = [sum(c.terms.values()) for c in candidates]
+        average_length = (sum(lengths) / n) or 1.0
+        bigrams = set(zip(terms, terms[1:]))
+        codes = set(detect_document_codes(query))
+
+        rows, bm25 = [], []
+        for candidate, length in zip(candidates, lengths):
+            score = 0.0
+            for t in terms:
+                tf = candidate.terms.get(t, 0)
+                if tf:
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    score += idf[t] * tf * (self.k1 + 1) / (tf + norm)
+            bm25.append(score)
+
+            tokens = [t for t in tokenize(candidate.text) if t not in _STOPWORDS]
+            header_terms = {t for h in candidate.metadata.get("section_headers") or () for t in tokenize(h)}
+            candidate_codes = {candidate.metadata.get("document_code")
+                               or document_code(candidate.metadata.get("file_name", ""))}
+            rows.append({
+                "coverage": sum(idf[t] for t in terms if t in candidate.terms) / total_idf,
+                "bigrams": len(bigrams & set(zip(tokens, tokens[1:]))) / len(bigrams) if bigrams else 0.0,
+                "header": sum(idf[t] for t in terms if t in header_terms) / total_idf,
+                "code": 1.0 if codes & candidate_codes else 0.0,
+            })
+        best_bm25 = max(bm25) or 1.0
+        for row, first_stage, lexical in zip(rows, _min_max([c.score for c in candidates]), bm25):
+            row["first_stage"] = first_stage
+            row["bm25"] = lexical / best_bm25
+        return rows
+
+    def score(self, query: str, candidates: List[Candidate]) -> List[float]:
+        if not candidates:
+            return []
+        total = sum(self.weights.values()) or 1.0
+        return [sum(self.weights.get(name, 0.0) * value for name, value in row.items()) / total
+                for row in self.features(query, candidates)]
+
+
+_cross_encoder_lock = threading.Lock()
+
+
+def _cross_encoder(model: str):
+    import resource_registry
+
+    def build():
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            raise ImportError("The cross-encoder reranker needs sentence-transformers: "
+                              "`pip install sentence-transformers`") from None
+        return CrossEncoder(model, device="cpu")
+
+    return resource_registry.get_or_create(("cross_encoder", model), build)
+
+
+class CrossEncoderReranker:
+    """A small cross-encoder's relevance (sigmoid of its logit), blended with LexicalReranker's score."""
+
+    def __init__(self, model: str = CROSS_ENCODER_MODEL, lexical_weight: float = 0.3, max_chars: int = 2000):
+        self.model = model
+        self.lexical_weight = lexical_weight
+        # Cross-encoders read a few hundred tokens at most; the rest of a long chunk is cut anyway
+        self.max_chars = max_chars
+        self.lexical = LexicalReranker()
+
+    def score(self, query: str, candidates: List[Candidate]) -> List[float]:
+        if not candidates:
+            return []
+        model = _cross_encoder(self.model)
+        # One predict at a time; the model already uses every core
+        with _cross_encoder_lock:
+            logits = model.predict([(query, c.text[:self.max_chars]) for c in candidates])
+        lexical = self.lexical.score(query, candidates)
+        return [(1 - self.lexical_weight) / (1 + math.exp(-float(logit))) + self.lexical_weight * score
+                for logit, score in zip(logits, lexical)]
+
+
+RERANKERS = {
+    "lexical": LexicalReranker(),
+    "cross-encoder": CrossEncoderReranker(),
+}
+
+
+def get_reranker(name: str = None):
+    """The reranker registered under `name` (RERANKER if not given); None for "none"."""
+    name = name or RERANKER
+    if name == "none":
+        return None
+    try:
+        return RERANKERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown reranker: '{name}'. Use one of: none, {', '.join(RERANKERS)}.") from None
+
+
+def fetch_limit(reranker) -> int:
+    """How many hits the first stage should return."""
+    return max(RERANK_FETCH_K, RERANK_MAX_K) if reranker is not None else RERANK_MAX_K
+
+
+def adaptive_k(scores: Sequence[float], min_k: int = RERANK_MIN_K, max_k: int = RERANK_MAX_K,
+               min_gap: float = RERANK_SCORE_GAP) -> int:
+    """
+    Number of best-first `scores` to keep: up to the first drop of at least `min_gap` between
+    neighbours, never fewer than min_k nor more than max_k.
+    """
+    max_k = min(max_k, len(scores))
+    for k in range(max(min_k, 1), max_k):
+        if scores[k - 1] - scores[k] >= min_gap:
+            return k
+    return max_k
+
+
+def _term_weights(candidates: List[Candidate]) -> List[Dict[str, float]]:
+    """Term counts times IDF over the candidates, so words every candidate shares don't make them look alike."""
+    n = len(candidates)
+    document_frequency = Counter(t for c in candidates for t in c.terms)
+    idf = {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in document_frequency.items()}
+    weights = []
+    for candidate in candidates:
+        vector = {t: count * idf[t] for t, count in candidate.terms.items()}
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        weights.append({t: v / norm for t, v in vector.items()})
+    return weights
+
+
+def _similarity(a: Candidate, b: Candidate, a_weights: Dict[str, float], b_weights: Dict[str, float]) -> float:
+    """IDF-weighted cosine of the terms, raised to SAME_SECTION_SIMILARITY for two slices of one section."""
+    if a.metadata.get("file_name") == b.metadata.get("file_name") \
+            and set(a.metadata.get("sections") or ()) & set(b.metadata.get("sections") or ()):
+        return SAME_SECTION_SIMILARITY
+    if len(b_weights) < len(a_weights):
+        a_weights, b_weights = b_weights, a_weights
+    return sum(v * b_weights.get(t, 0.0) for t, v in a_weights.items())
+
+
+def mmr_select(candidates: List[Candidate], k: int, mmr_lambda: float = MMR_LAMBDA) -> List[Candidate]:
+    """
+    Greedy maximal marginal relevance over candidates sorted best first by rerank_score:
+    each pick maximizes lambda * relevance - (1 - lambda) * (similarity to the closest pick so far).
+    """
+    if k <= 0 or not candidates:
+        return []
+    if k == 1 or mmr_lambda >= 1.0:
+        return candidates[:k]
+    relevance = _min_max([c.rerank_score for c in candidates])
+    weights = _term_weights(candidates)
+    chosen = [0]
+    closest = [0.0] * len(candidates)
+    while len(chosen) < min(k, len(candidates)):
+        last = chosen[-1]
+        best, best_value = None, -math.inf
+        for i, candidate in enumerate(candidates):
+            if i in chosen:
+                continue
+            closest[i] = max(closest[i], _similarity(candidate, candidates[last], weights[i], weights[last]))
+            value = mmr_lambda * relevance[i] - (1 - mmr_lambda) * closest[i]
+            if value > best_value:
+                best, best_value = i, value
+        chosen.append(best)
+    return [candidates[i] for i in chosen]
+
+
+def rerank(query: str, candidates: List[Candidate], reranker=None, min_k: int = RERANK_MIN_K,
+           max_k: int = RERANK_MAX_K, min_gap: float = RERANK_SCORE_GAP,
+           mmr_lambda: float = MMR_LAMBDA) -> List[Candidate]:
+    """
+    Rescores `candidates` with `reranker` (RERANKER, or lexical if that is "none"), then returns
+    the adaptive-k MMR selection, best first.
+    """
+    reranker = reranker or get_reranker() or RERANKERS["lexical"]
+    if not candidates:
+        return []
+    for candidate, score in zip(candidates, reranker.score(query, candidates)):
+        candidate.rerank_score = score
+    ranked = sorted(candidates, key=lambda c: c.rerank_score, reverse=True)
+    k = adaptive_k([c.rerank_score for c in ranked], min_k, max_k, min_gap)
+    # MMR may swap a pick for a more distinct candidate, but not one scored a whole gap below the cut
+    floor = ranked[k - 1].rerank_score - min_gap
+    return mmr_select([c for c in ranked if c.rerank_score >= floor], k, mmr_lambda)
+
+
+def rerank_points(query: str, points, reranker=None, **kwargs) -> list:
+    """rerank() over Qdrant ScoredPoints; returns the selected points, best first."""
+    return [c.item for c in rerank(query, candidates_from_points(points), reranker, **kwargs)]
+
+
+def rerank_documents(query: str, scored_documents: List[Tuple], reranker=None, **kwargs) -> list:
+    """rerank() over (Document, score) pairs; returns the selected Documents, best first."""
+    return [c.item for c in rerank(query, candidates_from_documents(scored_documents), reranker, **kwargs)]
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import threading
+import weakref
+from typing import Callable, Dict, Hashable
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from openai import AsyncOpenAI, OpenAI
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+# Process-wide registry of long-lived API clients.
+# Building a QdrantClient / OpenAI client per question means a fresh connection pool
+# (and TLS handshake) on every click of "Get Answer". Clients handed out here are
+# created once per (url, credentials, model) key and shared by every caller in the
+# process, including all Streamlit sessions, since Streamlit imports modules only once.
+# The OpenAI, httpx and Qdrant clients are all safe to share between threads; the requests
+# session is only used for plain GETs, which don't touch its shared cookie or header state.
+
+# Keep-alive pool shared by every OpenAI-backed client
+MAX_CONNECTIONS = 50
+MAX_KEEPALIVE_CONNECTIONS = 20
+KEEPALIVE_EXPIRY_SECONDS = 120.0
+HTTP_TIMEOUT_SECONDS = 60.0
+
+# Re-entrant so factories can pull other shared clients out of the registry
+_lock = threading.RLock()
+_resources: Dict[Hashable, object] = {}
+# Async clients per event loop, keyed on the loop object itself: a closed loop's id can be reused
+# by a new loop, which must not be handed clients bound to the dead one
+_loop_resources: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, object]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def fingerprint(secret: str) -> str:
+    """Hashes a credential so raw API keys are never used as registry keys."""
+    if not secret:
+        return ""
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:16]
+
+
+def get_or_create(key: Hashable, factory: Callable[[], object]) -> object:
+    """Returns the resource stored under `key`, building it with `factory` on first use."""
+    resource = _resources.get(key)
+    if resource is None:
+        with _lock:
+            # Another thread may have built it while we were waiting for the lock
+            resource = _resources.get(key)
+            if resource is None:
+                resource = factory()
+                _resources[key] = resource
+    return resource
+
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """Returns the pooled keep-alive httpx client used for all OpenAI traffic."""
+    return get_or_create(("httpx",), lambda: httpx.Client(limits=_http_limits(), timeout=HTTP_TIMEOUT_SECONDS))
+
+
+def get_requests_session() -> requests.Session:
+    """Returns the pooled keep-alive requests session used to download source PDFs."""
+    def build() -> requests.Session:
+        session = requests.Session()
+        # One pool per host, big enough for every download thread to hold a connection open
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_KEEPALIVE_CONNECTIONS)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    return get_or_create(("requests",), build)
+
+
+def get_openai_client(api_key: str, base_url: str = None) -> OpenAI:
+    """Returns a shared OpenAI client for the given credentials."""
+    key = ("openai", base_url, fingerprint(api_key))
+    return get_or_create(key, lambda: OpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=get_http_client(),
+    ))
+
+
+def get_qdrant_client(url: str, api_key: str, prefer_grpc: bool = False) -> QdrantClient:
+    """
+    Returns a shared QdrantClient. With prefer_grpc the client talks to Qdrant over one gRPC channel.
+    The url ":memory:" gives an in-process local-mode client (no server), as used by the benchmarks;
+    being shared, whatever is loaded into it is what the query handlers search.
+    """
+    key = ("qdrant", url, fingerprint(api_key), prefer_grpc)
+    if url == ":memory:":
+        return get_or_create(key, lambda: QdrantClient(location=":memory:"))
+    return get_or_create(key, lambda: QdrantClient(
+        url=url,
+        api_key=api_key,
+        prefer_grpc=prefer_grpc,
+    ))
+
+
+def get_embeddings(model: str, api_key: str, base_url: str = None, dimensions: int = None):
+    """
+    Returns a shared LangChain OpenAIEmbeddings for the given model and credentials.
+    `dimensions` asks a text-embedding-3 model for shortened vectors.
+    """
+    from langchain_openai import OpenAIEmbeddings
+
+    key = ("embeddings", model, dimensions, base_url, fingerprint(api_key))
+    return get_or_create(key, lambda: OpenAIEmbeddings(
+        model=model,
+        dimensions=dimensions,
+        api_key=api_key,
+        base_url=base_url,
+        http_client=get_http_client(),
+        # Questions are far below the model's context limit, so skip the local tiktoken pass
+        check_embedding_ctx_length=False,
+    ))
+
+
+def get_chat_model(model: str, api_key: str, temperature: float = 0.0, base_url: str = None):
+    """Returns a shared LangChain ChatOpenAI for the given model and credentials."""
+    from langchain_openai import ChatOpenAI
+
+    key = ("chat", model, temperature, base_url, fingerprint(api_key))
+    return get_or_create(key, lambda: ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        api_key=api_key,
+        base_url=base_url,
+        http_client=get_http_client(),
+    ))
+
+
+# Async clients hold connections bound to the event loop that opened them, so they are
+# shared per (credentials, running loop) rather than process-wide, and closed when the loop
+# shuts down: asyncio.run() ends with loop.shutdown_asyncgens(), which closes the suspended
+# async generator registered for each loop, from inside that loop. Loops closed without that
+# step have their clients dropped the next time an async client is requested.
+
+async def _close_at_shutdown(resources: Dict[Hashable, object]):
+    try:
+        yield
+    finally:
+        await _aclose_all(resources)
+
+
+async def _aclose_all(resources: Dict[Hashable, object]) -> None:
+    with _lock:
+        clients = [r for key, r in resources.items() if key != "_closer"]
+        resources.clear()
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"Could not close {type(client).__name__}: {e}")
+
+
+def _get_or_create_for_loop(key: Hashable, factory: Callable[[], object]) -> object:
+    """get_or_create() for clients bound to the running event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        for closed in [other for other in _loop_resources if other.is_closed()]:
+            del _loop_resources[closed]
+        resources = _loop_resources.setdefault(loop, {})
+        if "_closer" not in resources:
+            # Kept here because the loop only holds its async generators weakly; asend() registers
+            # it with the loop and the task runs it up to its yield
+            resources["_closer"] = closer = _close_at_shutdown(resources)
+            asyncio.ensure_future(closer.asend(None))
+        resource = resources.get(key)
+        if resource is None:
+            resource = resources[key] = factory()
+    return resource
+
+
+def get_async_openai_client(api_key: str, base_url: str = None) -> AsyncOpenAI:
+    """Returns a shared AsyncOpenAI client for the given credentials and the running event loop."""
+    key = ("async_openai", base_url, fingerprint(api_key))
+    return _get_or_create_for_loop(key, lambda: AsyncOpenAI(
+        api_key=api_key,
+        base_url=base_url,
+        http_client=httpx.AsyncClient(limits=_http_limits(), timeout=HTTP_TIMEOUT_SECONDS),
+    ))
+
+
+def get_async_qdrant_client(url: str, api_key: str, prefer_grpc: bool = False) -> AsyncQdrantClient:
+    """Returns a shared AsyncQdrantClient for the given credentials and the running event loop."""
+    key = ("async_qdrant", url, fingerprint(api_key), prefer_grpc)
+    return _get_or_create_for_loop(key, lambda: AsyncQdrantClient(
+        url=url,
+        api_key=api_key,
+        prefer_grpc=prefer_grpc,
+    ))
+
+
+def _detach_all() -> tuple:
+    """Empties the registry and closes the sync clients; returns each event loop's async clients, still open."""
+    with _lock:
+        resources = list(_resources.values())
+        _resources.clear()
+        loop_clients = {}
+        for loop, loop_resources in list(_loop_resources.items()):
+            loop_clients[loop] = {key: r for key, r in loop_resources.items() if key != "_closer"}
+            loop_resources.clear()
+        _loop_resources.clear()
+    for resource in resources:
+        close = getattr(resource, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                print(f"Could not close {type(resource).__name__}: {e}")
+    return loop_clients
+
+
+def _close_on_loop(loop: asyncio.AbstractEventLoop, clients: Dict[Hashable, object]) -> None:
+    """Closes async clients on the loop they belong to, without waiting if that loop is running."""
+    if not clients or loop.is_closed():
+        # A closed loop's connections went with it
+        return
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(_aclose_all(clients), loop)
+    else:
+        loop.run_until_complete(_aclose_all(clients))
+
+
+def clear() -> None:
+    """
+    Closes and forgets every registered client (used by benchmarks and after credential rotation).
+    Async clients are closed on their own event loop; on a loop that is running (including the
+    caller's), that happens once the loop next gets control. Use aclear() to wait for it.
+    """
+    for loop, clients in _detach_all().items():
+        _close_on_loop(loop, clients)
+
+
+async def aclear() -> None:
+    """clear() from a coroutine, returning once the running loop's async clients are closed."""
+    running = asyncio.get_running_loop()
+    for loop, clients in _detach_all().items():
+        if loop is running:
+            await _aclose_all(clients)
+        else:
+            _close_on_loop(loop, clients)
@@ -0,0 +1,113 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from qdrant_client.models import DatetimeRange, FieldCondition, Filter, MatchAny, PayloadSchemaType
+
+# Structured chunk metadata and filtered search.
+# PDFChunkerForQdrant stores, next to file_name, what each chunk covers:
+#   document_code   the manual document, e.g. "I-1630" for I-1630.pdf
+#   chapter         the manual chapter prefix, e.g. "I"
+#   sections        codes of the sections in the chunk, e.g. ["I-1630.1", "I-1630.2"]
+#   section_headers their header lines, as the header_pattern regex found them
+#   pages           1-based page numbers
+#   document_date   the PDF's modification (or creation) date, "YYYY-MM-DD", or the server's Last-Modified
+# The collection gets a payload index on each of these, so a filtered search only visits the
+# matching points instead of scanning the whole collection. The handlers filter automatically when
+# a question names a document ("what does I-1630 say about...") and fall back to an unfiltered
+# search if the filter matches nothing.
+
+# Set SEARCH_AUTO_FILTER=0 to never restrict searches by the codes a question mentions
+SEARCH_AUTO_FILTER = os.getenv("SEARCH_AUTO_FILTER", "1") == "1"
+
+PAYLOAD_INDEXES = {
+    "metadata.file_name": PayloadSchemaType.KEYWORD,
+    "metadata.document_code": PayloadSchemaType.KEYWORD,
+    "metadata.chapter": PayloadSchemaType.KEYWORD,
+    "metadata.sections": PayloadSchemaType.KEYWORD,
+    "metadata.pages": PayloadSchemaType.INTEGER,
+    "metadata.document_date": PayloadSchemaType.DATETIME,
+}
+
+# "I-1630", "i-1630", "I-1630.1"; the section part is dropped for document codes
+_CODE_PATTERN = re.compile(r"\b([A-Za-z]{1,2})-(\d{3,5})((?:\.\d+)*)\b")
+
+
+def document_code(file_name: str) -> Optional[str]:
+    """'I-1630' for 'I-1630.pdf' or 'I-1630 Appendix.pdf'; None if the name doesn't start with a code."""
+    match = _CODE_PATTERN.match(os.path.basename(file_name))
+    return f"{match.group(1).upper()}-{match.group(2)}" if match else None
+
+
+def section_code(header: str) -> Optional[str]:
+    """'I-1630.1' for a header line like '**I-1630.1 Qualified Medicare Beneficiary**'."""
+    match = _CODE_PATTERN.search(header)
+    return f"{match.group(1).upper()}-{match.group(2)}{match.group(3)}" if match else None
+
+
+def detect_document_codes(question: str) -> List[str]:
+    """Document codes a question names, in order of appearance, without repeats."""
+    return list(dict.fromkeys(f"{m.group(1).upper()}-{m.group(2)}" for m in _CODE_PATTERN.finditer(question)))
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    """Restricts a search to chunks matching every field that is set."""
+    document_codes: Tuple[str, ...] = ()
+    chapters: Tuple[str, ...] = ()
+    sections: Tuple[str, ...] = ()
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
+
+    def to_qdrant(self) -> Filter:
+        must = []
+        if self.document_codes:
+            # Chunks ingested before document_code existed are still found by their file name
+            must.append(Filter(should=[
+                FieldCondition(key="metadata.document_code", match=MatchAny(any=list(self.document_codes))),
+                FieldCondition(key="metadata.file_name", match=MatchAny(any=[f"{c}.pdf" for c in self.document_codes])),
+            ]))
+        if self.chapters:
+            must.append(FieldCondition(key="metadata.chapter", match=MatchAny(any=list(self.chapters))))
+        if self.sections:
+            must.append(FieldCondition(key="metadata.sections", match=MatchAny(any=list(self.sections))))
+        if self.date_from or self.date_to:
+            must.append(FieldCondition(key="metadata.document_date",
+                                       range=DatetimeRange(gte=self.date_from, lte=self.date_to)))
+        return Filter(must=must)
+
+    def matches(self, metadata: Dict) -> bool:
+        """The same test in Python, for chunks searched outside Qdrant (the BM25 index)."""
+        if self.document_codes:
+            code = metadata.get("document_code") or document_code(metadata.get("file_name", ""))
+            if code not in self.document_codes:
+                return False
+        if self.chapters and metadata.get("chapter") not in self.chapters:
+            return False
+        if self.sections and not set(self.sections) & set(metadata.get("sections") or ()):
+            return False
+        date = metadata.get("document_date")
+        if (self.date_from or self.date_to) and not date:
+            return False
+        if self.date_from and date < self.date_from[:10]:
+            return False
+        if self.date_to and date > self.date_to[:10]:
+            return False
+        return True
+
+
+def filter_for_question(question: str) -> Optional[SearchFilter]:
+    """A filter on the documents the question names, or None (search everything)."""
+    if not SEARCH_AUTO_FILTER:
+        return None
+    codes = detect_document_codes(question)
+    return SearchFilter(document_codes=tuple(codes)) if codes else None
+
+
+def create_payload_indexes(qdrant_client, collection_name: str) -> None:
+    """Indexes the structured metadata fields; existing indexes are left as they are."""
+    existing = qdrant_client.get_collection(collection_name).payload_schema or {}
+    for field_name, schema in PAYLOAD_INDEXES.items():
+        if field_name not in existing:
+            qdrant_client.create_payload_index(collection_name, field_name=field_name, field_schema=schema)
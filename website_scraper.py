@@ -4,10 +4,6 @@
 # In[1]:
 
 
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 from urllib.request import Request, urlopen
 import ssl
 from io import StringIO
@@ -16,6 +12,17 @@ from io import StringIO, BytesIO
 from langchain_pymupdf4llm import PyMuPDF4LLMLoader
 import pdf_chunker
 from collections import defaultdict
+from pdf_discovery import PdfCrawler, PDF_SELENIUM_FALLBACK
+
+# Selenium (and a Chrome install) is only needed for the opt-in browser fallback, so it is
+# imported on first use rather than here; plain HTTP discovery runs in containers without a browser.
+def _selenium():
+    """The selenium pieces renderWithSelenium uses: (webdriver, By, WebDriverWait, expected_conditions)."""
+    from selenium import webdriver
+    from selenium.webdriver.common.by import By
+    from selenium.webdriver.support.ui import WebDriverWait
+    from selenium.webdriver.support import expected_conditions as EC
+    return webdriver, By, WebDriverWait, EC
 
 
 # In[2]:
@@ -24,48 +31,51 @@ from collections import defaultdict
 class webScraper:
     def __init__(self, name):
             self.name = name
-
-    def getWebsitePdfUrls(self,chunker) -> list[str]:
+            # Stats of the last getPdfUrls crawl; pages_failed > 0 means the PDF list may be incomplete
+            self.crawl_stats = {}
+
+    def getPdfUrls(self, use_browser_fallback: bool = PDF_SELENIUM_FALLBACK) -> list[str]:
+        # Crawls the seed pages (PDF_SEED_URLS, by default the LDH manual index) over plain HTTP.
+        # With use_browser_fallback, a seed page whose HTML has no PDF links is rendered in Chrome.
+        crawler = PdfCrawler(render=self.renderWithSelenium if use_browser_fallback else None)
+        pdf_urls = crawler.crawl()
+        self.crawl_stats = crawler.stats
+        print("Discovery stats:", crawler.stats)
+        return pdf_urls
+
+    def renderWithSelenium(self, url: str) -> str:
+        webdriver, By, WebDriverWait, EC = _selenium()
         driver = webdriver.Chrome()
-        # Wait for an element to be present
-        assert "No results found." not in driver.page_source
-        #driver.implicitly_wait(10)
-
-        driver.get('https://ldh.la.gov/page/1681')
         try:
-            elements = WebDriverWait(driver, 100).until(
-            EC.presence_of_element_located((By.TAG_NAME, "ul"))
-            )
-            #for listobj in elements:
-            print("Wait finished, reading URLs now")
-            pdf_links = driver.find_elements(By.XPATH, "//a[contains(@href, '.pdf')]")
-
-            print("Read no. of links=",len(pdf_links))
-            pdf_urls = []
-            for pdf_link in pdf_links:
-                pdf_urls.append(pdf_link.get_attribute("href"))
-                print("Reading from URL = ",pdf_link.get_attribute("href"))
-            #pdf_urls = ["https://ldh.la.gov/assets/medicaid/MedicaidEligibilityPolicy/I-1630.pdf"]
-            all_final_documents = chunker.process_pdfs(pdf_urls)
-
-            if all_final_documents:
-                print("\n\n--- Example of Final Documents ---")
-                docs_by_file = defaultdict(list)
-                for doc in all_final_documents:
-                    docs_by_file[doc.metadata['file_name']].append(doc)
-
-                for file_name, docs in docs_by_file.items():
-                    print(f"\n--- Results for: '{file_name}' ({len(docs)} documents) ---")
-                    # Show the metadata header from the first document's content
-                    header = "\n".join(docs[0].page_content.split('\n')[:3])
-                    print("Header from first document's content:")
-                    print(header)
-                    print("-" * 20)
-
-            return all_final_documents
+            driver.get(url)
+            WebDriverWait(driver, 100).until(EC.presence_of_element_located((By.TAG_NAME, "ul")))
+            return driver.page_source
         finally:
             driver.quit()
-            print("Scraping from URLs is complete")
+
+    def getPdfUrlsWithSelenium(self) -> list[str]:
+        # Kept for existing callers: the HTTP crawl, rendering in Chrome any seed page without PDF links
+        return self.getPdfUrls(use_browser_fallback=True)
+
+    def getWebsitePdfUrls(self,chunker) -> list[str]:
+        pdf_urls = self.getPdfUrls()
+        all_final_documents = chunker.process_pdfs(pdf_urls)
+
+        if all_final_documents:
+            print("\n\n--- Example of Final Documents ---")
+            docs_by_file = defaultdict(list)
+            for doc in all_final_documents:
+                docs_by_file[doc.metadata['file_name']].append(doc)
+
+            for file_name, docs in docs_by_file.items():
+                print(f"\n--- Results for: '{file_name}' ({len(docs)} documents) ---")
+                # Show the metadata header from the first document's content
+                header = "\n".join(docs[0].page_content.split('\n')[:3])
+                print("Header from first document's content:")
+                print(header)
+                print("-" * 20)
+
+        return all_final_documents
 
 
 # In[3]: